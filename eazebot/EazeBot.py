@@ -34,6 +34,8 @@ import base64
 from copy import deepcopy
 from shutil import copy2
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
 import os
 from telegram import (ReplyKeyboardMarkup,InlineKeyboardMarkup,InlineKeyboardButton,bot)
 from telegram.ext import (Updater, CommandHandler, MessageHandler, Filters, RegexHandler,
@@ -42,8 +44,28 @@ from telegram.error import BadRequest
 
 if __name__ == '__main__' or os.path.isfile('tradeHandler.py'):
     from tradeHandler import tradeHandler
+    from marketData import (marketDataHub,marketsCache)
+    from retryPolicy import (retryPolicy,circuitBreaker)
+    from requestScheduler import requestScheduler
+    from priceFeed import (pollingFeed,stopAllFeeds)
+    from balanceLedger import balanceLedger
+    from pollScheduler import pollScheduler
+    from candleEngine import candleEngine
+    from metrics import (attempt,instrumentBot,timedJob,startMetricsServer,stopMetricsServer)
+    import tracing
+    import profiling
 else:
     from eazebot.tradeHandler import tradeHandler
+    from eazebot.marketData import (marketDataHub,marketsCache)
+    from eazebot.retryPolicy import (retryPolicy,circuitBreaker)
+    from eazebot.requestScheduler import requestScheduler
+    from eazebot.priceFeed import (pollingFeed,stopAllFeeds)
+    from eazebot.balanceLedger import balanceLedger
+    from eazebot.pollScheduler import pollScheduler
+    from eazebot.candleEngine import candleEngine
+    from eazebot.metrics import (attempt,instrumentBot,timedJob,startMetricsServer,stopMetricsServer)
+    from eazebot import tracing
+    from eazebot import profiling
 
 logFileName = 'telegramEazeBot'
 MAINMENU,SETTINGS,SYMBOL,NUMBER,TIMING,INFO = range(6)
@@ -75,8 +97,18 @@ markupTradeSetMenu = ReplyKeyboardMarkup(tradeSetMenu,one_time_keyboard=True)
 #%% init base variables
 __config__ = {}
 job_queue = []
+jobExecutor = None
+runningLanes = {}
+runningLanesLock = threading.Lock()
 
 ## define  helper functions
+def makeJobExecutor(maxWorkers):
+    # thread pool of the lanes, whose threads are named lane_<n> in the log if the Python version supports it (3.6+)
+    try:
+        return ThreadPoolExecutor(max_workers=maxWorkers,thread_name_prefix='lane')
+    except TypeError:
+        return ThreadPoolExecutor(max_workers=maxWorkers)
+
 def copyJSON(folderName=os.getcwd(),force=0):
     if force == 0 and os.path.isfile(os.path.join(folderName,'botConfig.json')):
         logging.warning('botConfig.json already exists in\n%s\nUse copyJSON(targetfolder,force=1) or copyJSON(force=1) to overwrite both (!) JSONs'%folderName)
@@ -98,7 +130,8 @@ def broadcastMsg(bot,userId,msg,level='info'):
     count = 0
     while count < 5:
         try:
-            bot.send_message(chat_id=userId, text=level + ': ' + msg, parse_mode='markdown')
+            with attempt(count):  # labels the send_message metrics with the number of retries
+                bot.send_message(chat_id=userId, text=level + ': ' + msg, parse_mode='markdown')
             break
         except TypeError as e:
             pass            
@@ -110,6 +143,10 @@ def broadcastMsg(bot,userId,msg,level='info'):
     if count >= 5:
         logging.error('Could not send message to bot')
 
+def isAdmin(user_data):
+    # the first user in botConfig.json is the admin of the bot
+    return user_data.get('chatId') == __config__['telegramUserId'][0]
+
 def noncomprende(bot, update,what):
     if what == 'unknownCmd':
         txt = "Sorry, I didn't understand that command."
@@ -215,41 +252,80 @@ def deleteMessages(user_data,typ='all',onlyForget=False):
         user_data['messages'][t] = []
     return 1
     
+def statusMarkup(ex,ct,iTs):
+    if ct.tradeSets[iTs]['virgin']:
+        return InlineKeyboardMarkup(buttonsEditTS(ct,iTs,mode='init'))
+    else:
+        return makeTSInlineKeyboard(ex,iTs)
+
+def editTradeStatus(bot,user_data,statuses):
+    # edits the texts of the status messages shown in the chat (whose ids are kept per chat) instead of sending them
+    # again. This is only done if they show the same trade sets, otherwise False is returned
+    messages = user_data['messages']['status']
+    rendered = user_data.get('statusRendered',{}).get(user_data['chatId'],[])
+    if len(messages) == 0 or len(messages) != len(rendered) or len(rendered) != len(statuses):
+        return False
+    if [entry[:3] for entry in rendered] != [entry[:3] for entry in statuses] or [msg.message_id for msg in messages] != [entry[4] for entry in rendered]:
+        return False
+    for iMsg,((ex,iTs,virgin,text),old) in enumerate(zip(statuses,rendered)):
+        if text == old[3]:
+            continue
+        try:
+            bot.edit_message_text(text,chat_id=user_data['chatId'],message_id=old[4],reply_markup=statusMarkup(ex,user_data['trade'][ex],iTs),parse_mode='markdown')
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():  # e.g. the message was deleted by the user
+                logging.warning('Could not edit status message: %s'%str(e))
+                return False
+        rendered[iMsg] = (ex,iTs,virgin,text,old[4])
+    return True
+
+@profiling.profiled('handlers')
 def printTradeStatus(bot,update,user_data,onlyThisTs=None):
+    # all statuses of an exchange are rendered at once with one ticker snapshot, unchanged ones come from the cache of
+    # the trade handler
+    statuses = []
     count = 0
-    deleteMessages(user_data,'status')
     for iex,ex in enumerate(user_data['trade']):
         ct = user_data['trade'][ex]
         if onlyThisTs is not None and onlyThisTs not in ct.tradeSets:
             continue
-        count = 0       
-        for iTs in ct.tradeSets:
-            try:  # catch errors in order to be able to see the statuses of other exchanges, if one exchange has a problem
-                ts = ct.tradeSets[iTs]
-                if onlyThisTs is not None and onlyThisTs != iTs:
-                    continue
-                if ts['virgin']:
-                    markup = InlineKeyboardMarkup(buttonsEditTS(ct,iTs,mode='init'))
-                else:
-                    markup = makeTSInlineKeyboard(ex,iTs)
+        count = 0
+        try:  # catch errors in order to be able to see the statuses of other exchanges, if one exchange has a problem
+            infos = ct.getTradeSetInfos(user_data['settings']['showProfitIn'],None if onlyThisTs is None else [onlyThisTs])
+        except Exception as e:
+            logging.error(str(e))
+            continue
+        for iTs,text in infos:
+            ts = ct.tradeSets.get(iTs)
+            if ts is not None:
                 count += 1
-                user_data['messages']['status'].append(bot.send_message(user_data['chatId'],ct.getTradeSetInfo(iTs,user_data['settings']['showProfitIn']),reply_markup=markup,parse_mode='markdown'))
-            except Exception as e:
-                logging.error(str(e))
-                pass
+                statuses.append((ex,iTs,ts['virgin'],text))
+    if count > 0 and onlyThisTs is None and editTradeStatus(bot,user_data,statuses):
+        return MAINMENU
+    deleteMessages(user_data,'status')
+    rendered = user_data.setdefault('statusRendered',{})[user_data['chatId']] = []
+    for ex,iTs,virgin,text in statuses:
+        try:
+            msg = bot.send_message(user_data['chatId'],text,reply_markup=statusMarkup(ex,user_data['trade'][ex],iTs),parse_mode='markdown')
+            user_data['messages']['status'].append(msg)
+            rendered.append((ex,iTs,virgin,text,msg.message_id))
+        except Exception as e:
+            logging.error(str(e))
+            pass
     if count == 0:
         user_data['messages']['status'].append(bot.send_message(user_data['chatId'],'No Trade sets found'))
     return MAINMENU 
     
+@profiling.profiled('handlers')
 def checkBalance(bot,update,user_data,exchange=None):
     if exchange:
         ct = user_data['trade'][exchange]
-        ct.updateBalance()
-        if ct.exchange.has['fetchTickers']:
-            tickers = ct.safeRun(ct.exchange.fetchTickers)
-            func = lambda sym: tickers[sym] if sym in tickers else ct.safeRun(lambda : ct.exchange.fetchTicker(sym))  # includes a hot fix for some ccxt problems
-        else:
-            func = lambda sym: ct.safeRun(lambda : ct.exchange.fetchTicker(sym))
+        # the user waits for this, but it must not delay orders and status checks of the trade sets
+        with ct.requestPriority('info'):
+            ct.updateBalance()
+            # tickers come from the market data hub shared by all users of this exchange
+            tickers = ct.fetchTickers()
+        func = lambda sym: tickers[sym] if sym in tickers else ct.fetchTicker(sym)  # includes a hot fix for some ccxt problems
         coins = list(ct.balance['total'].keys())
         string = '*Balance on %s (>%g BTC):*\n'%(exchange,__config__['minBalanceInBTC'])
         for c in coins:
@@ -389,7 +465,7 @@ def askPos(bot,user_data,exch,uidTS,direction,applyFct=None,inputType=None,respo
         if response == 0:
             user_data['messages']['dialog'].append(bot.send_message(user_data['chatId'],"Zero not allowed"))
             return NUMBER
-        response = float(user_data['trade'][exch].exchange.priceToPrecision(symbol,response))
+        response = ct.price2Float(symbol,response)
         user_data['tempTradeSet'][0] = response
         user_data['lastFct'].append(lambda res : askPos(bot,user_data,exch,uidTS,direction,applyFct,'amount',res))
         askAmount(user_data,exch,uidTS,direction,bot)
@@ -397,7 +473,7 @@ def askPos(bot,user_data,exch,uidTS,direction,applyFct=None,inputType=None,respo
     elif inputType == 'amount':
         if user_data['whichCurrency']==1:
             response =response/user_data['tempTradeSet'][0]
-        response = float(user_data['trade'][exch].exchange.amountToPrecision(symbol,response))
+        response = ct.amount2Float(symbol,response)
         user_data['tempTradeSet'][1] = response
         if direction == 'buy':
             user_data['lastFct'].append(lambda res : askPos(bot,user_data,exch,uidTS,direction,applyFct,'candleAbove',res))
@@ -473,6 +549,15 @@ def botInfo(bot,update,user_data):
     remoteVersion = getRemoteVersion()
     if remoteVersion > thisVersion:
         string += '\n<b>There is a new version of EazeBot available on git (v%s)!</b>\n'%remoteVersion
+    if len(user_data['trade']) > 0:
+        string += '\n<b>Exchange connection status:</b>\n'
+        for ex in user_data['trade']:
+            stats = user_data['trade'][ex].getRetryStats()
+            string += '%s: %s%s, retries: %s\n'%(ex,'online' if stats['circuitBreaker']['state'] == 'closed' else 'paused (%s)'%stats['circuitBreaker']['state'],
+                                                  '' if stats['circuitBreaker']['trips'] == 0 else ' (down %d times so far)'%stats['circuitBreaker']['trips'],
+                                                  ', '.join(['%d (%s)'%(stats['retries'][err],err) for err in stats['retries']]) if len(stats['retries']) > 0 else 'none')
+            string += '    queued requests: %d, mean wait: %s\n'%(sum(stats['requests']['queued'].values()),
+                                                                  ', '.join(['%.2f s (%s)'%(wait['mean'],prio) for prio,wait in stats['requests']['waits'].items() if wait['count'] > 0]) or 'none')
     string+='\nReward my efforts on this bot by donating some cryptos!'
     user_data['messages']['botInfo'].append(bot.send_message(user_data['chatId'],string,parse_mode='html',reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('Donate',callback_data='1|xxx|xxx')]])))
     return MAINMENU
@@ -492,37 +577,105 @@ def checkForUpdates(bot,job):
             if 'chatId' in updater.dispatcher.user_data[user]:
                 updater.dispatcher.user_data[user]['messages']['botInfo'].append(bot.send_message(updater.dispatcher.user_data[user]['chatId'],'There is a new version of EazeBot available on git/pip (v%s)! Consider updating!'%remoteVersion))
 
+def runLane(jobName,lane,fct,ct,parentSpan=None,profileSession=None):
+    # executes the job function for one user/exchange lane and returns its duration. The lane was registered in
+    # runningLanes when it was submitted and stays there until it finished
+    started = time.time()
+    try:
+        with tracing.traceSpan('lane',parentSpan,user=lane[0],exchange=lane[1]), profiling.profileThread(profileSession):
+            fct(ct)
+    finally:
+        with runningLanesLock:
+            runningLanes.pop((jobName,)+lane,None)
+    return time.time() - started
+
+def runOnAllExchanges(updater,fct,jobName,logDurations=True):
+    # runs fct(tradeHandler) for all exchanges of all users in parallel, one lane per user and exchange, so that a
+    # slow exchange does not delay the others. Returns a dict lane -> duration in seconds (None if timed out/failed)
+    global jobExecutor
+    if jobExecutor is None:
+        jobExecutor = makeJobExecutor(__config__.get('maxWorkers',8))
+    laneTimeout = __config__.get('laneTimeout',120)
+    # the lanes run in other threads, so the span of the cycle and the profile (if profiled) are passed to them
+    parentSpan = tracing.currentSpan()
+    profileSession = profiling.currentSession()
+    futures = {}
+    for user in list(updater.dispatcher.user_data):
+        if user in __config__['telegramUserId'] and 'trade' in updater.dispatcher.user_data[user]:
+            for ex,ct in list(updater.dispatcher.user_data[user]['trade'].items()):
+                lane = (user,ex)
+                with runningLanesLock:
+                    isRunning = (jobName,)+lane in runningLanes
+                    if not isRunning:  # the timeout counts from the submission, so lanes waiting for a worker are covered too
+                        runningLanes[(jobName,)+lane] = time.time()
+                if isRunning:
+                    logging.warning('%s of user %d on %s is still running since the last cycle, skipping it'%(jobName,user,ex))
+                    continue
+                futures[jobExecutor.submit(runLane,jobName,lane,fct,ct,parentSpan,profileSession)] = lane
+    durations = {}
+    pending = set(futures)
+    while len(pending) > 0:
+        done, pending = wait(pending,timeout=1,return_when=FIRST_COMPLETED)
+        for future in done:
+            lane = futures[future]
+            try:
+                durations[lane] = future.result()
+            except Exception as e:  # make sure other exchanges are checked too, even if one has a problem
+                durations[lane] = None
+                logging.error('%s of user %d on %s failed: %s'%(jobName,lane[0],lane[1],str(e)))
+        now = time.time()
+        for future in list(pending):
+            lane = futures[future]
+            with runningLanesLock:
+                submitted = runningLanes.get((jobName,)+lane)
+            if submitted is not None and now - submitted > laneTimeout:
+                pending.discard(future)
+                durations[lane] = None
+                if future.cancel():  # it was still waiting for a worker, so it is tried again next cycle
+                    with runningLanesLock:
+                        runningLanes.pop((jobName,)+lane,None)
+                    logging.error('%s of user %d on %s did not start within %d s'%(jobName,lane[0],lane[1],laneTimeout))
+                else:
+                    # the thread cannot be killed, but the job does not wait for it anymore and it is skipped until it finished
+                    logging.error('%s of user %d on %s did not finish within %d s'%(jobName,lane[0],lane[1],laneTimeout))
+    if logDurations and len(durations) > 0:
+        logging.info('%s lane durations: %s'%(jobName,', '.join(['%s (user %d): %s'%(lane[1],lane[0],'failed/timed out' if durations[lane] is None else '%.1f s'%durations[lane]) for lane in durations])))
+    return durations
+
+@timedJob('updateTradeSets')
+@profiling.profiled('updateTradeSets')
 def updateTradeSets(bot,job):
     updater = job.context
-    logging.info('Updating trade sets...')
-    for user in updater.dispatcher.user_data:
-        if user in __config__['telegramUserId'] and 'trade' in updater.dispatcher.user_data[user]:
-            for iex,ex in enumerate(updater.dispatcher.user_data[user]['trade']):
-                try: # make sure other exchanges are checked too, even if one has a problem
-                    updater.dispatcher.user_data[user]['trade'][ex].update()
-                except Exception as e:
-                    logging.error(str(e))
-                    pass
+    with tracing.traceCycle('updateTradeSets') as cycle:
+        logging.info('Updating trade sets%s...'%('' if cycle is None else ' (cycle %s)'%cycle['trace']))
+        runOnAllExchanges(updater,lambda ct: ct.update(),'updateTradeSets')
     logging.info('Finished updating trade sets...')
 
+@timedJob('updateDueTradeSets')
+def updateDueTradeSets(bot,job):
+    # fast tier: stop-losses and the trade sets close to a trigger, runs every few seconds and therefore logs nothing
+    updater = job.context
+    runOnAllExchanges(updater,lambda ct: ct.updateDue(),'updateDueTradeSets',logDurations=False)
+
 def updateBalance(bot,job):
     updater = job.context
     logging.info('Updating balances...')
-    for user in updater.dispatcher.user_data:
-        if user in __config__['telegramUserId'] and 'trade' in updater.dispatcher.user_data[user]:
-            for iex,ex in enumerate(updater.dispatcher.user_data[user]['trade']):
-                updater.dispatcher.user_data[user]['trade'][ex].updateBalance()
+    runOnAllExchanges(updater,lambda ct: ct.updateBalance(),'updateBalance')
     logging.info('Finished updating balances...')
     
+@timedJob('checkCandle')
 def checkCandle(bot,job):
+    # runs every minute, but only requests candles if one closed since the last check
     updater = job.context
-    logging.info('Checking candles for all trade sets...')
-    for user in updater.dispatcher.user_data:
-        if user in __config__['telegramUserId']:
-            for iex,ex in enumerate(updater.dispatcher.user_data[user]['trade']):
-                # avoid to hit it during updating
-                updater.dispatcher.user_data[user]['trade'][ex].update(dailyCheck=1)
-    logging.info('Finished checking candles for all trade sets...')
+    runOnAllExchanges(updater,lambda ct: ct.checkCandles(),'checkCandle',logDurations=False)
+
+def attachPriceFeeds(bot,job):
+    # makes sure the stop-losses of all trade handlers (also of newly added exchanges) are checked by the price feeds
+    updater = job.context
+    for user in list(updater.dispatcher.user_data):
+        if user in __config__['telegramUserId'] and 'trade' in updater.dispatcher.user_data[user]:
+            for ex,ct in list(updater.dispatcher.user_data[user]['trade'].items()):
+                ct.attachPriceFeed().start()
 
 def timingCallback(bot, update,user_data,query=None,response=None):
     if query is None:
@@ -543,6 +696,12 @@ def showSettings  (bot, update,user_data,botOrQuery=None):
     # stop bot with security question
     string = '*Settings:*\n_Fiat currencies(descending priority):_ %s\n_Show gain/loss in:_ %s'%(', '.join(user_data['settings']['fiat']), 'Fiat (if available)' if user_data['settings']['showProfitIn'] is not None else 'Base currency') #user_data['settings']['showProfitIn']
     settingButtons = [[InlineKeyboardButton('Define your fiat',callback_data='settings|defFiat')],[InlineKeyboardButton("Toggle showing gain/loss in baseCurrency or fiat", callback_data='settings|toggleProfit')],[InlineKeyboardButton("*Stop bot*", callback_data='settings|stopBot'),InlineKeyboardButton("Back", callback_data='settings|cancel')]]    
+    if isAdmin(user_data):
+        # profiling of the running bot, e.g. if it got slow
+        pending = profiling.manager.pending()
+        string += '\n_Profiling pending:_ %d update cycles, %d handler calls'%(pending.get('updateTradeSets',0),pending.get('handlers',0))
+        settingButtons.insert(2,[InlineKeyboardButton('Profile next %d update cycles'%profiling.defaultCounts['updateTradeSets'],callback_data='settings|profile|updateTradeSets'),
+                                 InlineKeyboardButton('Profile next %d handler calls'%profiling.defaultCounts['handlers'],callback_data='settings|profile|handlers')])
     if botOrQuery == None or isinstance(botOrQuery,type(bot)):
         user_data['messages']['settings'].append(bot.send_message(user_data['chatId'], string, parse_mode = 'markdown', reply_markup=InlineKeyboardMarkup(settingButtons)))
     else:
@@ -561,6 +720,7 @@ def updateTStext(bot,update,user_data,uidTS,query=None):
     printTradeStatus(bot,update,user_data,uidTS)
 
     
+@profiling.profiled('handlers')
 def InlineButtonCallback(bot, update,user_data,query=None,response=None):
     if query is None:
         query = update.callback_query
@@ -586,6 +746,13 @@ def InlineButtonCallback(bot, update,user_data,query=None,response=None):
                     query.answer('stopping')
                     bot.send_message(user_data['chatId'],'Bot is aborting now. Goodbye!')
                     doneCmd(bot,update,user_data)
+            elif subcommand == 'profile':
+                if not isAdmin(user_data):
+                    query.answer('Only the admin can profile the bot')
+                else:
+                    profiling.manager.arm(args[0],profiling.defaultCounts[args[0]],lambda text: bot.send_message(user_data['chatId'],text,parse_mode='markdown'))
+                    query.answer('Profiling the next %d calls'%profiling.defaultCounts[args[0]])
+                    showSettings(bot, update,user_data,query)
             else:
                 if subcommand == 'defFiat':
                     if response is None:
@@ -816,10 +983,21 @@ def clean_data(user_data):
         else: # discard cached messages
             if 'messages' in user_data[user]:
                 deleteMessages(user_data[user],'all',True)
+            user_data[user].pop('statusRendered',None)
+            # trade handlers of the other mode (paper trading or real) are put aside until the mode is switched back,
+            # so that simulated trade sets are never run on the real exchange and vice versa
+            parked = user_data[user].setdefault('parkedTrade',{})
+            for exch in list(user_data[user]['trade']):
+                if user_data[user]['trade'][exch].paperTrading != tradeHandler.paperTrading:
+                    parked[exch] = user_data[user]['trade'].pop(exch)
+            for exch in list(parked):
+                if parked[exch].paperTrading == tradeHandler.paperTrading and exch not in user_data[user]['trade']:
+                    user_data[user]['trade'][exch] = parked.pop(exch)
     for k in delThese:
         user_data.pop(k, None)
     return user_data
 
+@timedJob('save_data')
 def save_data(*arg):
     if len(arg) == 1:
         updater = arg[0]
@@ -864,6 +1042,7 @@ def startBot():
     global __config__
     global job_queue
     global updater
+    global jobExecutor
     #%% load bot configuration
     with open("botConfig.json", "r") as fin:
         __config__ = json.load(fin)
@@ -877,6 +1056,65 @@ def startBot():
         __config__['minBalanceInBTC'] = 0.001
     if isinstance(__config__['minBalanceInBTC'],str):
         __config__['minBalanceInBTC'] = float(__config__['minBalanceInBTC'])
+    if 'tickerMaxAge' not in __config__:
+        __config__['tickerMaxAge'] = 20
+    marketDataHub.maxAge = float(__config__['tickerMaxAge'])
+    if 'marketsMaxAge' not in __config__:
+        __config__['marketsMaxAge'] = 3600
+    marketsCache.maxAge = float(__config__['marketsMaxAge'])
+    if 'maxWorkers' not in __config__:
+        __config__['maxWorkers'] = 8
+    if 'laneTimeout' not in __config__:
+        __config__['laneTimeout'] = 120
+    jobExecutor = makeJobExecutor(int(__config__['maxWorkers']))
+    if 'orderWaitDeadline' not in __config__:
+        __config__['orderWaitDeadline'] = 10
+    tradeHandler.orderWaitDeadline = float(__config__['orderWaitDeadline'])
+    if 'priceFeedInterval' not in __config__:
+        __config__['priceFeedInterval'] = 10
+    pollingFeed.interval = float(__config__['priceFeedInterval'])
+    if 'balanceReconcileInterval' not in __config__:
+        __config__['balanceReconcileInterval'] = 600
+    balanceLedger.reconcileInterval = float(__config__['balanceReconcileInterval'])
+    if 'fastUpdateInterval' not in __config__:
+        __config__['fastUpdateInterval'] = 10
+    pollScheduler.minInterval = float(__config__['fastUpdateInterval'])
+    pollScheduler.maxInterval = 60*__config__['updateInterval']
+    if 'candleTimeframe' not in __config__:
+        __config__['candleTimeframe'] = '1d'
+    candleEngine.timeframe = __config__['candleTimeframe']
+    # paper trading simulates all orders with the real prices of the exchanges
+    if 'paperTrading' not in __config__:
+        __config__['paperTrading'] = False
+    tradeHandler.paperTrading = bool(__config__['paperTrading'])
+    if 'paperTradingBalance' in __config__:
+        tradeHandler.paperTradingBalance = __config__['paperTradingBalance']
+    # retry policy and circuit breaker settings of the exchange requests
+    if 'retryPolicy' in __config__:
+        retryPolicy.defaults['budgets'].update(__config__['retryPolicy'].pop('budgets',{}))
+        retryPolicy.defaults.update(__config__['retryPolicy'])
+    if 'circuitBreaker' in __config__:
+        for key in __config__['circuitBreaker']:
+            setattr(circuitBreaker,key,float(__config__['circuitBreaker'][key]))
+    # requests of one account running at the same time. Private (signed) requests run one at a time so that their
+    # nonces arrive in order, unless more are allowed for exchanges which do not need this
+    if 'maxConcurrentRequests' not in __config__:
+        __config__['maxConcurrentRequests'] = 4
+    requestScheduler.maxConcurrent = int(__config__['maxConcurrentRequests'])
+    if 'maxConcurrentPrivateRequests' not in __config__:
+        __config__['maxConcurrentPrivateRequests'] = 1
+    requestScheduler.maxConcurrentPrivate = int(__config__['maxConcurrentPrivateRequests'])
+    # local http endpoint serving the request and job metrics in the Prometheus text format (0 disables it)
+    if 'metricsPort' not in __config__:
+        __config__['metricsPort'] = 0
+    if int(__config__['metricsPort']) > 0:
+        startMetricsServer(int(__config__['metricsPort']),__config__.get('metricsHost','127.0.0.1'))
+    # span tracing of the sampled update cycles, see python tracing.py --help for summarizing the trace file
+    if 'traceSampleRate' not in __config__:
+        __config__['traceSampleRate'] = 0.1
+    tracing.configure(__config__.get('traceFile','cycleTrace.jsonl'),__config__['traceSampleRate'])
+    if 'profileFolder' in __config__:
+        profiling.profileManager.folder = __config__['profileFolder']
     
     #%% define the handlers to communicate with user
     conv_handler = ConversationHandler(
@@ -906,6 +1144,13 @@ def startBot():
     #%% start telegram API, add handlers to dispatcher and start bot
     updater = Updater(token = __config__['telegramAPI'], request_kwargs={'read_timeout': 10, 'connect_timeout': 10})
     job_queue = updater.job_queue
+    instrumentBot(updater.bot)
+    # profiling of the first update cycles/handler calls after the start, the summaries are sent to the admin
+    reportToAdmin = lambda text: updater.bot.send_message(__config__['telegramUserId'][0],text,parse_mode='markdown')
+    if __config__.get('profileCycles',0) > 0:
+        profiling.manager.arm('updateTradeSets',int(__config__['profileCycles']),reportToAdmin)
+    if __config__.get('profileHandlerCalls',0) > 0:
+        profiling.manager.arm('handlers',int(__config__['profileHandlerCalls']),reportToAdmin)
     updater.dispatcher.add_handler(conv_handler)
     updater.dispatcher.add_handler(unknown_handler)
     updater.dispatcher.user_data = clean_data(load_data())
@@ -917,21 +1162,29 @@ def startBot():
             
     for user in __config__['telegramUserId']:
         try:
-            updater.bot.send_message(user,'Bot was restarted.\n Please press /start to continue.',reply_markup=ReplyKeyboardMarkup([['/start']]),one_time_keyboard=True)
+            updater.bot.send_message(user,'Bot was restarted%s.\n Please press /start to continue.'%(' in paper trading mode (orders are only simulated)' if __config__['paperTrading'] else ''),reply_markup=ReplyKeyboardMarkup([['/start']]),one_time_keyboard=True)
         except:
             pass
     # start a job updating the trade sets each interval
     updater.job_queue.run_repeating(updateTradeSets, interval=60*__config__['updateInterval'], first=60,context=updater)
+    # start a job checking the stop-losses and the orders of trade sets close to a trigger in between
+    if __config__['fastUpdateInterval'] > 0:
+        updater.job_queue.run_repeating(updateDueTradeSets, interval=__config__['fastUpdateInterval'], first=90,context=updater)
+    # start a job attaching the trade handlers to the price feeds, which check the stop-losses every few seconds
+    if __config__['priceFeedInterval'] > 0:
+        updater.job_queue.run_repeating(attachPriceFeeds, interval=60, first=30,context=updater)
     # start a job checking for updates once a  day
     updater.job_queue.run_repeating(checkForUpdates, interval=60*60*24, first=0,context=updater)
-    # start a job checking every day 10 sec after midnight (UTC time) if any 'candleAbove' buys need to be initiated
-    updater.job_queue.run_daily(checkCandle, (dt.datetime.combine(dt.date(1900,5,5),dt.time(0,0,10)) + (dt.datetime.now()-dt.datetime.utcnow())).time(), context=updater)
+    # start a job checking if any 'candleAbove' buys need to be initiated after a candle closed (also catches up on closes missed while the bot was down)
+    updater.job_queue.run_repeating(checkCandle, interval=60, first=30, context=updater)
     # start a job saving the user data each 5 minutes
     updater.job_queue.run_repeating(save_data, interval=5*60, first=75,context=updater)
     
     updater.start_polling()
     updater.idle()
+    stopAllFeeds()
     save_data(updater)  # last data save when finishing
+    stopMetricsServer()
 
 # execute main if running as script
 if __name__ == '__main__':
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the running aggregates of the buy and sell levels of a trade set"""
+
+import heapq
+from fractions import Fraction
+
+BUCKETS = ['filled', 'open', 'notinitiated']
+ORDERS = {'all': BUCKETS, 'filled': ['filled'], 'open': ['open'], 'notinitiated': ['notinitiated'],
+          'notfilled': ['open', 'notinitiated']}
+
+
+def bucketOf(level):
+    if level['oid'] == 'filled':
+        return 'filled'
+    elif level['oid'] is None:
+        return 'notinitiated'
+    else:
+        return 'open'
+
+
+class bucketStats:
+    # count, sums and price extremes of the levels in one state. The sums are kept as exact fractions so that adding
+    # and removing the same level many times does not accumulate float errors. Min/max prices are heaps from which
+    # removed prices are dropped lazily
+
+    def __init__(self):
+        self.num = 0
+        self.amount = Fraction(0)
+        self.actualAmount = Fraction(0)
+        self.cost = Fraction(0)
+        self.price = Fraction(0)
+        self.prices = {}  # price -> number of levels with this price
+        self.minHeap = []
+        self.maxHeap = []
+
+    def add(self, amount, actualAmount, price):
+        # levels without a price (e.g. market orders that were not filled yet) only count for the amounts
+        self.num += 1
+        self.amount += Fraction(amount)
+        self.actualAmount += Fraction(actualAmount)
+        if price is None:
+            return
+        self.cost += Fraction(amount) * Fraction(price)
+        self.price += Fraction(price)
+        if price not in self.prices:
+            self.prices[price] = 0
+            if len(self.minHeap) > 2 * len(self.prices) + 16:  # too many removed prices in the heaps, rebuild them
+                self.minHeap = list(self.prices)
+                self.maxHeap = [-val for val in self.prices]
+                heapq.heapify(self.minHeap)
+                heapq.heapify(self.maxHeap)
+            heapq.heappush(self.minHeap, price)
+            heapq.heappush(self.maxHeap, -price)
+        self.prices[price] += 1
+
+    def remove(self, amount, actualAmount, price):
+        self.num -= 1
+        self.amount -= Fraction(amount)
+        self.actualAmount -= Fraction(actualAmount)
+        if price is None:
+            return
+        self.cost -= Fraction(amount) * Fraction(price)
+        self.price -= Fraction(price)
+        self.prices[price] -= 1
+        if self.prices[price] == 0:
+            del self.prices[price]
+
+    def minPrice(self):
+        while self.minHeap and self.minHeap[0] not in self.prices:
+            heapq.heappop(self.minHeap)
+        return self.minHeap[0] if self.minHeap else None
+
+    def maxPrice(self):
+        while self.maxHeap and -self.maxHeap[0] not in self.prices:
+            heapq.heappop(self.maxHeap)
+        return -self.maxHeap[0] if self.maxHeap else None
+
+
+class levelAggregates:
+    # aggregates of all levels of one direction (buy or sell) of a trade set, grouped by the state of their order
+
+    def __init__(self, levels=(), feeSubtracted=True):
+        # feeSubtracted tells if the actualAmount of the levels (the amount after fee subtraction) is used for the
+        # amount sums, which is only the case for buy levels
+        self.feeSubtracted = feeSubtracted
+        self.buckets = {bucket: bucketStats() for bucket in BUCKETS}
+        for level in levels:
+            self.add(level)
+
+    def values(self, level):
+        amount = level['amount']
+        return amount, level['actualAmount'] if self.feeSubtracted else amount, level['price']
+
+    def add(self, level):
+        self.buckets[bucketOf(level)].add(*self.values(level))
+
+    def remove(self, level):
+        self.buckets[bucketOf(level)].remove(*self.values(level))
+
+    def get(self, what, method, order='all', subtractFee=True):
+        # returns the same values as a scan over the levels would, see tradeHandler.getTradeParam
+        if order not in ORDERS:
+            raise ValueError('order has to be all, filled, notfilled, notinitiated or open')
+        buckets = [self.buckets[bucket] for bucket in ORDERS[order]]
+        num = sum(bucket.num for bucket in buckets)
+        if method == 'num':
+            return num
+        if what == 'price':
+            if method == 'min':
+                prices = [bucket.minPrice() for bucket in buckets if bucket.num > 0]
+                return min(prices) if prices else None
+            elif method == 'max':
+                prices = [bucket.maxPrice() for bucket in buckets if bucket.num > 0]
+                return max(prices) if prices else None
+            total = sum(bucket.price for bucket in buckets)
+        elif what == 'amount':
+            total = sum((bucket.actualAmount if subtractFee else bucket.amount) for bucket in buckets)
+        elif what == 'cost':
+            total = sum(bucket.cost for bucket in buckets)
+        else:
+            raise ValueError('what has to be amount, price or cost')
+        if method == 'sum':
+            return float(total)
+        elif method == 'mean':
+            return None if num == 0 else float(total / num)
+        raise ValueError('Aggregate %s of %s is not maintained' % (method, what))
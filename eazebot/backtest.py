@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the backtest of trade set definitions on historical OHLCV candles, which evaluates all levels,
+stop-losses and parameter variants at once with numpy arrays. Run python backtest.py candles.csv tradeSet.json
+[--grid grid.json] for a backtest from local files"""
+
+import argparse
+import itertools
+import json
+
+import numpy as np
+
+# the keys of a trade set definition and their defaults, named like the arguments of tradeHandler.newTradeSet
+DEFAULTS = {'buyLevels': [], 'buyAmounts': [], 'sellLevels': [], 'sellAmounts': [], 'sl': None, 'candleAbove': [],
+            'initCoins': 0., 'initPrice': None,
+            'trailingSL': [None, None],  # [offset, 'abs' or 'rel'], active as soon as no buy level is unfilled
+            'fees': {'maker': 0.001, 'taker': 0.001},
+            'buyFeeInCoin': True}  # False if the exchange takes the fee of buy orders from the base currency
+
+
+def loadCandles(fileName):
+    # loads candles as returned by ccxt's fetchOHLCV (columns time, open, high, low, close[, volume]) from a .npy, .npz
+    # or .csv file (with or without header line) and returns a dict of the columns
+    if fileName.endswith('.npz'):
+        with np.load(fileName) as data:
+            if 'close' in data:
+                return {key: np.asarray(data[key], dtype=float) for key in ['time', 'open', 'high', 'low', 'close']}
+            candles = data[data.files[0]]
+    elif fileName.endswith('.npy'):
+        candles = np.load(fileName)
+    else:
+        with open(fileName, 'r') as fh:
+            firstLine = fh.readline()
+        try:
+            [float(value) for value in firstLine.split(',')]
+            skip = 0
+        except ValueError:
+            skip = 1
+        candles = np.loadtxt(fileName, delimiter=',', skiprows=skip, ndmin=2)
+    return candleColumns(candles)
+
+
+def candleColumns(candles):
+    candles = np.asarray(candles, dtype=float)
+    return {key: candles[:, i] for i, key in enumerate(['time', 'open', 'high', 'low', 'close'])}
+
+
+def tradeSetDefinition(ts, fees=None):
+    # definition of an existing trade set of a trade handler, to replay it on history
+    definition = {'buyLevels': [trade['price'] for trade in ts['InTrades']],
+                  'buyAmounts': [trade['amount'] for trade in ts['InTrades']],
+                  'candleAbove': [trade['candleAbove'] for trade in ts['InTrades']],
+                  'sellLevels': [trade['price'] for trade in ts['OutTrades']],
+                  'sellAmounts': [trade['amount'] for trade in ts['OutTrades']],
+                  'sl': ts['SL'], 'initCoins': ts['initCoins'], 'initPrice': ts['initPrice'],
+                  'trailingSL': list(ts.get('trailingSL', [None, None]))}
+    if fees is not None:
+        definition['fees'] = fees
+    return definition
+
+
+def variants(definition, grid):
+    # all combinations of the values in grid (dict key -> list of values) applied to the definition, e.g.
+    # {'sl': [0.04, 0.045], 'trailingSL': [[None, None], [0.05, 'rel']]} gives four variants
+    keys = sorted(grid)
+    result = []
+    for values in itertools.product(*[grid[key] for key in keys]):
+        variant = dict(definition)
+        variant.update(zip(keys, values))
+        result.append(variant)
+    return result
+
+
+def padded(rows, width, fill=np.nan):
+    array = np.full((len(rows), width), fill)
+    for i, row in enumerate(rows):
+        array[i, :len(row)] = [fill if value is None else value for value in row]
+    return array
+
+
+def firstIndex(mask):
+    # index of the first True along the last axis, or the length of the axis if there is none
+    index = np.argmax(mask, axis=-1)
+    return np.where(mask.any(axis=-1), index, mask.shape[-1])
+
+
+def runBacktest(candles, definitions):
+    # replays the trade set definitions (one per variant) on the candles and returns a dict of arrays with one entry
+    # per variant. The rules follow tradeHandler.update:
+    # - buy orders are placed at the start, candleAbove levels after the first candle closing above the threshold, and
+    #   fill at the first later candle whose low reaches the price. The maker fee is paid in the coin (or, if not
+    #   buyFeeInCoin, in the base currency, where getTradeSetInfo does not count it either)
+    # - sell levels (lowest first) are placed after the candle in which the bought coins cover them and fill at the
+    #   first later candle whose high reaches the price
+    # - the stop-loss sells all coins at the first candle whose low reaches it (at the open if the candle opens below),
+    #   paying the taker fee. Buys of that candle are still filled, its sells are not. A trailing stop-loss follows the
+    #   closes once all buy levels are filled
+    # The gain is computed like in getTradeSetInfo: costs of the sells (without their fee) plus the remaining coins
+    # sold at the last close after the taker fee, minus the costs of the buys
+    if isinstance(definitions, dict):
+        definitions = [definitions]
+    definitions = [dict(DEFAULTS, **definition) for definition in definitions]
+    low, high, close, openPrice = [np.asarray(candles[key], dtype=float) for key in ['low', 'high', 'close', 'open']]
+    numBars = len(close)
+    bars = np.arange(numBars)
+    numBuys = max(len(d['buyLevels']) for d in definitions)
+    numSells = max(len(d['sellLevels']) for d in definitions)
+
+    buyPrice = padded([d['buyLevels'] for d in definitions], numBuys)
+    buyAmount = padded([d['buyAmounts'] for d in definitions], numBuys, 0.)
+    candleAbove = padded([d['candleAbove'] if len(d['candleAbove']) == len(d['buyLevels']) else [] for d in definitions],
+                         numBuys)
+    # sell levels are sorted by price like in newTradeSet
+    sells = [sorted(zip(d['sellLevels'], d['sellAmounts'])) for d in definitions]
+    sellPrice = padded([[level[0] for level in s] for s in sells], numSells)
+    sellAmount = padded([[level[1] for level in s] for s in sells], numSells, 0.)
+    sl = np.array([np.nan if d['sl'] is None else d['sl'] for d in definitions], dtype=float)
+    offset = np.array([np.nan if d['trailingSL'][0] is None else d['trailingSL'][0] for d in definitions], dtype=float)
+    relative = np.array([d['trailingSL'][1] != 'abs' for d in definitions])
+    initCoins = np.array([d['initCoins'] for d in definitions], dtype=float)
+    initPrice = np.array([np.nan if d['initPrice'] is None else d['initPrice'] for d in definitions], dtype=float)
+    maker = np.array([d['fees']['maker'] for d in definitions], dtype=float)
+    taker = np.array([d['fees']['taker'] for d in definitions], dtype=float)
+    coinFee = np.where([d['buyFeeInCoin'] for d in definitions], maker, 0.)
+    realBuy = ~np.isnan(buyPrice)  # variants with fewer levels are padded with nan levels that never fill
+    realSell = ~np.isnan(sellPrice)
+
+    with np.errstate(invalid='ignore'):
+        # like activateTradeSet, a stop-loss at or above a buy level makes the trade set invalid
+        invalid = np.any(realBuy & (buyPrice <= sl[:, None]), axis=1)
+        # buy levels: (variant, level, bar) masks
+        triggered = firstIndex(close[None, None, :] > candleAbove[:, :, None])
+        buyStart = np.where(np.isnan(candleAbove), 0, triggered + 1)
+        buyFill = firstIndex((low[None, None, :] <= buyPrice[:, :, None]) & (bars >= buyStart[:, :, None]))
+        boughtAmount = buyAmount * (1 - coinFee[:, None])
+
+        # coins bought until the end of each bar, and the bars in which the sell levels are placed and filled
+        bought = np.zeros((len(definitions), numBars + 1))
+        rows = np.repeat(np.arange(len(definitions)), numBuys)
+        np.add.at(bought, (rows, buyFill.ravel()), boughtAmount.ravel())
+        coins = initCoins[:, None] + np.cumsum(bought, axis=1)[:, :numBars]
+        needed = np.cumsum(sellAmount, axis=1)
+        sellPlaced = firstIndex(coins[:, None, :] >= needed[:, :, None] - 1e-12)
+        sellFill = firstIndex((high[None, None, :] >= sellPrice[:, :, None]) & (bars > sellPlaced[:, :, None]))
+
+        # stop-loss of each bar: the fixed one, raised by the trailing stop-loss once all buy levels are filled
+        allBought = np.max(np.where(realBuy, buyFill, -1), axis=1, initial=-1)
+        trail = np.where(relative[:, None], close[None, :] * (1 - offset[:, None]), close[None, :] - offset[:, None])
+        trail = np.where(bars[None, :] >= allBought[:, None], trail, -np.inf)
+        trail = np.maximum.accumulate(np.where(np.isnan(trail), -np.inf, trail), axis=1)
+        trail = np.concatenate([np.full((len(definitions), 1), -np.inf), trail[:, :-1]], axis=1)
+        stopLoss = np.fmax(sl[:, None], np.where(np.isinf(trail), np.nan, trail))
+        slHit = firstIndex(low[None, :] <= stopLoss)
+
+        # the trade set ends with the stop-loss or when all levels are filled
+        lastFill = np.maximum(np.max(np.where(realBuy, buyFill, -1), axis=1, initial=-1),
+                              np.max(np.where(realSell, sellFill, -1), axis=1, initial=-1))
+        hasLevels = realBuy.any(axis=1) | realSell.any(axis=1)
+        completed = hasLevels & (lastFill < numBars) & (lastFill < slHit)
+        stopped = ~completed & (slHit < numBars)
+        end = np.where(completed, lastFill, np.where(stopped, slHit, numBars - 1))
+
+        buyDone = realBuy & (buyFill <= end[:, None]) & (buyFill < numBars)
+        sellDone = realSell & (sellFill < numBars) & (~stopped[:, None] | (sellFill < slHit[:, None]))
+        costIn = np.sum(np.where(buyDone, buyPrice * buyAmount, 0.), axis=1) + \
+            np.where((initCoins > 0) & ~np.isnan(initPrice), initCoins * initPrice, 0.)
+        costOut = np.sum(np.where(sellDone, sellPrice * sellAmount, 0.), axis=1)
+        remaining = initCoins + np.sum(np.where(buyDone, boughtAmount, 0.), axis=1) - \
+            np.sum(np.where(sellDone, sellAmount, 0.), axis=1)
+        remaining = np.maximum(remaining, 0.)
+        # the remaining coins are sold by the stop-loss or valued at the close of the last bar
+        exitPrice = np.where(stopped, np.minimum(stopLoss[np.arange(len(definitions)), end], openPrice[end]), close[end])
+        exitCost = remaining * exitPrice
+        fees = np.sum(np.where(buyDone, buyPrice * buyAmount * maker[:, None], 0.), axis=1) + \
+            np.sum(np.where(sellDone, sellPrice * sellAmount * maker[:, None], 0.), axis=1) + exitCost * taker
+        gain = costOut + exitCost * (1 - taker) - costIn
+        gain[invalid] = np.nan
+        gain[(initCoins > 0) & np.isnan(initPrice)] = np.nan  # like getTradeSetInfo, no gain without initial price
+        gainPercent = np.where(costIn > 0, gain / np.where(costIn > 0, costIn, 1.) * 100, np.nan)
+
+    status = np.where(invalid, 'invalid', np.where(completed, 'completed', np.where(stopped, 'stopLoss', 'open')))
+    return {'status': status, 'gain': gain, 'gainPercent': gainPercent, 'costIn': costIn,
+            'costOut': costOut + np.where(stopped, exitCost, 0.), 'fees': fees,
+            'remainingCoins': np.where(stopped, 0., remaining), 'endBar': end, 'endTime': np.asarray(candles['time'], dtype=float)[end] if 'time' in candles else end,
+            'buysFilled': buyDone.sum(axis=1), 'sellsFilled': sellDone.sum(axis=1),
+            'stopLoss': np.where(stopped, exitPrice, np.nan)}
+
+
+def summarize(definitions, results, top=None, keys=None):
+    # one line per variant, best gain first, showing the values of keys (e.g. the keys of the grid)
+    order = np.argsort(-np.nan_to_num(results['gain'], nan=-np.inf))[:top]
+    lines = ['%12s %9s %10s %5s %5s  %s' % ('gain', 'gain %', 'status', 'buys', 'sells', 'variant')]
+    for i in order:
+        variant = definitions[i] if keys is None else {key: definitions[i][key] for key in keys}
+        lines.append('%12.6g %9.2f %10s %5d %5d  %s' % (results['gain'][i], results['gainPercent'][i],
+                                                         results['status'][i], results['buysFilled'][i],
+                                                         results['sellsFilled'][i], json.dumps(variant)))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest of EazeBot trade set definitions on historical candles')
+    parser.add_argument('candles', help='.csv, .npy or .npz file with the columns time, open, high, low, close')
+    parser.add_argument('tradeSet', help='json file with the trade set definition, e.g. {"buyLevels": [0.05], '
+                                         '"buyAmounts": [1], "sellLevels": [0.06], "sellAmounts": [0.999], "sl": 0.04}')
+    parser.add_argument('--grid', help='json file with lists of values of definition keys to try all combinations of')
+    parser.add_argument('--top', type=int, default=20, help='number of variants to show')
+    args = parser.parse_args()
+    with open(args.tradeSet, 'r') as fh:
+        definition = json.load(fh)
+    grid = {}
+    if args.grid:
+        with open(args.grid, 'r') as fh:
+            grid = json.load(fh)
+    definitions = variants(definition, grid)
+    results = runBacktest(loadCandles(args.candles), definitions)
+    print(summarize(definitions, results, args.top, sorted(grid) if len(grid) > 0 else None))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the balance ledger which keeps the balance of an account up to date between two fetch_balance
+calls by applying the orders the bot placed, filled and canceled"""
+
+import threading
+import time
+
+
+class balanceLedger:
+    # the balance has the same structure as returned by ccxt's fetch_balance. Placing an order moves its funds from
+    # free to used, a fill or cancel releases them and books the executed part. Events the ledger cannot account for
+    # (orders it did not see being placed, missing fill information, negative balances) mark it as drifted, which
+    # makes the trade handler reconcile it with fetch_balance at the next update
+    reconcileInterval = 600  # seconds after which the ledger is reconciled even if it did not drift
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.balance = {'free': {}, 'used': {}, 'total': {}}
+        self.orders = {}  # oid -> (symbol, side, amount, price) of the funds reserved by the open order
+        self.reconciled = 0
+        self.drifted = True
+        self.driftReason = 'not loaded yet'
+        self.numReconciles = 0
+
+    def needsReconcile(self):
+        return self.drifted or time.time() - self.reconciled > self.reconcileInterval
+
+    def markDrifted(self, reason):
+        with self.lock:
+            self.drifted = True
+            self.driftReason = reason
+
+    def reconcile(self, balance):
+        # replaces the ledger by the balance fetched from the exchange
+        with self.lock:
+            for key in ['free', 'used', 'total']:
+                balance.setdefault(key, {})
+            self.balance = balance
+            self.reconciled = time.time()
+            self.drifted = False
+            self.driftReason = None
+            self.numReconciles += 1
+
+    def adjust(self, currency, free=0., used=0.):
+        # has to be called while holding the lock
+        if currency not in self.balance:
+            self.balance[currency] = {'free': 0., 'used': 0., 'total': 0.}
+        account = self.balance[currency]
+        account['free'] = (account['free'] or 0.) + free
+        account['used'] = (account['used'] or 0.) + used
+        account['total'] = (account['total'] or 0.) + free + used
+        for key in ['free', 'used', 'total']:
+            self.balance[key][currency] = account[key]
+        if account['free'] < -1e-8 or account['used'] < -1e-8:  # the ledger assumed something wrong
+            self.drifted = True
+            self.driftReason = 'negative %s balance' % currency
+
+    @staticmethod
+    def currencies(symbol):
+        base, quote = symbol.split('/')
+        return base, quote
+
+    def orderPlaced(self, oid, symbol, side, amount, price=None):
+        # reserves the funds of a new order (market buys cannot be reserved as their cost is unknown)
+        base, quote = self.currencies(symbol)
+        with self.lock:
+            if side == 'sell':
+                self.adjust(base, -amount, amount)
+            elif price is not None:
+                self.adjust(quote, -amount * price, amount * price)
+            else:
+                return
+            self.orders[oid] = (symbol, side, amount, price)
+
+    def orderDone(self, orderInfo, side=None):
+        # releases the funds of a filled or canceled order and books its (partly) executed amount, fee included
+        with self.lock:
+            reserved = self.orders.pop(orderInfo['id'], None)
+            if reserved is None and side is None:
+                self.drifted = True
+                self.driftReason = 'unknown order %s' % orderInfo['id']
+                return
+            symbol = orderInfo.get('symbol') or reserved[0]
+            side = reserved[1] if reserved is not None else side
+            base, quote = self.currencies(symbol)
+            if reserved is None and orderInfo.get('type') != 'market':
+                # order placed before the ledger was loaded (e.g. open across a restart), so its funds are part of the
+                # used balance of the last reconcile
+                if orderInfo.get('amount') is not None and (side == 'sell' or orderInfo.get('price') is not None):
+                    reserved = (symbol, side, orderInfo['amount'], orderInfo.get('price'))
+                else:
+                    self.drifted = True
+                    self.driftReason = 'unknown reservation of order %s' % orderInfo['id']
+            filled = orderInfo.get('filled')
+            cost = orderInfo.get('cost')
+            if filled is None or (filled > 0 and cost is None and orderInfo.get('price') is None):
+                self.drifted = True
+                self.driftReason = 'no fill information of order %s' % orderInfo['id']
+                filled = 0.
+            if cost is None:
+                cost = filled * orderInfo['price'] if filled > 0 else 0.
+            if side == 'sell':
+                if reserved is not None:
+                    self.adjust(base, reserved[2] - filled, -reserved[2])
+                else:
+                    self.adjust(base, -filled)
+                self.adjust(quote, cost)
+            else:
+                if reserved is not None and reserved[3] is not None:
+                    self.adjust(quote, reserved[2] * reserved[3] - cost, -reserved[2] * reserved[3])
+                else:
+                    self.adjust(quote, -cost)
+                self.adjust(base, filled)
+            fee = orderInfo.get('fee')
+            if filled > 0 and fee is not None and fee.get('cost'):
+                self.adjust(fee['currency'], -fee['cost'])
+            elif filled > 0 and fee is None:
+                # fee is unknown, e.g. as it is paid in another currency (BNB), so check the balance soon
+                self.drifted = True
+                self.driftReason = 'unknown fee of order %s' % orderInfo['id']
+
+    def orderCanceled(self, oid):
+        # releases the funds of an order which was canceled without knowing if it was partly filled
+        with self.lock:
+            reserved = self.orders.pop(oid, None)
+            if reserved is not None:
+                base, quote = self.currencies(reserved[0])
+                if reserved[1] == 'sell':
+                    self.adjust(base, reserved[2], -reserved[2])
+                elif reserved[3] is not None:
+                    self.adjust(quote, reserved[2] * reserved[3], -reserved[2] * reserved[3])
+            self.drifted = True
+            self.driftReason = 'canceled order %s' % oid
+
+    def status(self):
+        with self.lock:
+            return {'reconciled': self.reconciled, 'drifted': self.drifted, 'reason': self.driftReason,
+                    'openOrders': len(self.orders), 'reconciles': self.numReconciles}
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the end-to-end benchmark of the trade handlers and the job loop against simulated exchanges.
+Run it e.g. with python benchmark.py --users 2 --exchanges 2 --tradesets 500 --levels 4 --output run.json and compare
+two runs with --compare old.json"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import ccxt
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+if __name__ == '__main__' or os.path.isfile('tradeHandler.py'):
+    from tradeHandler import tradeHandler
+    from simulatedExchange import simulatedExchange
+    from levels import compareLevelStorage
+    from stopLossBook import benchmarkStopLossBook
+else:
+    from eazebot.tradeHandler import tradeHandler
+    from eazebot.simulatedExchange import simulatedExchange
+    from eazebot.levels import compareLevelStorage
+    from eazebot.stopLossBook import benchmarkStopLossBook
+
+
+def importBot():
+    # the job functions need the telegram package, so the bot module is only imported if they are benchmarked
+    if os.path.isfile('EazeBot.py'):
+        import EazeBot
+    else:
+        from eazebot import EazeBot
+    return EazeBot
+
+
+class fakeUpdater:
+    # the parts of the telegram updater and job which are used by the job functions
+    class dispatcher:
+        user_data = {}
+
+    def __init__(self, userData):
+        self.dispatcher = fakeUpdater.dispatcher()
+        self.dispatcher.user_data = userData
+        self.context = self
+
+
+def buildUserData(users, exchanges, tradeSets, levels):
+    # creates users x exchanges trade handlers with tradeSets trade sets each, half of the levels of a trade set are
+    # buy levels below the price and half sell levels above it
+    userData = {}
+    for iUser in range(users):
+        userId = 1000 + iUser
+        userData[userId] = {'chatId': userId, 'trade': {}}
+        for iExchange in range(exchanges):
+            name = 'simulated%d' % iExchange
+            ct = tradeHandler(name, 'key%d' % iUser, 'secret', messagerFct=lambda a, b='info': None)
+            symbols = sorted(ct.exchange.prices)
+            numBuy = levels // 2
+            numSell = levels - numBuy
+            for iTs in range(tradeSets):
+                symbol = symbols[iTs % len(symbols)]
+                price = ct.exchange.prices[symbol]
+                amount = 1000 * ct.exchange.markets[symbol]['limits']['amount']['min']
+                spread = 0.001 * (1 + iTs % 10)
+                ct.newTradeSet(symbol, [price * (1 - spread * (i + 1)) for i in range(numBuy)], [amount] * numBuy,
+                               [price * (1 + spread * (i + 1)) for i in range(numSell)],
+                               [amount * numBuy / numSell] * numSell if numSell > 0 else [], sl=price * 0.5,
+                               force=True)
+            userData[userId]['trade'][name] = ct
+    return userData
+
+
+def handlers(userData):
+    return [ct for user in userData for ct in userData[user]['trade'].values()]
+
+
+def movePrices(userData, cycle, amplitude=0.004):
+    # moves the prices alternately below and above their start value and further away in each cycle, so that buy and
+    # sell levels keep being filled
+    for ct in handlers(userData):
+        if not hasattr(ct, 'startPrices'):
+            ct.startPrices = dict(ct.exchange.prices)
+        for symbol, price in ct.startPrices.items():
+            ct.exchange.setPrice(symbol, price * (1 + amplitude * cycle * (-1) ** cycle))
+
+
+def callCounts(userData):
+    counts = {}
+    for ct in handlers(userData):
+        for method, count in ct.exchange.requestCounts.items():
+            counts[method] = counts.get(method, 0) + count
+    return counts
+
+
+def lockWaits(userData):
+    waits = {'acquisitions': 0, 'contended': 0, 'waitTime': 0., 'maxWait': 0.}
+    for ct in handlers(userData):
+        stats = ct.getLockStats()
+        for key in ['acquisitions', 'contended', 'waitTime']:
+            waits[key] += stats[key]
+        waits['maxWait'] = max(waits['maxWait'], stats['maxWait'])
+    return waits
+
+
+def measure(userData, fct, traceMemory=False):
+    # wall time, exchange calls by method, lock waits and memory of one phase
+    callsBefore = callCounts(userData)
+    waitsBefore = lockWaits(userData)
+    if traceMemory:
+        tracemalloc.start()
+    started = time.time()
+    fct()
+    wallTime = time.time() - started
+    result = {'wallTime': wallTime}
+    if traceMemory:
+        result['peakMemory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    elif resource is not None:
+        result['maxRss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    calls = callCounts(userData)
+    result['calls'] = {method: calls[method] - callsBefore.get(method, 0) for method in calls
+                       if calls[method] > callsBefore.get(method, 0)}
+    waits = lockWaits(userData)
+    result['lockWait'] = {'contended': waits['contended'] - waitsBefore['contended'],
+                          'waitTime': waits['waitTime'] - waitsBefore['waitTime'], 'maxWait': waits['maxWait']}
+    return result
+
+
+def runBenchmark(users=1, exchanges=1, tradeSets=100, levels=4, cycles=3, traceMemory=False, micro=True):
+    # runs all phases and returns the results as a dict that can be written as json
+    simulation = simulatedExchange.simulation
+    # fills must only depend on the price moves of the benchmark, and the request scheduler must not throttle it
+    simulatedExchange.simulation = dict(simulation, volatility=0., rateLimit=0.001, seed=0,
+                                        balance={'BTC': 1e9, 'ETH': 1e9, 'USDT': 1e12})
+    folder = tempfile.mkdtemp(prefix='eazebotBenchmark')
+    cwd = os.getcwd()
+    try:
+        bot = importBot()
+        botError = None
+    except Exception as e:
+        bot = None
+        botError = str(e)
+    phases = {}
+    try:
+        os.chdir(folder)  # markets cache and saved data go to the temporary folder
+        userData = {}
+
+        def build():
+            userData.update(buildUserData(users, exchanges, tradeSets, levels))
+
+        phases['build'] = measure(userData, build, traceMemory)
+
+        def update():
+            for cycle in range(cycles):
+                movePrices(userData, cycle + 1)
+                for ct in handlers(userData):
+                    ct.update()
+
+        phases['update'] = measure(userData, update, traceMemory)
+
+        def info():
+            for ct in handlers(userData):
+                for iTs in list(ct.tradeSets):
+                    ct.getTradeSetInfo(iTs)
+
+        phases['getTradeSetInfo'] = measure(userData, info, traceMemory)
+        # twice, as the second run of the batched rendering is served from the cache of the status texts
+        phases['getTradeSetInfos'] = measure(userData, lambda: [ct.getTradeSetInfos() for ct in handlers(userData)
+                                                                for repeat in range(2)], traceMemory)
+
+        if bot is not None:
+            updater = fakeUpdater(userData)
+            bot.__config__.update({'telegramUserId': list(userData), 'maxWorkers': 8, 'laneTimeout': 600})
+
+            def job():
+                for cycle in range(cycles):
+                    movePrices(userData, cycles + cycle + 1)
+                    bot.updateTradeSets(None, updater)
+
+            phases['updateTradeSets'] = measure(userData, job, traceMemory)
+            phases['save_data'] = measure(userData, lambda: bot.save_data(updater), traceMemory)
+            phases['save_data']['fileSize'] = os.path.getsize('data.pickle')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+        simulatedExchange.simulation = simulation
+    numTradeSets = sum(len(ct.tradeSets) for ct in handlers(userData))
+    for phase in phases.values():
+        phase['perTradeSet'] = phase['wallTime'] / max(1, users * exchanges * tradeSets)
+    result = {'parameters': {'users': users, 'exchanges': exchanges, 'tradeSets': tradeSets, 'levels': levels,
+                             'cycles': cycles, 'traceMemory': traceMemory},
+              'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                              'ccxt': ccxt.__version__, 'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+              'remainingTradeSets': numTradeSets,
+              'phases': phases}
+    if botError is not None:
+        result['skipped'] = {'updateTradeSets': botError, 'save_data': botError}
+    if micro:
+        result['micro'] = {'levelStorage': compareLevelStorage(), 'stopLossBook': benchmarkStopLossBook()}
+    return result
+
+
+def compareResults(result, baseline, tolerance=0.2):
+    # returns the regressions of result against baseline: phases that took more than (1 + tolerance) times as long or
+    # made more exchange calls. Runs with other parameters cannot be compared
+    if result['parameters'] != baseline['parameters']:
+        return ['parameters differ: %s vs. %s' % (result['parameters'], baseline['parameters'])]
+    regressions = []
+    for name, phase in result['phases'].items():
+        if name not in baseline['phases']:
+            continue
+        old = baseline['phases'][name]
+        if phase['wallTime'] > old['wallTime'] * (1 + tolerance):
+            regressions.append('%s: wall time %.3f s instead of %.3f s' % (name, phase['wallTime'], old['wallTime']))
+        for method, count in phase['calls'].items():
+            if count > old['calls'].get(method, 0):
+                regressions.append('%s: %d %s calls instead of %d' % (name, count, method, old['calls'].get(method, 0)))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of EazeBot against simulated exchanges')
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--exchanges', type=int, default=1)
+    parser.add_argument('--tradesets', type=int, default=1000, help='trade sets per user and exchange')
+    parser.add_argument('--levels', type=int, default=4, help='buy plus sell levels per trade set')
+    parser.add_argument('--cycles', type=int, default=3, help='update cycles per phase')
+    parser.add_argument('--tracememory', action='store_true', help='trace the peak memory (slows down all phases)')
+    parser.add_argument('--nomicro', action='store_true', help='skip the micro benchmarks of levels and stop-losses')
+    parser.add_argument('--output', help='json file for the results (default: print them)')
+    parser.add_argument('--compare', help='json file of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative increase of the wall times')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)  # the bot module logs each job run
+    result = runBenchmark(args.users, args.exchanges, args.tradesets, args.levels, args.cycles, args.tracememory,
+                          not args.nomicro)
+    if args.compare:
+        with open(args.compare, 'r') as fh:
+            result['regressions'] = compareResults(result, json.load(fh), args.tolerance)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(result, fh, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+    if len(result.get('regressions', [])) > 0:
+        sys.exit(1)
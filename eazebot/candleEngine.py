@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the candle engine which checks the closes of OHLCV candles for the conditional buy levels"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class candleEngine:
+    # fetches the closed candles of the symbols with pending candleAbove buy levels and keeps them in a cache, so that
+    # only candles newer than the cached ones are requested. A level triggers if any candle that closed after the
+    # trade set was last checked closed above it, which also catches up on closes missed while the bot was down
+    timeframe = '1d'
+    maxCandles = 100  # cached closed candles per symbol
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.lock = threading.Lock()
+        self.candles = {}  # (symbol, timeframe) -> list of closed candles [open time (ms), open, high, low, close, volume]
+        self.numRequests = 0
+
+    def duration(self):
+        # length of a candle in ms
+        return self.exchange.parse_timeframe(self.timeframe) * 1000
+
+    def lastClosed(self, now=None):
+        # open time (ms) of the newest candle that is closed at now
+        if now is None:
+            now = time.time()
+        duration = self.duration()
+        return int(now * 1000 // duration) * duration - duration
+
+    def closedCandles(self, symbol, since, safeRun=None, now=None):
+        # returns the cached closed candles of the symbol opened after since (ms), fetching the missing ones
+        if safeRun is None:
+            safeRun = lambda func: func()
+        key = (symbol, self.timeframe)
+        lastClosed = self.lastClosed(now)
+        with self.lock:
+            cached = self.candles.get(key, [])
+            if len(cached) > 0 and cached[0][0] - self.duration() > since:
+                cached = []  # candles older than the cached ones are needed
+            if len(cached) == 0 or cached[-1][0] < lastClosed:
+                fetchSince = cached[-1][0] + 1 if len(cached) > 0 else since + 1
+                if self.exchange.has.get('fetchOHLCV'):
+                    response = safeRun(lambda: self.exchange.fetchOHLCV(symbol, self.timeframe, fetchSince))
+                    self.numRequests += 1
+                    new = [candle for candle in response if fetchSince <= candle[0] <= lastClosed]
+                else:
+                    # no candles available, so the current price is taken as the close of the candle that just closed
+                    ticker = safeRun(lambda: self.exchange.fetchTicker(symbol))
+                    self.numRequests += 1
+                    new = [[lastClosed, None, None, None, ticker['last'], None]]
+                cached = (cached + new)[-self.maxCandles:]
+                self.candles[key] = cached
+            return [candle for candle in cached if candle[0] > since]
+
+    def evaluate(self, levels, safeRun=None, now=None):
+        # levels is a list of (symbol, candleAbove, since) with since the open time (ms) of the newest candle already
+        # checked for this level. Returns an array with the highest close above candleAbove of each level (nan if it
+        # did not trigger) and a dict with the open time of the newest closed candle received per symbol. Candles the
+        # exchange did not publish yet are missing there, so they are checked next time
+        if len(levels) == 0:
+            return np.array([]), {}
+        symbols = sorted(set(level[0] for level in levels))
+        since = {symbol: min(level[2] for level in levels if level[0] == symbol) for symbol in symbols}
+        candles = [self.closedCandles(symbol, since[symbol], safeRun, now) for symbol in symbols]
+        newest = {symbol: rows[-1][0] for symbol, rows in zip(symbols, candles) if len(rows) > 0}
+        # one row per symbol, padded with nan, so that all levels are compared at once
+        width = max([len(rows) for rows in candles] + [1])
+        times = np.full((len(symbols), width), -np.inf)
+        closes = np.full((len(symbols), width), np.nan)
+        for i, rows in enumerate(candles):
+            times[i, :len(rows)] = [candle[0] for candle in rows]
+            closes[i, :len(rows)] = [np.nan if candle[4] is None else candle[4] for candle in rows]
+        symbolIndex = {symbol: i for i, symbol in enumerate(symbols)}
+        idx = np.array([symbolIndex[level[0]] for level in levels], dtype=np.intp)
+        above = np.array([level[1] for level in levels], dtype=float)
+        levelSince = np.array([level[2] for level in levels], dtype=float)
+        with np.errstate(invalid='ignore'):
+            closesAbove = np.where((times[idx] > levelSince[:, None]) & (closes[idx] > above[:, None]), closes[idx],
+                                   np.nan)
+        triggered = ~np.all(np.isnan(closesAbove), axis=1)
+        result = np.full(len(levels), np.nan)
+        result[triggered] = np.nanmax(closesAbove[triggered], axis=1)
+        return result, newest
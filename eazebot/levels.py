@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the compact record used for the buy and sell levels of a trade set"""
+
+
+def toFloat(value):
+    return None if value is None else float(value)
+
+
+class tradeLevel:
+    # one buy or sell level. It behaves like the dicts that were used before (level['price'], 'oid' in level,
+    # level.update(...)), but uses slots instead of a dict per level and pickles as a plain tuple
+    __slots__ = ('oid', 'price', 'amount', 'actualAmount', 'candleAbove')
+
+    def __init__(self, oid=None, price=None, amount=None, actualAmount=None, candleAbove=None):
+        self.oid = oid
+        self.price = toFloat(price)
+        self.amount = toFloat(amount)
+        self.actualAmount = toFloat(actualAmount)
+        self.candleAbove = toFloat(candleAbove)
+
+    @classmethod
+    def fromDict(cls, level):
+        # converts a level of old pickles (dict) to a tradeLevel
+        if isinstance(level, cls):
+            return level
+        return cls(**{key: level[key] for key in cls.__slots__ if key in level})
+
+    def __reduce__(self):
+        args = (self.oid, self.price, self.amount, self.actualAmount, self.candleAbove)
+        while len(args) > 3 and args[-1] is None:  # sell levels have neither actualAmount nor candleAbove
+            args = args[:-1]
+        return (self.__class__, args)
+
+    def __copy__(self):
+        return self.__class__(self.oid, self.price, self.amount, self.actualAmount, self.candleAbove)
+
+    def __deepcopy__(self, memo):
+        # all fields are immutable, so a deep copy is a shallow copy
+        return self.__copy__()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value if key == 'oid' else toFloat(value))
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def update(self, changes=(), **kwargs):
+        for key, value in dict(changes, **kwargs).items():
+            self[key] = value
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+    def __eq__(self, other):
+        if isinstance(other, tradeLevel):
+            return self.items() == other.items()
+        return NotImplemented
+
+    def __repr__(self):
+        return 'tradeLevel(%s)' % ', '.join('%s=%r' % item for item in self.items())
+
+
+def compareLevelStorage(num=10000):
+    # memory and pickle size of num levels stored as dicts (old format) and as tradeLevels
+    import copy
+    import pickle
+    import sys
+    import time
+
+    levels = [{'oid': 'filled' if i % 3 == 0 else (None if i % 3 == 1 else '%012d' % i), 'price': 0.01 + i * 1e-6,
+               'amount': 1. + i * 1e-3, 'actualAmount': 0.999 + i * 1e-3, 'candleAbove': None} for i in range(num)]
+    results = {}
+    for name, store in [('dict', levels), ('tradeLevel', [tradeLevel.fromDict(level) for level in levels])]:
+        # size of the containers plus the float objects they hold; strings and None are shared between both formats
+        memory = sys.getsizeof(store) + sum(sys.getsizeof(level) + sum(sys.getsizeof(val) for val in (
+            level['price'], level['amount'], level['actualAmount'])) for level in store)
+        start = time.time()
+        copy.deepcopy(store)
+        copyTime = time.time() - start
+        results[name] = {'memory': memory, 'pickle': len(pickle.dumps(store, pickle.HIGHEST_PROTOCOL)),
+                         'deepcopy': copyTime}
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in compareLevelStorage().items():
+        print('%-10s  memory %8d bytes  pickle %8d bytes  deepcopy %.1f ms' % (
+            name, result['memory'], result['pickle'], result['deepcopy'] * 1000))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the locks used to avoid that two threads change a trade set at the same time"""
+
+import threading
+import time
+from collections import deque
+
+
+class lockStats:
+    # collects how often and how long threads had to wait for the locks of a trade handler
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.waitTime = 0.
+        self.maxWait = 0.
+
+    def add(self, waited, contended):
+        with self.lock:
+            self.acquisitions += 1
+            if contended:
+                self.contended += 1
+                self.waitTime += waited
+                self.maxWait = max(self.maxWait, waited)
+
+    def asDict(self):
+        with self.lock:
+            return {'acquisitions': self.acquisitions, 'contended': self.contended, 'waitTime': self.waitTime,
+                    'maxWait': self.maxWait}
+
+
+class fifoLock:
+    # reentrant lock that is granted to waiting threads in the order of their arrival
+
+    def __init__(self, stats=None):
+        self.condition = threading.Condition(threading.Lock())
+        self.waiting = deque()
+        self.owner = None
+        self.count = 0
+        self.stats = stats if stats is not None else lockStats()
+
+    def acquire(self, timeout=None):
+        me = threading.get_ident()
+        with self.condition:
+            if self.owner == me:
+                self.count += 1
+                return True
+            if self.owner is None and len(self.waiting) == 0:
+                self.owner = me
+                self.count = 1
+                self.stats.add(0., False)
+                return True
+            start = time.time()
+            self.waiting.append(me)
+            while self.owner is not None or self.waiting[0] != me:
+                remaining = None if timeout is None else timeout - (time.time() - start)
+                if remaining is not None and remaining <= 0:
+                    self.waiting.remove(me)
+                    self.condition.notify_all()
+                    return False
+                self.condition.wait(remaining)
+            self.waiting.popleft()
+            self.owner = me
+            self.count = 1
+            self.stats.add(time.time() - start, True)
+            return True
+
+    def release(self):
+        with self.condition:
+            if self.owner != threading.get_ident():
+                raise RuntimeError('Cannot release a lock that is owned by another thread')
+            self.count -= 1
+            if self.count == 0:
+                self.owner = None
+                self.condition.notify_all()
+
+    def locked(self):
+        return self.owner is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the market data hub and the markets cache which share public market data of an exchange
+between all trade handlers"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+_hubs = {}
+_hubsLock = threading.Lock()
+
+
+def getMarketsCache():
+    return _marketsCache
+
+
+def getMarketDataHub(exchange):
+    # returns the process-wide hub for this exchange (keyed by the ccxt exchange id), creating it on first use
+    with _hubsLock:
+        if exchange.id not in _hubs:
+            _hubs[exchange.id] = marketDataHub(exchange)
+        return _hubs[exchange.id]
+
+
+class marketDataHub:
+    maxAge = 20  # seconds a cached ticker is served before it is fetched again
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.tickers = {}
+        self.timestamps = {}
+        self.allTimestamp = 0
+        self.lock = threading.Lock()  # held only to read and write the cache, not during requests
+        self.inFlight = {}  # 'all' or symbol -> future of the running request
+        self.numRequests = 0
+
+    def isFresh(self, symbol, maxAge, now):
+        return symbol in self.tickers and now - self.timestamps[symbol] <= maxAge
+
+    def getTicker(self, symbol, safeRun=None, maxAge=None):
+        return self.getTickers([symbol], safeRun, maxAge)[symbol]
+
+    def getTickers(self, symbols=None, safeRun=None, maxAge=None):
+        # returns the tickers of the given symbols (all symbols of the exchange if None) from the cache and fetches
+        # all outdated ones with one fetchTickers request. safeRun is the retry function of the calling trade handler
+        if maxAge is None:
+            maxAge = self.maxAge
+        if safeRun is None:
+            safeRun = lambda func: func()
+        with self.lock:
+            now = time.time()
+            if symbols is None:
+                stale = now - self.allTimestamp > maxAge
+            else:
+                stale = [symbol for symbol in symbols if not self.isFresh(symbol, maxAge, now)]
+        if stale and self.exchange.has['fetchTickers']:
+            self.fetchShared('all', lambda: self.store(safeRun(lambda: self.exchange.fetchTickers()), True))
+        if symbols is None:
+            with self.lock:
+                return dict(self.tickers)
+        # symbols that were not included in fetchTickers (some ccxt problems) or exchanges without fetchTickers
+        for symbol in symbols:
+            with self.lock:
+                fresh = self.isFresh(symbol, maxAge, now)
+            if not fresh:
+                self.fetchShared(symbol, lambda: self.store({symbol: safeRun(lambda: self.exchange.fetchTicker(symbol))}))
+        with self.lock:
+            return {symbol: self.tickers[symbol] for symbol in symbols}
+
+    def fetchShared(self, key, fetch):
+        # runs fetch, or waits for the result if the same request is already running in another thread. The lock is
+        # not held during the request, so that a slow or failing request (with all its retries) does not block the
+        # cached tickers and the other requests of the exchange
+        with self.lock:
+            future = self.inFlight.get(key)
+            owner = future is None
+            if owner:
+                future = self.inFlight[key] = Future()
+        if owner:
+            try:
+                future.set_result(fetch())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.inFlight.pop(key, None)
+        return future.result()
+
+    def store(self, tickers, complete=False):
+        with self.lock:
+            self.numRequests += 1
+            now = time.time()
+            for symbol in tickers:
+                self.tickers[symbol] = tickers[symbol]
+                self.timestamps[symbol] = now
+            if complete:
+                self.allTimestamp = now
+
+
+class marketsCache:
+    # keeps the markets metadata of each exchange in memory and on disk, so that it is downloaded at most once per
+    # maxAge seconds and a restarted bot does not have to download it at all
+    maxAge = 3600
+    folder = 'marketsCache'
+
+    def __init__(self):
+        self.lock = threading.Lock()  # guards the creation of the locks of the exchanges
+        self.locks = {}  # exchange id -> lock held while its markets are loaded
+        self.entries = {}
+
+    def exchangeLock(self, exchangeId):
+        # one lock per exchange, so that loading the markets of one exchange (with all its retries) does not stall the
+        # others
+        with self.lock:
+            if exchangeId not in self.locks:
+                self.locks[exchangeId] = threading.Lock()
+            return self.locks[exchangeId]
+
+    def fileName(self, exchangeId):
+        return os.path.join(self.folder, '%s.json' % exchangeId)
+
+    def readFile(self, exchangeId):
+        try:
+            with open(self.fileName(exchangeId), 'r') as fh:
+                entry = json.load(fh)
+            return entry['timestamp'], entry['markets'], entry['currencies']
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def writeFile(self, exchangeId, entry):
+        try:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            tmpName = self.fileName(exchangeId) + '.tmp'
+            with open(tmpName, 'w') as fh:
+                json.dump({'timestamp': entry[0], 'markets': entry[1], 'currencies': entry[2]}, fh)
+            os.replace(tmpName, self.fileName(exchangeId))
+        except (IOError, TypeError, ValueError) as e:
+            logging.warning('Could not write markets cache of %s: %s' % (exchangeId, str(e)))
+
+    def load(self, exchange, safeRun=None, loadedStamp=None):
+        # makes sure the markets of the exchange instance are loaded and not older than maxAge. Returns the time stamp
+        # of the markets, which has to be given as loadedStamp next time to avoid setting the same markets again
+        if safeRun is None:
+            safeRun = lambda func: func()
+        with self.exchangeLock(exchange.id):
+            entry = self.entries.get(exchange.id)
+            if entry is None or time.time() - entry[0] > self.maxAge:
+                entry = self.readFile(exchange.id)
+                if entry is not None and time.time() - entry[0] > self.maxAge:
+                    entry = None
+                if entry is None:
+                    safeRun(lambda: exchange.loadMarkets(True))
+                    entry = (time.time(), exchange.markets, exchange.currencies)
+                    self.writeFile(exchange.id, entry)
+                    loadedStamp = entry[0]
+                self.entries[exchange.id] = entry
+            if loadedStamp != entry[0]:
+                exchange.set_markets(entry[1], entry[2])
+            return entry[0]
+
+    def invalidate(self, exchangeId):
+        # forgets the markets of the exchange, e.g. after an order was rejected because of changed precision or limits
+        with self.exchangeLock(exchangeId):
+            self.entries.pop(exchangeId, None)
+            try:
+                os.remove(self.fileName(exchangeId))
+            except OSError:
+                pass
+
+
+_marketsCache = marketsCache()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the counters and latency histograms of the exchange and telegram requests and the job cycles,
+and the local http endpoint serving them in the Prometheus text format"""
+
+import bisect
+import contextlib
+import functools
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# upper bounds of the latency histograms in seconds
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+JOB_BUCKETS = (0.1, 0.5, 1., 2.5, 5., 10., 30., 60., 120., 300.)
+
+
+class metricsRegistry:
+    # counters and histograms, each identified by its name and a tuple of (label, value) pairs
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.descriptions = {}  # name -> (type, help text)
+        self.counters = {}  # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: [counts per bucket, sum, count]}
+        self.buckets = {}  # name -> upper bounds of the histogram buckets
+
+    def counter(self, name, text):
+        self.descriptions[name] = ('counter', text)
+        self.counters.setdefault(name, {})
+
+    def histogram(self, name, text, buckets=DEFAULT_BUCKETS):
+        self.descriptions[name] = ('histogram', text)
+        self.histograms.setdefault(name, {})
+        self.buckets[name] = tuple(buckets)
+
+    def inc(self, name, labels, value=1):
+        labels = tuple(labels.items())
+        with self.lock:
+            self.counters[name][labels] = self.counters[name].get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        labels = tuple(labels.items())
+        buckets = self.buckets[name]
+        with self.lock:
+            if labels not in self.histograms[name]:
+                self.histograms[name][labels] = [[0] * len(buckets), 0., 0]
+            entry = self.histograms[name][labels]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @staticmethod
+    def formatLabels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if len(labels) == 0:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (key, re.sub(r'(["\\])', r'\\\1', str(value)).replace('\n', '\\n'))
+                                 for key, value in labels)
+
+    def render(self):
+        # all metrics in the Prometheus text exposition format
+        lines = []
+        with self.lock:
+            for name in sorted(self.descriptions):
+                typ, text = self.descriptions[name]
+                lines.append('# HELP %s %s' % (name, text))
+                lines.append('# TYPE %s %s' % (name, typ))
+                if typ == 'counter':
+                    for labels, value in sorted(self.counters[name].items()):
+                        lines.append('%s%s %s' % (name, self.formatLabels(labels), repr(float(value))))
+                else:
+                    for labels, (counts, total, count) in sorted(self.histograms[name].items()):
+                        cumulative = 0
+                        for bound, num in zip(self.buckets[name], counts):
+                            cumulative += num
+                            lines.append('%s_bucket%s %d' % (name, self.formatLabels(labels, [('le', repr(bound))]),
+                                                             cumulative))
+                        lines.append('%s_bucket%s %d' % (name, self.formatLabels(labels, [('le', '+Inf')]), count))
+                        lines.append('%s_sum%s %s' % (name, self.formatLabels(labels), repr(total)))
+                        lines.append('%s_count%s %d' % (name, self.formatLabels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+registry = metricsRegistry()
+registry.counter('eazebot_exchange_requests_total', 'Exchange requests made through safeRun')
+registry.histogram('eazebot_exchange_request_duration_seconds',
+                   'Duration of exchange requests including queueing in the request scheduler and retries')
+registry.counter('eazebot_telegram_requests_total', 'Telegram requests of the bot')
+registry.histogram('eazebot_telegram_request_duration_seconds', 'Duration of telegram requests')
+registry.histogram('eazebot_job_duration_seconds', 'Duration of one cycle of a job', JOB_BUCKETS)
+registry.counter('eazebot_job_runs_total', 'Cycles of a job')
+
+attemptContext = threading.local()
+
+
+def retryLabel(retries):
+    # the number of retries is a label, so it is capped to keep the number of time series small
+    return str(retries) if retries < 3 else '3+'
+
+
+def methodName(func):
+    # name of the ccxt method called by func, which is usually a lambda like lambda: self.exchange.fetchOrder(oid)
+    name = getattr(func, '__name__', None)
+    if name == '<lambda>':
+        names = [n for n in func.__code__.co_names if n != 'exchange']
+        name = names[0] if len(names) > 0 else name
+    if name is None:
+        return 'unknown'
+    # fetch_balance and fetchBalance are counted as the same method
+    return re.sub(r'_([a-z])', lambda match: match.group(1).upper(), name)
+
+
+def recordRequest(exchange, method, outcome, retries, duration):
+    labels = {'exchange': exchange, 'method': method, 'outcome': outcome, 'retries': retryLabel(retries)}
+    registry.inc('eazebot_exchange_requests_total', labels)
+    registry.observe('eazebot_exchange_request_duration_seconds', labels, duration)
+
+
+@contextlib.contextmanager
+def attempt(count):
+    # marks the telegram requests made within the context as the count-th retry
+    previous = getattr(attemptContext, 'count', 0)
+    attemptContext.count = count
+    try:
+        yield
+    finally:
+        attemptContext.count = previous
+
+
+def instrumentBot(bot, methods=('send_message',)):
+    # replaces the methods of the telegram bot by versions that count and time every call
+    for method in methods:
+        func = getattr(bot, method)
+        if getattr(func, 'instrumented', False):
+            continue
+
+        def timed(*args, func=func, method=method, **kwargs):
+            started = time.time()
+            outcome = 'ok'
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                outcome = e.__class__.__name__
+                raise
+            finally:
+                labels = {'method': method, 'outcome': outcome,
+                          'retries': retryLabel(getattr(attemptContext, 'count', 0))}
+                registry.inc('eazebot_telegram_requests_total', labels)
+                registry.observe('eazebot_telegram_request_duration_seconds', labels, time.time() - started)
+        timed.instrumented = True
+        setattr(bot, method, timed)
+
+
+def timedJob(job):
+    # decorator recording the duration and outcome of each cycle of a job function
+    def decorator(fct):
+        @functools.wraps(fct)
+        def wrapper(*args, **kwargs):
+            started = time.time()
+            outcome = 'ok'
+            try:
+                return fct(*args, **kwargs)
+            except Exception as e:
+                outcome = e.__class__.__name__
+                raise
+            finally:
+                registry.observe('eazebot_job_duration_seconds', {'job': job}, time.time() - started)
+                registry.inc('eazebot_job_runs_total', {'job': job, 'outcome': outcome})
+        return wrapper
+    return decorator
+
+
+class metricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # scrapes are not logged
+        pass
+
+
+class metricsServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer only exists from Python 3.7 on
+    daemon_threads = True
+
+
+_server = None
+
+
+def startMetricsServer(port, host='127.0.0.1'):
+    # serves the metrics on http://host:port/metrics in a daemon thread, by default only to the local machine
+    global _server
+    if _server is not None:
+        return _server
+    _server = metricsServer((host, port), metricsRequestHandler)
+    threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+    logging.info('Serving metrics on http://%s:%d/metrics' % (host, _server.server_address[1]))
+    return _server
+
+
+def stopMetricsServer():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the poll scheduler which decides per trade set when its orders have to be checked next"""
+
+import math
+import threading
+import time
+
+
+class pollScheduler:
+    # gives each trade set its own next check time. The time a price needs to move by the relative distance d to the
+    # nearest trigger (open buy/sell order, stop-loss) is estimated as (d / volatility)^2, with the volatility of the
+    # symbol (per square root of a second) estimated from the observed prices. A trade set is checked after a fraction
+    # safety of this time, but not more often than every minInterval and at least every maxInterval seconds. Trade
+    # sets with levels that still have to be placed are due immediately, inactive and idle trade sets are not scheduled
+    minInterval = 10
+    maxInterval = 600
+    safety = 0.25
+    defaultVolatility = 0.0013  # about 1 % per minute, used until enough prices of a symbol were seen
+    volatilityHalfLife = 600  # seconds
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nextCheck = {}  # trade set id -> time stamp of its next check
+        self.lastPrices = {}  # symbol -> (price, time stamp)
+        self.variances = {}  # symbol -> exponentially weighted variance of the log returns per second
+
+    def observe(self, symbol, price, timestamp=None):
+        # updates the volatility estimate of the symbol with a new price
+        if price is None or price <= 0:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            last = self.lastPrices.get(symbol)
+            self.lastPrices[symbol] = (price, timestamp)
+            if last is None or timestamp <= last[1]:
+                return
+            dt = timestamp - last[1]
+            variance = math.log(price / last[0]) ** 2 / dt
+            weight = 1 - 0.5 ** (dt / self.volatilityHalfLife)
+            if symbol in self.variances:
+                self.variances[symbol] += weight * (variance - self.variances[symbol])
+            else:
+                self.variances[symbol] = max(variance, self.defaultVolatility ** 2 / 4)
+
+    def volatility(self, symbol):
+        with self.lock:
+            if symbol in self.variances:
+                return math.sqrt(self.variances[symbol])
+        return self.defaultVolatility
+
+    @staticmethod
+    def triggerDistance(ts, price):
+        # relative distance of the price to the nearest trigger of the trade set, 0 if something has to be placed now
+        # and None if nothing can happen to it
+        distances = []
+        if ts['SL'] is not None:
+            distances.append(price - ts['SL'])
+        for trade in ts['InTrades']:
+            if trade['oid'] is None and trade['candleAbove'] is None:
+                return 0.
+            elif trade['oid'] is not None and trade['oid'] != 'filled':
+                distances.append(price - trade['price'])
+        for trade in ts['OutTrades']:
+            if trade['oid'] is None and ts['coinsAvail'] >= trade['amount']:
+                return 0.
+            elif trade['oid'] is not None and trade['oid'] != 'filled':
+                distances.append(trade['price'] - price)
+        if len(distances) == 0:
+            return None
+        return max(0., min(distances)) / price
+
+    def interval(self, symbol, distance):
+        if distance is None:
+            return self.maxInterval
+        expected = (distance / self.volatility(symbol)) ** 2
+        return min(self.maxInterval, max(self.minInterval, self.safety * expected))
+
+    def schedule(self, iTs, ts, price=None, now=None):
+        # sets the next check time of the trade set after it was checked at now with the price of its symbol
+        if now is None:
+            now = time.time()
+        if not ts['active']:
+            self.unschedule(iTs)
+            return None
+        distance = 0. if price is None else self.triggerDistance(ts, price)
+        nextCheck = now + self.interval(ts['symbol'], distance)
+        with self.lock:
+            self.nextCheck[iTs] = nextCheck
+        return nextCheck
+
+    def isScheduled(self, iTs):
+        with self.lock:
+            return iTs in self.nextCheck
+
+    def unschedule(self, iTs):
+        with self.lock:
+            self.nextCheck.pop(iTs, None)
+
+    def due(self, now=None):
+        # ids of the trade sets whose check is due, earliest first
+        if now is None:
+            now = time.time()
+        with self.lock:
+            return sorted([iTs for iTs in self.nextCheck if self.nextCheck[iTs] <= now], key=self.nextCheck.get)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the precision formatters which round amounts, prices and costs of a market to its precision"""
+
+from decimal import Decimal
+
+# precision modes as defined by ccxt
+DECIMAL_PLACES = 2
+SIGNIFICANT_DIGITS = 3
+TICK_SIZE = 4
+
+
+def stripZeros(string):
+    if '.' in string:
+        return string.rstrip('0').rstrip('.')
+    else:
+        return string
+
+
+def decimalParts(value):
+    # returns the integers mantissa and exponent with abs(value) == mantissa * 10 ** exponent
+    string = repr(abs(float(value)))
+    exponent = 0
+    if 'e' in string:
+        string, exp = string.split('e')
+        exponent = int(exp)
+    if '.' in string:
+        integer, fraction = string.split('.')
+        exponent -= len(fraction)
+        string = integer + fraction
+    return int(string), exponent
+
+
+class tickRounder:
+    # rounds values to a tick size using integer arithmetic. The tick is step/scale, e.g. 0.05 is step 5 and scale 100
+
+    def __init__(self, precision, precisionMode, truncate):
+        self.truncate = truncate
+        self.scale = None
+        if precision is None:
+            return
+        if precisionMode == TICK_SIZE:
+            tick = Decimal(repr(float(precision))).normalize()
+            self.digits = max(0, -tick.as_tuple().exponent)
+            self.scale = 10 ** self.digits
+            self.step = int(tick * self.scale)
+        else:
+            self.digits = max(0, int(precision))
+            self.scale = 10 ** self.digits
+            self.step = 10 ** max(0, -int(precision))
+
+    def ticks(self, value):
+        # number of 1/scale units of the rounded value. The shortest representation of the float (as used by ccxt) is
+        # taken as integer mantissa and exponent, so that e.g. 0.29 is not truncated to 0.28 as 0.29 * 100 would be
+        mantissa, exponent = decimalParts(value)
+        numerator = mantissa * self.scale
+        denominator = self.step
+        if exponent >= 0:
+            numerator *= 10 ** exponent
+        else:
+            denominator *= 10 ** -exponent
+        n, remainder = divmod(numerator, denominator)
+        if not self.truncate and 2 * remainder >= denominator:
+            n += 1
+        return -n * self.step if value < 0 else n * self.step
+
+    def toFloat(self, value):
+        if self.scale is None:
+            return float(value)
+        return self.ticks(value) / self.scale
+
+    def toString(self, value):
+        if self.scale is None:
+            return stripZeros(format(value, '.10f'))
+        ticks = self.ticks(value)
+        integer, fraction = divmod(abs(ticks), self.scale)
+        sign = '-' if ticks < 0 else ''
+        if self.digits == 0:
+            return '%s%d' % (sign, integer)
+        return stripZeros('%s%d.%0*d' % (sign, integer, self.digits, fraction))
+
+
+class precisionFormatter:
+    # rounds amounts (truncated), prices (rounded) and costs (truncated) of one market like ccxt does, but without
+    # calling into ccxt. Markets with significant digits precision are passed to the ccxt functions of the exchange
+
+    def __init__(self, exchange, symbol):
+        market = exchange.markets[symbol]
+        precisionMode = getattr(exchange, 'precisionMode', DECIMAL_PLACES)
+        self.exchange = exchange
+        self.symbol = symbol
+        self.native = precisionMode in [DECIMAL_PLACES, TICK_SIZE]
+        precision = market.get('precision', {})
+        self.amount = tickRounder(precision.get('amount'), precisionMode, True)
+        self.price = tickRounder(precision.get('price'), precisionMode, False)
+        self.cost = tickRounder(precision.get('price'), precisionMode, True)
+
+    def viaExchange(self, fct, value):
+        result = getattr(self.exchange, fct)(self.symbol, value)
+        return result if isinstance(result, str) else format(result, '.10f')
+
+    def amountToFloat(self, value):
+        return self.amount.toFloat(value) if self.native else float(self.viaExchange('amountToPrecision', value))
+
+    def priceToFloat(self, value):
+        return self.price.toFloat(value) if self.native else float(self.viaExchange('priceToPrecision', value))
+
+    def costToFloat(self, value):
+        return self.cost.toFloat(value) if self.native else float(self.viaExchange('costToPrecision', value))
+
+    def amountToString(self, value):
+        return self.amount.toString(value) if self.native else stripZeros(self.viaExchange('amountToPrecision', value))
+
+    def priceToString(self, value):
+        return self.price.toString(value) if self.native else stripZeros(self.viaExchange('priceToPrecision', value))
+
+    def costToString(self, value):
+        return self.cost.toString(value) if self.native else stripZeros(self.viaExchange('costToPrecision', value))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the price feeds which push price updates to the stop-loss evaluators of the trade handlers"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+
+from ccxt.base.errors import ExchangeError, InvalidNonce, NetworkError
+
+if __name__ == '__main__' or os.path.isfile('tradeHandler.py'):
+    from requestScheduler import getRequestScheduler
+else:
+    from eazebot.requestScheduler import getRequestScheduler
+
+_feeds = {}
+_feedsLock = threading.Lock()
+
+
+def getPriceFeed(hub, breaker=None):
+    # returns the process-wide polling feed of the exchange of the market data hub, creating it on first use
+    with _feedsLock:
+        if hub.exchange.id not in _feeds:
+            _feeds[hub.exchange.id] = pollingFeed(hub, breaker)
+        return _feeds[hub.exchange.id]
+
+
+def stopAllFeeds():
+    with _feedsLock:
+        for feed in _feeds.values():
+            feed.stop()
+
+
+class priceFeed:
+    # base class of all feeds. A feed knows its listeners, asks them which symbols they need (listener.symbols()) and
+    # passes new prices to listener.onPrices(prices, timestamp) with prices a dict symbol -> price. Adapters (polling,
+    # streaming, replay) only have to get the prices and call publish or publishSnapshot. Listeners are referenced weakly, so a removed trade handler stops
+    # receiving prices without having to unsubscribe
+
+    def __init__(self):
+        self.listeners = weakref.WeakSet()
+        self.listenersLock = threading.Lock()
+        self.lastPrices = {}
+
+    def addListener(self, listener):
+        with self.listenersLock:
+            self.listeners.add(listener)
+
+    def removeListener(self, listener):
+        with self.listenersLock:
+            self.listeners.discard(listener)
+
+    def getListeners(self):
+        with self.listenersLock:
+            return list(self.listeners)
+
+    def symbols(self):
+        # union of the symbols all listeners are interested in
+        symbols = set()
+        for listener in self.getListeners():
+            symbols.update(listener.symbols())
+        return symbols
+
+    def publish(self, symbol, price, timestamp=None):
+        self.publishSnapshot({symbol: price}, timestamp)
+
+    def publishSnapshot(self, prices, timestamp=None):
+        prices = {symbol: prices[symbol] for symbol in prices if prices[symbol] is not None}
+        if len(prices) == 0:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        for symbol in prices:
+            self.lastPrices[symbol] = (prices[symbol], timestamp)
+        for listener in self.getListeners():
+            try:
+                listener.onPrices(prices, timestamp)
+            except Exception as e:  # one failing listener must not stop the feed for the others
+                logging.error('Price update of %s failed: %s' % (', '.join(prices), str(e)))
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class pollingFeed(priceFeed):
+    # polls the tickers of all needed symbols every interval seconds in its own thread. Tickers are taken from the
+    # market data hub, so they are shared with the trade handlers and no extra requests are made if they are fresh
+    interval = 10
+
+    def __init__(self, hub, breaker=None):
+        super().__init__()
+        self.hub = hub
+        self.breaker = breaker
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def poll(self):
+        # fetches and publishes the prices of all needed symbols once
+        symbols = sorted(self.symbols())
+        if len(symbols) == 0:
+            return
+        probe = False
+        if self.breaker is not None:
+            try:
+                probe = self.breaker.check()
+            except Exception:  # exchange is paused, the trade handlers report this
+                return
+        try:
+            # the request waits for its turn in the request scheduler like those of the trade handlers
+            scheduler = getRequestScheduler(self.hub.exchange)
+            tickers = self.hub.getTickers(symbols, lambda func: scheduler.run(func, 'status', False), maxAge=self.interval)
+        except Exception as e:
+            # only network errors count as failures of the exchange, as in tradeHandler.safeRun
+            if self.breaker is not None:
+                if isinstance(e, NetworkError) and not isinstance(e, InvalidNonce):
+                    self.breaker.recordFailure()
+                elif isinstance(e, ExchangeError):
+                    self.breaker.recordSuccess()  # the exchange answered
+            logging.warning('Price feed of %s could not fetch tickers: %s' % (self.hub.exchange.id, str(e)))
+            return
+        else:
+            if self.breaker is not None:
+                self.breaker.recordSuccess()
+        finally:
+            if probe:
+                self.breaker.endProbe()
+        self.publishSnapshot({symbol: tickers[symbol]['last'] for symbol in symbols if symbol in tickers})
+
+    def run(self):
+        while not self.stopped.is_set():
+            started = time.time()
+            self.poll()
+            self.stopped.wait(max(0, self.interval - (time.time() - started)))
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='priceFeed-%s' % self.hub.exchange.id, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class replayFeed(priceFeed):
+    # in-process feed that replays a given price series, e.g. [('ETH/BTC', 0.05), ('ETH/BTC', 0.049), ...], without
+    # any exchange. step() publishes the next price, run() all remaining prices
+    def __init__(self, prices):
+        super().__init__()
+        self.prices = list(prices)
+        self.position = 0
+
+    def step(self):
+        if self.position >= len(self.prices):
+            return False
+        entry = self.prices[self.position]
+        self.position += 1
+        self.publish(*entry)
+        return True
+
+    def run(self):
+        count = 0
+        while self.step():
+            count += 1
+        return count
+
+
+class stopLossEvaluator:
+    # listener which checks the stop-losses and trailing stop-losses of all trade sets of one trade handler at each
+    # price update with the stop-loss book of the handler
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def symbols(self):
+        return self.handler.stopLossSymbols()
+
+    def onPrices(self, prices, timestamp):
+        self.handler.observePrices(prices, timestamp)
+        self.handler.evaluateStopLosses(prices)
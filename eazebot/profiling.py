@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the on-demand profiler of the running bot, which profiles the next calls of a job or of the
+telegram handlers and writes a pstats file, a collapsed stack file for flame graphs and a summary of the hot functions"""
+
+import contextlib
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# calls that are profiled by one click on the profiling buttons of the settings
+defaultCounts = {'updateTradeSets': 3, 'handlers': 5}
+sessionContext = threading.local()
+
+
+class profileSession:
+    # profile of one call. Every thread working for it (the caller and the lanes it starts) is profiled with cProfile
+    # and additionally sampled every samplingInterval seconds to get the full stacks for the flame graph
+    samplingInterval = 0.005
+
+    def __init__(self, target, name):
+        self.target = target
+        self.name = name
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.threads = set()
+        self.stacks = Counter()
+        self.numSamples = 0
+        self.started = time.time()
+        self.duration = None
+        self.closed = False
+        self.stopSampling = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, name='profiler', daemon=True)
+        self.sampler.start()
+
+    @contextlib.contextmanager
+    def profileThread(self):
+        # profiles the calling thread until the context is left and merges the result into the session
+        ident = threading.get_ident()
+        profile = cProfile.Profile()
+        previous = getattr(sessionContext, 'session', None)
+        sessionContext.session = self
+        with self.lock:
+            self.threads.add(ident)
+        try:
+            profile.enable()
+        except ValueError:  # since python 3.12 only one cProfile can be active, the thread is only sampled then
+            profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            sessionContext.session = previous
+            with self.lock:
+                self.threads.discard(ident)
+                if not self.closed and profile is not None:
+                    self.profiles.append(profile)
+
+    def sample(self):
+        while not self.stopSampling.wait(self.samplingInterval):
+            with self.lock:
+                threads = set(self.threads)
+            for ident, frame in sys._current_frames().items():
+                if ident not in threads:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.numSamples += 1
+
+    def finish(self, folder):
+        # writes folder/<name>-<time>.pstats and .collapsed (input of flamegraph.pl or speedscope) and returns the
+        # base name of the files and the statistics
+        self.stopSampling.set()
+        self.sampler.join()
+        with self.lock:
+            self.closed = True
+            self.duration = time.time() - self.started
+        os.makedirs(folder, exist_ok=True)
+        fileName = os.path.join(folder, '%s-%s' % (self.name, time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))))
+        stats = None
+        if len(self.profiles) > 0:
+            stats = pstats.Stats(self.profiles[0])
+            for profile in self.profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(fileName + '.pstats')
+        with open(fileName + '.collapsed', 'w') as fh:
+            for stack, count in sorted(self.stacks.items()):
+                fh.write('%s %d\n' % (stack, count))
+        return fileName, stats
+
+    def summary(self, fileName, stats, top=20):
+        # the functions with the highest own time, for the admin chat
+        lines = ['*Profile of %s* (%.2f s, %d threads, %d samples)' % (self.name, self.duration, len(self.profiles),
+                                                                      self.numSamples),
+                 'Files: %s' % ', '.join('`%s%s`' % (fileName, ext) for ext in
+                                         (['.pstats'] if stats is not None else []) + ['.collapsed']), '```']
+        if stats is None:  # only the samples are available, so the innermost frames of the stacks are counted
+            leaves = Counter()
+            for stack, count in self.stacks.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+            lines.append('%8s  %s' % ('samples', 'function'))
+            lines += ['%8d  %s' % (count, leaf) for leaf, count in leaves.most_common(top)]
+            lines.append('```')
+            return '\n'.join(lines)
+        lines.append('%8s %8s %8s  %s' % ('own s', 'cum s', 'calls', 'function'))
+        functions = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:top]
+        for (path, line, function), (_, numCalls, ownTime, cumTime, _) in functions:
+            lines.append('%8.3f %8.3f %8d  %s:%d(%s)' % (ownTime, cumTime, numCalls, os.path.basename(path), line,
+                                                        function))
+        lines.append('```')
+        return '\n'.join(lines)
+
+
+class profileManager:
+    # keeps track of how many calls of which target are still to be profiled and whom to send the summaries
+    folder = 'profiles'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining = {}
+        self.reportFcts = {}
+
+    def arm(self, target, count, reportFct=None):
+        with self.lock:
+            self.remaining[target] = count
+            self.reportFcts[target] = reportFct
+
+    def pending(self):
+        with self.lock:
+            return {target: count for target, count in self.remaining.items() if count > 0}
+
+    def start(self, target, name):
+        with self.lock:
+            if self.remaining.get(target, 0) <= 0:
+                return None
+            self.remaining[target] -= 1
+        return profileSession(target, name)
+
+    def report(self, session):
+        try:
+            fileName, stats = session.finish(self.folder)
+            text = session.summary(fileName, stats)
+        except Exception as e:
+            logging.error('Could not write the profile of %s: %s' % (session.name, str(e)))
+            return
+        logging.info('Profile of %s written to %s.pstats' % (session.name, fileName))
+        reportFct = self.reportFcts.get(session.target)
+        if reportFct is not None:
+            try:
+                reportFct(text)
+            except Exception as e:
+                logging.error('Could not send the profile summary: %s' % str(e))
+
+
+manager = profileManager()
+
+
+def currentSession():
+    # the session the calling thread works for, which can be passed to the threads it starts
+    return getattr(sessionContext, 'session', None)
+
+
+@contextlib.contextmanager
+def profileThread(session):
+    if session is None:
+        yield
+    else:
+        with session.profileThread():
+            yield
+
+
+def profiled(target):
+    # decorator profiling the next calls of the function while profiling of target is armed. Calls within a profiled
+    # call (e.g. recursive handler calls) belong to the outer profile
+    def decorator(fct):
+        @functools.wraps(fct)
+        def wrapper(*args, **kwargs):
+            if currentSession() is not None:
+                return fct(*args, **kwargs)
+            session = manager.start(target, fct.__name__)
+            if session is None:
+                return fct(*args, **kwargs)
+            try:
+                with session.profileThread():
+                    return fct(*args, **kwargs)
+            finally:
+                manager.report(session)
+        return wrapper
+    return decorator
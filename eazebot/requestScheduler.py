@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the request scheduler which orders the requests to an exchange account by priority"""
+
+import heapq
+import itertools
+import threading
+import time
+
+# priority classes, lower values are served first
+PRIORITIES = {'emergency': 0,  # stop-loss and sell-all exits
+              'order': 1,  # placing and canceling orders
+              'status': 2,  # order states, tickers, balance
+              'info': 3}  # queries of the user interface
+
+# methods which do not need the API key. Only they run concurrently, as signed requests have to arrive in the order of
+# their nonces
+PUBLIC_METHODS = {'loadMarkets', 'fetchMarkets', 'fetchCurrencies', 'fetchTicker', 'fetchTickers', 'fetchOHLCV',
+                  'fetchOrderBook', 'fetchTrades', 'fetchTime', 'fetchStatus'}
+
+_schedulers = {}
+_schedulersLock = threading.Lock()
+
+
+def getRequestScheduler(exchange):
+    # returns the process-wide scheduler of the account (exchange and API key), as the rate limits and nonces are per
+    # account and not per trade handler
+    key = (exchange.id, exchange.apiKey)
+    with _schedulersLock:
+        if key not in _schedulers:
+            _schedulers[key] = requestScheduler('%s' % exchange.id, 1000. / exchange.rateLimit)
+        return _schedulers[key]
+
+
+class requestScheduler:
+    # token bucket with rate tokens per second (the published limit of the exchange, i.e. 1000 / rateLimit of ccxt)
+    # and at most burst tokens. Requests wait in a priority queue and at most maxConcurrent requests of the account run
+    # at a time, of which at most maxConcurrentPrivate are private (signed) ones, so that their nonces cannot arrive out
+    # of order. Waiting requests of a higher priority overtake lower ones, a public request overtakes a private one
+    # which waits for another private one to finish
+    burst = 1
+    maxConcurrent = 4
+    maxConcurrentPrivate = 1
+
+    def __init__(self, name, rate):
+        self.name = name
+        self.rate = rate
+        self.condition = threading.Condition()
+        self.tokens = self.burst
+        self.refilled = time.time()
+        self.queue = []  # heap of (priority, sequence number) of the waiting requests
+        self.counter = itertools.count()
+        self.running = 0
+        self.runningPrivate = 0
+        self.waits = {priority: [0, 0., 0.] for priority in PRIORITIES}  # priority -> [count, total wait, max wait]
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def canStart(self, entry):
+        return self.running < self.maxConcurrent and (not entry[2] or self.runningPrivate < self.maxConcurrentPrivate)
+
+    def acquire(self, priority='status', private=True):
+        # blocks until the request is the first waiting one that can start (see canStart) and a token is available
+        entry = (PRIORITIES[priority], next(self.counter), private)
+        enqueued = time.time()
+        with self.condition:
+            heapq.heappush(self.queue, entry)
+            while True:
+                if min((waiting for waiting in self.queue if self.canStart(waiting)), default=None) == entry:
+                    now = time.time()
+                    self.refill(now)
+                    if self.tokens >= 1:
+                        self.queue.remove(entry)
+                        heapq.heapify(self.queue)
+                        self.tokens -= 1
+                        self.running += 1
+                        self.runningPrivate += private
+                        self.condition.notify_all()  # the next request may start as well once it has a token
+                        stats = self.waits[priority]
+                        stats[0] += 1
+                        stats[1] += now - enqueued
+                        stats[2] = max(stats[2], now - enqueued)
+                        return
+                    self.condition.wait((1 - self.tokens) / self.rate)
+                else:
+                    self.condition.wait()
+
+    def release(self, private=True):
+        with self.condition:
+            self.running -= 1
+            self.runningPrivate -= private
+            self.condition.notify_all()
+
+    def run(self, func, priority='status', private=True):
+        self.acquire(priority, private)
+        try:
+            return func()
+        finally:
+            self.release(private)
+
+    def status(self):
+        # queue depth per priority and number, mean and maximum waiting time (s) of the requests per priority
+        with self.condition:
+            names = {value: name for name, value in PRIORITIES.items()}
+            depth = {priority: 0 for priority in PRIORITIES}
+            for entry in self.queue:
+                depth[names[entry[0]]] += 1
+            return {'queued': depth, 'running': self.running, 'runningPrivate': self.runningPrivate,
+                    'waits': {priority: {'count': stats[0], 'mean': stats[1] / stats[0] if stats[0] else 0.,
+                                         'max': stats[2]} for priority, stats in self.waits.items()}}
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the retry policy and the per-exchange circuit breaker used by tradeHandler.safeRun"""
+
+import random
+import threading
+import time
+from ccxt.base.errors import ExchangeNotAvailable
+
+
+class exchangeDownError(ExchangeNotAvailable):
+    # raised without contacting the exchange while its circuit breaker is open
+    pass
+
+
+class retryPolicy:
+    # defaults of all policies, can be overwritten by the 'retryPolicy' entry of botConfig.json
+    defaults = {'baseDelay': 0.5,  # seconds to wait before the first retry
+                'maxDelay': 8,  # upper bound of the waiting time between two retries
+                'factor': 2,  # exponential growth of the waiting time
+                'jitter': 0.25,  # relative random variation of the waiting time
+                'deadline': 30,  # seconds after which a call is not retried anymore
+                'budgets': {'NetworkError': 4, 'OrderNotFound': 4, 'AuthenticationError': 2, 'InvalidNonce': 3,
+                            'unknown': 3}}  # maximum number of retries per error class
+
+    def __init__(self, **kwargs):
+        settings = dict(self.defaults)
+        settings['budgets'] = dict(self.defaults['budgets'])
+        if 'budgets' in kwargs:
+            settings['budgets'].update(kwargs.pop('budgets'))
+        settings.update(kwargs)
+        for key in settings:
+            setattr(self, key, settings[key])
+        self.lock = threading.Lock()
+        self.retries = {}
+        self.failures = {}
+
+    def delay(self, attempt):
+        # exponential backoff with jitter for the given retry attempt (starting at 1)
+        delay = min(self.maxDelay, self.baseDelay * self.factor ** (attempt - 1))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def nextDelay(self, errorType, attempt, started):
+        # returns the time to wait before the next retry or None if the budget or the deadline of the call is exhausted
+        if attempt > self.budgets.get(errorType, self.budgets['unknown']):
+            return None
+        delay = self.delay(attempt)
+        if time.time() - started + delay > self.deadline:
+            return None
+        return delay
+
+    def record(self, errorType, retried):
+        with self.lock:
+            if retried:
+                self.retries[errorType] = self.retries.get(errorType, 0) + 1
+            else:
+                self.failures[errorType] = self.failures.get(errorType, 0) + 1
+
+    def stats(self):
+        # number of retries and of finally failed calls per error class
+        with self.lock:
+            return {'retries': dict(self.retries), 'failures': dict(self.failures)}
+
+
+_breakers = {}
+_breakersLock = threading.Lock()
+
+
+def getCircuitBreaker(exchangeId):
+    # returns the process-wide circuit breaker of this exchange, as an outage affects all users
+    with _breakersLock:
+        if exchangeId not in _breakers:
+            _breakers[exchangeId] = circuitBreaker(exchangeId)
+        return _breakers[exchangeId]
+
+
+class circuitBreaker:
+    # stops calling an exchange after several failed requests in a row and lets a single probe request through
+    # once the cooldown has passed. The cooldown doubles each time the probe fails.
+    failureThreshold = 5
+    cooldown = 30
+    maxCooldown = 600
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.currentCooldown = self.cooldown
+        self.openUntil = 0
+        self.probing = False
+        self.trips = 0
+
+    def check(self):
+        # raises exchangeDownError if calls to the exchange should not be made right now. Returns True if the call is
+        # the probe, whose outcome has to be recorded or which has to be ended with endProbe
+        with self.lock:
+            if self.state == 'closed':
+                return False
+            if self.state == 'open' and time.time() >= self.openUntil:
+                self.state = 'halfOpen'
+            if self.state == 'halfOpen' and not self.probing:
+                self.probing = True  # this call is the probe
+                return True
+            raise exchangeDownError('%s seems to be down, requests are paused for another %d s' % (
+                self.name, max(0, self.openUntil - time.time())))
+
+    def recordSuccess(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.probing = False
+            self.currentCooldown = self.cooldown
+
+    def recordFailure(self):
+        # returns True if this failure opened the breaker
+        with self.lock:
+            self.failures += 1
+            if self.state == 'halfOpen':
+                self.currentCooldown = min(self.maxCooldown, self.currentCooldown * 2)
+            elif self.state == 'open' or self.failures < self.failureThreshold:
+                return False
+            self.state = 'open'
+            self.probing = False
+            self.openUntil = time.time() + self.currentCooldown
+            self.trips += 1
+            return True
+
+    def endProbe(self):
+        # called when the probe is done. If it ended with an error that tells nothing about the exchange (so neither
+        # recordSuccess nor recordFailure was called), the next call becomes the probe
+        with self.lock:
+            if self.state == 'halfOpen':
+                self.probing = False
+
+    def status(self):
+        with self.lock:
+            return {'state': self.state, 'failures': self.failures, 'trips': self.trips,
+                    'reopensIn': max(0., self.openUntil - time.time()) if self.state == 'open' else 0.}
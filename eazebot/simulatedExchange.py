@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the simulated exchange used for paper trading and for load tests without a real exchange"""
+
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+
+import ccxt
+
+
+class simulatedExchange(ccxt.Exchange):
+    # in-process exchange with the ccxt interface used by the trade handler. Orders are matched against the price of
+    # their symbol by a simple order book: open buy orders fill at their limit price once the price falls to it, open
+    # sell orders once it rises to it, market orders fill at once. Prices come from a real exchange (priceSource, for
+    # paper trading) or follow a random walk (for load tests). Each request can be delayed (latency), is limited to
+    # requestsPerSecond and may fail with a configured probability (faults: method name or '*' -> probability) or
+    # with exceptions queued by injectFault
+    simulation = {'latency': 0.,  # seconds added to each request
+                  'requestsPerSecond': None,  # requests above this rate fail with RateLimitExceeded
+                  'faults': {},
+                  'balance': {'BTC': 1., 'ETH': 10., 'USDT': 10000.},
+                  'prices': {'ETH/BTC': 0.05, 'BTC/USDT': 8000., 'ETH/USDT': 400.},
+                  'volatility': 0.0013,  # of the random walk, per square root of a second
+                  'fee': 0.001,
+                  'seed': None,
+                  'rateLimit': None,  # ms between two requests the bot assumes (None: 50 ms)
+                  'stateFile': None}  # json file in which orders, trades and balance are kept (paper trading)
+    compactAfter = 1000  # changes appended to the state file before it is rewritten with the whole state
+
+    def describe(self):
+        return self.deep_extend(super().describe(), {
+            'id': 'simulated',
+            'name': 'Simulated',
+            'rateLimit': 50,
+            'precisionMode': ccxt.DECIMAL_PLACES,
+            'has': {'cancelOrder': True, 'cancelAllOrders': True, 'createLimitOrder': True, 'createMarketOrder': True,
+                    'fetchBalance': True, 'fetchTicker': True, 'fetchTickers': True, 'fetchOrder': True,
+                    'fetchOpenOrders': True, 'fetchClosedOrders': True, 'fetchOrders': False, 'fetchMyTrades': True,
+                    'fetchOHLCV': False},
+        })
+
+    def __init__(self, config={}):
+        config = dict(config)
+        settings = dict(self.simulation)
+        settings.update(config.pop('simulation', {}))
+        self.priceSource = config.pop('priceSource', None)
+        super().__init__(config)
+        self.settings = settings
+        if settings['rateLimit'] is not None:
+            self.rateLimit = settings['rateLimit']
+        self.simLock = threading.RLock()
+        self.random = random.Random(settings['seed'])
+        self.orderIds = itertools.count(1)
+        self.simOrders = {}  # id -> order as returned by fetchOrder
+        self.books = {}  # symbol -> [heap of open buy orders (-price, id), heap of open sell orders (price, id)]
+        self.simTrades = []
+        self.wallets = {currency: {'free': float(amount), 'used': 0.} for currency, amount in settings['balance'].items()}
+        self.prices = dict(settings['prices'])
+        self.priceTimes = {}
+        self.requestTimes = []
+        self.injected = {}  # method -> list of exceptions raised by its next calls
+        self.numRequests = 0
+        self.requestCounts = {}  # method -> number of requests
+        # orders and trades changed since the state file was last written
+        self.changedOrders = set()
+        self.newTrades = []
+        self.numChanges = 0
+        if self.priceSource is not None:
+            # the name is kept as the bot identifies exchanges by it, the id keeps caches apart from the real exchange
+            self.id = self.priceSource.id + '-paper'
+            self.name = self.priceSource.name
+            self.has['fetchOHLCV'] = self.priceSource.has.get('fetchOHLCV', False)
+            self.precisionMode = getattr(self.priceSource, 'precisionMode', ccxt.DECIMAL_PLACES)
+        self.readState()
+
+    @property
+    def exchangeName(self):
+        # name of the exchange class the trade handler was created with
+        return self.id if self.priceSource is None else self.priceSource.__class__.__name__
+
+    # requests
+
+    def injectFault(self, method, exception, count=1):
+        # makes the next count calls of the method (or of any method if '*') raise the exception
+        with self.simLock:
+            self.injected.setdefault(method, []).extend([exception] * count)
+
+    def simRequest(self, method):
+        # latency, rate limit and faults of one request
+        self.numRequests += 1
+        self.requestCounts[method] = self.requestCounts.get(method, 0) + 1
+        if self.settings['latency'] > 0:
+            time.sleep(self.settings['latency'])
+        with self.simLock:
+            now = time.time()
+            if self.settings['requestsPerSecond']:
+                self.requestTimes = [stamp for stamp in self.requestTimes if now - stamp < 1]
+                if len(self.requestTimes) >= self.settings['requestsPerSecond']:
+                    raise ccxt.RateLimitExceeded('%s: too many requests' % self.name)
+                self.requestTimes.append(now)
+            for key in [method, '*']:
+                if len(self.injected.get(key, [])) > 0:
+                    raise self.injected[key].pop(0)
+            probability = self.settings['faults'].get(method, self.settings['faults'].get('*', 0))
+            if probability > 0 and self.random.random() < probability:
+                raise ccxt.RequestTimeout('%s: simulated timeout of %s' % (self.name, method))
+
+    # markets and prices
+
+    def defaultMarkets(self):
+        markets = {}
+        for symbol in self.prices:
+            base, quote = symbol.split('/')
+            markets[symbol] = {'id': base + quote, 'symbol': symbol, 'base': base, 'quote': quote, 'baseId': base,
+                               'quoteId': quote, 'active': True, 'type': 'spot', 'spot': True,
+                               'taker': self.settings['fee'], 'maker': self.settings['fee'],
+                               'precision': {'amount': 3 if self.prices[symbol] > 1e-3 else 0, 'price': max(
+                                   2, 5 - int(math.floor(math.log10(self.prices[symbol]))))},
+                               'limits': {'amount': {'min': 0.001, 'max': None}, 'price': {'min': None, 'max': None},
+                                          'cost': {'min': None, 'max': None}}, 'info': {}}
+        return markets
+
+    def load_markets(self, reload=False, params={}):
+        if self.markets and not reload:
+            return self.markets
+        self.simRequest('loadMarkets')
+        if self.priceSource is not None:
+            self.priceSource.load_markets(reload)
+            self.set_markets(self.priceSource.markets, self.priceSource.currencies)
+        else:
+            self.set_markets(self.defaultMarkets())
+        return self.markets
+
+
+    def refreshPrices(self, symbols):
+        # fetches the prices of the price source that are older than a second, all with one request and without
+        # holding the lock, so that other requests are not blocked by the real exchange. Fills the orders they reach
+        if self.priceSource is None:
+            return
+        now = time.time()
+        with self.simLock:
+            stale = [symbol for symbol in symbols if now - self.priceTimes.get(symbol, 0) > 1]
+        if len(stale) == 0:
+            return
+        elif len(stale) == 1:
+            tickers = {stale[0]: self.priceSource.fetchTicker(stale[0])}
+        else:
+            tickers = self.priceSource.fetchTickers(stale)
+        with self.simLock:
+            for symbol, ticker in tickers.items():
+                if ticker.get('last') is not None:
+                    self.prices[symbol] = ticker['last']
+                    self.priceTimes[symbol] = now
+                    self.match(symbol)
+
+    def currentPrice(self, symbol):
+        # random walk since the last request of the price (or the last price of the price source, which has to be
+        # refreshed by refreshPrices before)
+        with self.simLock:
+            now = time.time()
+            if self.priceSource is not None:
+                if symbol not in self.prices:
+                    raise ccxt.ExchangeError('%s: no price of %s' % (self.name, symbol))
+            elif symbol not in self.prices:
+                raise ccxt.BadSymbol('%s does not have market symbol %s' % (self.name, symbol))
+            else:
+                elapsed = now - self.priceTimes.get(symbol, now)
+                if elapsed > 0:
+                    self.prices[symbol] *= math.exp(self.settings['volatility'] * math.sqrt(elapsed) * self.random.gauss(0, 1))
+                self.priceTimes[symbol] = now
+            self.match(symbol)
+            return self.prices[symbol]
+
+    def setPrice(self, symbol, price):
+        # moves the price (e.g. in tests) and fills the orders it reaches
+        with self.simLock:
+            self.prices[symbol] = price
+            self.priceTimes[symbol] = time.time()
+            self.match(symbol)
+
+    def ticker(self, symbol):
+        price = self.currentPrice(symbol)
+        now = self.milliseconds()
+        return {'symbol': symbol, 'timestamp': now, 'datetime': self.iso8601(now), 'last': price, 'close': price,
+                'bid': price, 'ask': price, 'high': price, 'low': price, 'info': {}}
+
+    def fetch_ticker(self, symbol, params={}):
+        self.simRequest('fetchTicker')
+        self.refreshPrices([symbol])
+        return self.ticker(symbol)
+
+
+    def fetch_tickers(self, symbols=None, params={}):
+        self.simRequest('fetchTickers')
+        symbols = symbols or list(self.markets or self.prices)
+        self.refreshPrices(symbols)
+        return {symbol: self.ticker(symbol) for symbol in symbols if symbol in self.prices}
+
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        if self.priceSource is None:
+            raise ccxt.NotSupported('%s has no candles' % self.name)
+        self.simRequest('fetchOHLCV')
+        return self.priceSource.fetchOHLCV(symbol, timeframe, since, limit)
+
+
+    # balance
+
+    def fetch_balance(self, params={}):
+        self.simRequest('fetchBalance')
+        with self.simLock:
+            balance = {'info': {}, 'free': {}, 'used': {}, 'total': {}}
+            for currency, account in self.wallets.items():
+                balance[currency] = {'free': account['free'], 'used': account['used'],
+                                     'total': account['free'] + account['used']}
+                for key in ['free', 'used', 'total']:
+                    balance[key][currency] = balance[currency][key]
+            return balance
+
+
+    def wallet(self, currency):
+        return self.wallets.setdefault(currency, {'free': 0., 'used': 0.})
+
+    def calculate_fee(self, symbol, type, side, amount, price, takerOrMaker='taker', params={}):
+        quote = symbol.split('/')[1]
+        return {'type': takerOrMaker, 'currency': quote, 'rate': self.settings['fee'],
+                'cost': amount * price * self.settings['fee']}
+
+
+    # orders
+
+    def create_order(self, symbol, type, side, amount, price=None, params={}):
+        self.simRequest('createOrder')
+        if self.markets and symbol not in self.markets:
+            raise ccxt.BadSymbol('%s does not have market symbol %s' % (self.name, symbol))
+        base, quote = symbol.split('/')
+        amount = float(amount)
+        self.refreshPrices([symbol])
+        with self.simLock:
+            last = self.currentPrice(symbol)
+            reserve = amount if side == 'sell' else amount * (price if type == 'limit' else last)
+            account = self.wallet(base if side == 'sell' else quote)
+            if account['free'] < reserve - 1e-12:
+                raise ccxt.InsufficientFunds('%s: %s balance insufficient for order' % (self.name, base if side == 'sell' else quote))
+            account['free'] -= reserve
+            account['used'] += reserve
+            oid = str(next(self.orderIds))
+            now = self.milliseconds()
+            order = {'id': oid, 'clientOrderId': None, 'timestamp': now, 'datetime': self.iso8601(now),
+                     'lastTradeTimestamp': None, 'symbol': symbol, 'type': type, 'side': side, 'price': price,
+                     'amount': amount, 'cost': 0., 'average': None, 'filled': 0., 'remaining': amount,
+                     'status': 'open', 'fee': None, 'trades': [], 'info': {'reserved': reserve}}
+            self.simOrders[oid] = order
+            self.changedOrders.add(oid)
+            if type == 'market':
+                self.fill(order, last, 'taker')
+            else:
+                book = self.books.setdefault(symbol, [[], []])
+                if side == 'buy':
+                    heapq.heappush(book[0], (-price, int(oid)))
+                else:
+                    heapq.heappush(book[1], (price, int(oid)))
+                self.match(symbol)
+            self.writeState()
+            return dict(order)
+
+    def match(self, symbol):
+        # fills the open orders of the symbol reached by its price (called while holding the lock)
+        if symbol not in self.books or symbol not in self.prices:
+            return
+        price = self.prices[symbol]
+        bids, asks = self.books[symbol]
+        while len(bids) > 0 and -bids[0][0] >= price:
+            order = self.simOrders[str(heapq.heappop(bids)[1])]
+            if order['status'] == 'open':
+                self.fill(order, order['price'], 'maker')
+        while len(asks) > 0 and asks[0][0] <= price:
+            order = self.simOrders[str(heapq.heappop(asks)[1])]
+            if order['status'] == 'open':
+                self.fill(order, order['price'], 'maker')
+        self.writeState()
+
+    def fill(self, order, price, takerOrMaker):
+        base, quote = order['symbol'].split('/')
+        amount = order['amount']
+        cost = amount * price
+        fee = self.calculate_fee(order['symbol'], order['type'], order['side'], amount, price, takerOrMaker)
+        if order['side'] == 'buy':
+            self.wallet(quote)['used'] -= order['info']['reserved']
+            self.wallet(quote)['free'] += order['info']['reserved'] - cost - fee['cost']
+            self.wallet(base)['free'] += amount
+        else:
+            self.wallet(base)['used'] -= amount
+            self.wallet(quote)['free'] += cost - fee['cost']
+        now = self.milliseconds()
+        trade = {'id': 't%s' % order['id'], 'order': order['id'], 'timestamp': now, 'datetime': self.iso8601(now),
+                 'symbol': order['symbol'], 'type': order['type'], 'side': order['side'], 'takerOrMaker': takerOrMaker,
+                 'price': price, 'amount': amount, 'cost': cost, 'fee': fee, 'info': {}}
+        self.simTrades.append(trade)
+        order.update({'status': 'closed', 'filled': amount, 'remaining': 0., 'cost': cost, 'average': price,
+                      'price': order['price'] or price, 'fee': fee, 'lastTradeTimestamp': now, 'trades': [trade]})
+        self.changedOrders.add(order['id'])
+        self.newTrades.append(trade)
+
+    def refreshOrderPrice(self, oid):
+        # the price may have moved since the order was placed
+        with self.simLock:
+            order = self.simOrders.get(oid)
+        if order is not None and order['status'] == 'open':
+            self.refreshPrices([order['symbol']])
+
+    def getOrder(self, oid):
+        if oid not in self.simOrders:
+            raise ccxt.OrderNotFound('%s: order %s not found' % (self.name, oid))
+        order = self.simOrders[oid]
+        if order['status'] == 'open' and order['symbol'] in self.prices:
+            self.currentPrice(order['symbol'])  # the price moved since the order was placed
+        return order
+
+    def fetch_order(self, id, symbol=None, params={}):
+        self.simRequest('fetchOrder')
+        self.refreshOrderPrice(id)
+        with self.simLock:
+            return dict(self.getOrder(id))
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        self.simRequest('fetchOpenOrders')
+        return self.ordersOf(symbol, since, lambda order: order['status'] == 'open')
+
+    def fetch_closed_orders(self, symbol=None, since=None, limit=None, params={}):
+        self.simRequest('fetchClosedOrders')
+        return self.ordersOf(symbol, since, lambda order: order['status'] != 'open')
+
+    def ordersOf(self, symbol, since, condition):
+        if symbol is not None:
+            self.refreshPrices([symbol])
+        with self.simLock:
+            if symbol is not None and symbol in self.prices:
+                self.currentPrice(symbol)
+            return [dict(order) for order in self.simOrders.values() if (symbol is None or order['symbol'] == symbol)
+                    and (since is None or order['timestamp'] >= since) and condition(order)]
+
+    def cancel_order(self, id, symbol=None, params={}):
+        self.simRequest('cancelOrder')
+        self.refreshOrderPrice(id)
+        with self.simLock:
+            order = self.getOrder(id)
+            if order['status'] != 'open':
+                raise ccxt.OrderNotFound('%s: order %s is not open' % (self.name, id))
+            self.cancel(order)
+            self.writeState()
+            return dict(order)
+
+    def cancel_all_orders(self, symbol=None, params={}):
+        self.simRequest('cancelAllOrders')
+        with self.simLock:
+            canceled = [order for order in self.simOrders.values() if order['status'] == 'open' and
+                        (symbol is None or order['symbol'] == symbol)]
+            for order in canceled:
+                self.cancel(order)
+            self.writeState()
+            return [dict(order) for order in canceled]
+
+    def cancel(self, order):
+        # the order stays in the heap of its book and is skipped when it is reached
+        base, quote = order['symbol'].split('/')
+        account = self.wallet(base if order['side'] == 'sell' else quote)
+        account['used'] -= order['info']['reserved']
+        account['free'] += order['info']['reserved']
+        order['status'] = 'canceled'
+        self.changedOrders.add(order['id'])
+
+    def fetch_my_trades(self, symbol=None, since=None, limit=None, params={}):
+        self.simRequest('fetchMyTrades')
+        with self.simLock:
+            trades = [dict(trade) for trade in self.simTrades if (symbol is None or trade['symbol'] == symbol) and
+                      (since is None or trade['timestamp'] >= since)]
+        return trades if limit is None else trades[:limit]
+
+    # persistence of paper trading accounts
+
+    def openAccount(self, stateFile):
+        # switches to the account kept in the state file (e.g. once the API key of a paper trading handler is known),
+        # starting with the initial balance if the file does not exist yet
+        with self.simLock:
+            if stateFile == self.settings['stateFile']:
+                return
+            self.settings['stateFile'] = stateFile
+            self.orderIds = itertools.count(1)
+            self.simOrders = {}
+            self.books = {}
+            self.simTrades = []
+            self.wallets = {currency: {'free': float(amount), 'used': 0.} for currency, amount in
+                            self.settings['balance'].items()}
+            self.changedOrders = set()
+            self.newTrades = []
+            self.numChanges = 0
+            self.readState()
+
+    def readState(self):
+        # the state file is a list of json lines, each with the changed orders, the new trades and the balance. The
+        # first line holds the whole state of the last time the file was rewritten
+        if self.settings['stateFile'] is None or not os.path.isfile(self.settings['stateFile']):
+            return
+        with open(self.settings['stateFile'], 'r') as fh:
+            for line in fh:
+                try:
+                    change = json.loads(line)
+                except ValueError:  # line cut by a crash
+                    continue
+                self.simOrders.update(change['orders'])
+                self.simTrades += change['trades']
+                self.wallets = change['accounts']
+        self.orderIds = itertools.count(max([int(oid) for oid in self.simOrders] + [0]) + 1)
+        for oid, order in self.simOrders.items():
+            if order['status'] == 'open' and order['type'] == 'limit':
+                book = self.books.setdefault(order['symbol'], [[], []])
+                if order['side'] == 'buy':
+                    heapq.heappush(book[0], (-order['price'], int(oid)))
+                else:
+                    heapq.heappush(book[1], (order['price'], int(oid)))
+        self.compactState()
+
+    def writeState(self):
+        # appends the changes since the last call to the state file (called while holding the lock)
+        if self.settings['stateFile'] is None or (len(self.changedOrders) == 0 and len(self.newTrades) == 0):
+            return
+        if self.numChanges >= self.compactAfter or not os.path.isfile(self.settings['stateFile']):
+            self.compactState()
+            return
+        change = {'orders': {oid: self.simOrders[oid] for oid in self.changedOrders}, 'trades': self.newTrades,
+                  'accounts': self.wallets}
+        with open(self.settings['stateFile'], 'a') as fh:
+            fh.write(json.dumps(change) + '\n')
+        self.changedOrders = set()
+        self.newTrades = []
+        self.numChanges += 1
+
+    def compactState(self):
+        # rewrites the state file with the whole state as its only line
+        folder = os.path.dirname(self.settings['stateFile'])
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        tmpName = self.settings['stateFile'] + '.tmp'
+        with open(tmpName, 'w') as fh:
+            fh.write(json.dumps({'orders': self.simOrders, 'trades': self.simTrades, 'accounts': self.wallets}) + '\n')
+        os.replace(tmpName, self.settings['stateFile'])
+        self.changedOrders = set()
+        self.newTrades = []
+        self.numChanges = 0
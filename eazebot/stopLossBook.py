@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the stop-loss book which evaluates the stop-losses of all trade sets of a trade handler at once"""
+
+import numpy as np
+
+
+class stopLossBook:
+    # arrays with one row per active trade set with stop-loss: index of its symbol, stop-loss, trailing offset (nan if
+    # not trailing) and whether the offset is relative. The book is built from the trade sets and has to be rebuilt
+    # whenever a trade set changes, which the trade handler tracks with a version number
+
+    def __init__(self):
+        self.version = None
+        self.build({}, None)
+
+    def build(self, tradeSets, version):
+        ids = []
+        symbols = []
+        sl = []
+        offset = []
+        relative = []
+        for iTs, ts in list(tradeSets.items()):
+            if not ts['active'] or ts['SL'] is None:
+                continue
+            trailing = ts.get('trailingSL', [None, None])
+            ids.append(iTs)
+            symbols.append(ts['symbol'])
+            sl.append(ts['SL'])
+            offset.append(np.nan if trailing[0] is None else trailing[0])
+            relative.append(trailing[1] != 'abs')
+        self.ids = ids
+        self.symbols = sorted(set(symbols))
+        self.symbolIndex = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.symIdx = np.array([self.symbolIndex[symbol] for symbol in symbols], dtype=np.intp)
+        self.sl = np.array(sl, dtype=float)
+        self.offset = np.array(offset, dtype=float)
+        self.relative = np.array(relative, dtype=bool)
+        self.version = version
+
+    def evaluate(self, prices):
+        # one pass over all trade sets for a snapshot of prices (dict symbol -> price, may contain only some symbols).
+        # Ratchets the trailing stop-losses and returns the ids of the triggered trade sets and a list of
+        # (id, new stop-loss) of the moved trailing stop-losses. Triggered trade sets are not ratcheted
+        if len(self.ids) == 0:
+            return [], []
+        priceBySymbol = np.full(len(self.symbols), np.nan)
+        for symbol, price in prices.items():
+            if price is not None and symbol in self.symbolIndex:
+                priceBySymbol[self.symbolIndex[symbol]] = price
+        price = priceBySymbol[self.symIdx]
+        with np.errstate(invalid='ignore'):
+            triggered = price <= self.sl
+            newSL = np.where(self.relative, price * (1 - self.offset), price - self.offset)
+            ratchet = (newSL > self.sl) & ~triggered
+        self.sl[ratchet] = newSL[ratchet]
+        return [self.ids[i] for i in np.flatnonzero(triggered)], [(self.ids[i], float(self.sl[i])) for i in
+                                                                  np.flatnonzero(ratchet)]
+
+
+def scalarEvaluate(tradeSets, prices):
+    # the stop-loss check as done per trade set in tradeHandler.update before, for comparison
+    triggered = []
+    ratcheted = []
+    for iTs, ts in tradeSets.items():
+        if not ts['active'] or ts['SL'] is None or ts['symbol'] not in prices:
+            continue
+        last = prices[ts['symbol']]
+        if last <= ts['SL']:
+            triggered.append(iTs)
+        elif 'trailingSL' in ts and ts['trailingSL'][0] is not None:
+            if ts['trailingSL'][1] == 'abs':
+                newSL = last - ts['trailingSL'][0]
+            else:
+                newSL = last * (1 - ts['trailingSL'][0])
+            if newSL > ts['SL']:
+                ts['SL'] = newSL
+                ratcheted.append((iTs, newSL))
+    return triggered, ratcheted
+
+
+def benchmarkStopLossBook(numTradeSets=5000, numSymbols=200, numSnapshots=100):
+    # compares the time per price snapshot of the scalar loop and of the book for the same random trade sets
+    import copy
+    import time
+
+    rng = np.random.RandomState(0)
+    symbols = ['C%d/BTC' % i for i in range(numSymbols)]
+    tradeSets = {}
+    for i in range(numTradeSets):
+        trailing = [None, None] if i % 3 == 0 else ([0.05, 'rel'] if i % 3 == 1 else [0.002, 'abs'])
+        tradeSets['TS%d' % i] = {'symbol': symbols[i % numSymbols], 'active': True, 'SL': 0.9 * rng.uniform(0.02, 0.05),
+                                 'trailingSL': trailing}
+    snapshots = [{symbol: rng.uniform(0.02, 0.06) for symbol in symbols} for _ in range(numSnapshots)]
+
+    scalarSets = copy.deepcopy(tradeSets)
+    start = time.time()
+    scalarResults = [scalarEvaluate(scalarSets, prices) for prices in snapshots]
+    scalarTime = (time.time() - start) / numSnapshots
+
+    book = stopLossBook()
+    start = time.time()
+    book.build(tradeSets, 0)
+    buildTime = time.time() - start
+    start = time.time()
+    bookResults = [book.evaluate(prices) for prices in snapshots]
+    bookTime = (time.time() - start) / numSnapshots
+    same = all(sorted(a[0]) == sorted(b[0]) and len(a[1]) == len(b[1]) for a, b in zip(scalarResults, bookResults))
+    return {'tradeSets': numTradeSets, 'scalar': scalarTime, 'book': bookTime, 'build': buildTime, 'same': same}
+
+
+if __name__ == '__main__':
+    for num in [100, 1000, 10000]:
+        result = benchmarkStopLossBook(num)
+        print('%6d trade sets: loop %.3f ms, book %.3f ms per snapshot (build %.1f ms), same result: %s' % (
+            num, result['scalar'] * 1000, result['book'] * 1000, result['build'] * 1000, result['same']))
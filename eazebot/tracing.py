@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the span tracing of the update cycles, which writes the spans of sampled cycles as json lines to
+a rotating file. Run python tracing.py cycleTrace.jsonl to list the slowest spans of the last cycles"""
+
+import argparse
+import contextlib
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import random
+import threading
+import time
+import uuid
+
+# spans are only recorded within a cycle, and only for the sampled fraction of the cycles
+sampleRate = 0.
+traceLogger = logging.getLogger('eazebot.tracing')
+traceLogger.propagate = False
+spanContext = threading.local()
+
+
+def configure(fileName='cycleTrace.jsonl', rate=0.1, maxBytes=5000000, backupCount=5):
+    # sets the sampling rate of the cycles and the file the spans are written to (rate 0 disables the tracing)
+    global sampleRate
+    sampleRate = float(rate)
+    for handler in list(traceLogger.handlers):
+        traceLogger.removeHandler(handler)
+        handler.close()
+    if sampleRate > 0:
+        handler = logging.handlers.RotatingFileHandler(fileName, maxBytes=maxBytes, backupCount=backupCount)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        traceLogger.addHandler(handler)
+        traceLogger.setLevel(logging.INFO)
+
+
+def newId():
+    return uuid.uuid4().hex[:16]
+
+
+def currentSpan():
+    # the innermost open span of this thread, which can be passed as parent to spans of other threads
+    return getattr(spanContext, 'span', None)
+
+
+@contextlib.contextmanager
+def openSpan(current):
+    previous = currentSpan()
+    spanContext.span = current
+    started = time.time()
+    try:
+        yield current
+    except BaseException as e:
+        current['error'] = e.__class__.__name__
+        raise
+    finally:
+        spanContext.span = previous
+        current['duration'] = time.time() - started
+        current['start'] = started
+        traceLogger.info(json.dumps(current, default=str))
+
+
+@contextlib.contextmanager
+def traceCycle(name, **attributes):
+    # root span of one run of a job. The cycle id is the trace id of all spans below it
+    if sampleRate <= 0 or random.random() >= sampleRate:
+        yield None
+        return
+    traceId = newId()
+    with openSpan({'trace': traceId, 'id': traceId, 'parent': None, 'name': name, 'attributes': attributes}) as root:
+        yield root
+
+
+@contextlib.contextmanager
+def traceSpan(name, parent=None, **attributes):
+    # child span of parent or of the current span of the thread. Outside of sampled cycles nothing is recorded
+    if parent is None:
+        parent = currentSpan()
+    if parent is None:
+        yield None
+        return
+    with openSpan({'trace': parent['trace'], 'id': newId(), 'parent': parent['id'], 'name': name,
+                   'attributes': attributes}) as child:
+        yield child
+
+
+def readSpans(fileName):
+    # the spans of the trace file and its rotated backups, oldest first
+    backups = [f for f in glob.glob(fileName + '.*') if f.rsplit('.', 1)[1].isdigit()]
+    spans = []
+    for name in sorted(backups, key=lambda f: -int(f.rsplit('.', 1)[1])) + [fileName]:
+        if not os.path.isfile(name):
+            continue
+        with open(name, 'r') as fh:
+            for line in fh:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:  # line cut by a crash
+                    pass
+    return spans
+
+
+def summarize(spans, numCycles=5, top=10, name=None):
+    # lists the slowest spans of each of the last numCycles cycles
+    cycles = {}
+    for s in spans:
+        cycles.setdefault(s['trace'], []).append(s)
+    roots = sorted([s for s in spans if s['parent'] is None and (name is None or s['name'] == name)],
+                   key=lambda s: s['start'])[-numCycles:]
+    lines = []
+    for root in roots:
+        lines.append('%s %s (cycle %s): %.3f s, %d spans%s' % (
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(root['start'])), root['name'], root['trace'],
+            root['duration'], len(cycles[root['trace']]), ', failed: %s' % root['error'] if 'error' in root else ''))
+        children = sorted([s for s in cycles[root['trace']] if s is not root], key=lambda s: -s['duration'])[:top]
+        for s in children:
+            lines.append('  %8.3f s  %-12s %s%s' % (s['duration'], s['name'],
+                                                     ' '.join('%s=%s' % item for item in s['attributes'].items()),
+                                                     '  [%s]' % s['error'] if 'error' in s else ''))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Lists the slowest spans of the last traced cycles of EazeBot')
+    parser.add_argument('file', nargs='?', default='cycleTrace.jsonl', help='trace file (rotated backups are read too)')
+    parser.add_argument('--cycles', type=int, default=5, help='number of cycles to show')
+    parser.add_argument('--top', type=int, default=10, help='number of spans to show per cycle')
+    parser.add_argument('--name', help='only show cycles of this job, e.g. updateTradeSets')
+    args = parser.parse_args()
+    print(summarize(readSpans(args.file), args.cycles, args.top, args.name))
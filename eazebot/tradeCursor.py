@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# EazeBot
+# Free python/telegram bot for easy execution and surveillance of crypto trading plans on multiple exchanges.
+# Copyright (C) 2018
+# Marcel Beining <marcel.beining@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the trade cursor which fetches the own trades of an account incrementally and indexes them by
+order id"""
+
+import threading
+from collections import OrderedDict, deque
+
+
+class tradeCursor:
+    # remembers per symbol the time stamp of the newest own trade seen so far and only fetches newer trades. All
+    # fetched trades are indexed by their order id (for the last maxOrders orders)
+    maxOrders = 1000
+    maxPages = 10  # maximum number of fetchMyTrades requests per refresh
+    maxSeenIds = 5000
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.lock = threading.Lock()
+        self.cursors = {}  # symbol -> time stamp (ms) of the newest trade
+        self.seenIds = {}  # symbol -> recently indexed trade ids, as since is inclusive and pages overlap
+        self.byOrder = OrderedDict()  # order id -> list of trades
+        self.numRequests = 0
+
+    def add(self, symbol, trades):
+        # indexes the trades which were not seen yet and returns their number
+        seen = self.seenIds.setdefault(symbol, deque(maxlen=self.maxSeenIds))
+        seenSet = set(seen)
+        count = 0
+        for trade in trades:
+            if trade['id'] is not None and trade['id'] in seenSet:
+                continue
+            seen.append(trade['id'])
+            seenSet.add(trade['id'])
+            count += 1
+            if trade['order'] is not None:
+                if trade['order'] not in self.byOrder:
+                    self.byOrder[trade['order']] = []
+                    while len(self.byOrder) > self.maxOrders:
+                        self.byOrder.popitem(last=False)
+                self.byOrder[trade['order']].append(trade)
+            if trade['timestamp'] is not None:
+                self.cursors[symbol] = max(self.cursors.get(symbol, 0), trade['timestamp'])
+        return count
+
+    def refresh(self, symbol, since=None, safeRun=None):
+        # fetches all trades of the symbol newer than the cursor (or since, if given), page by page
+        if safeRun is None:
+            safeRun = lambda func: func()
+        if since is None:
+            since = self.cursors.get(symbol)
+        for _ in range(self.maxPages):
+            trades = safeRun(lambda: self.exchange.fetchMyTrades(symbol, since))
+            self.numRequests += 1
+            if self.add(symbol, trades) == 0:
+                break
+            newest = max([trade['timestamp'] for trade in trades if trade['timestamp'] is not None] + [0])
+            if since is not None and newest <= since:
+                break
+            since = newest
+
+    def orderTrades(self, symbol, order, safeRun=None):
+        # returns the own trades of the order (dict as returned by fetchOrder), fetching only trades newer than the
+        # cursor. If no trade of this order was seen yet, they are fetched starting at the order creation instead
+        with self.lock:
+            since = self.cursors.get(symbol)
+            if order['id'] not in self.byOrder and order.get('timestamp') is not None:
+                since = order['timestamp']
+            self.refresh(symbol, since, safeRun)
+            return list(self.byOrder.get(order['id'], []))
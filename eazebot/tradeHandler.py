@@ -28,11 +28,92 @@ import time
 import random
 import string
 import sys, os
-from ccxt.base.errors import (AuthenticationError,NetworkError,OrderNotFound,InvalidNonce)
+import threading
+import functools
+import contextlib
+import logging
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from ccxt.base.errors import (AuthenticationError,ExchangeError,NetworkError,OrderNotFound,InvalidNonce,InvalidOrder)
+
+if __name__ == '__main__' or os.path.isfile('tradeHandler.py'):
+    from marketData import (getMarketDataHub,getMarketsCache)
+    from locks import (fifoLock,lockStats)
+    from retryPolicy import (retryPolicy,getCircuitBreaker)
+    from precision import precisionFormatter
+    from aggregates import levelAggregates
+    from levels import tradeLevel
+    from priceFeed import (getPriceFeed,stopLossEvaluator)
+    from stopLossBook import stopLossBook
+    from tradeCursor import tradeCursor
+    from balanceLedger import balanceLedger
+    from pollScheduler import pollScheduler
+    from candleEngine import candleEngine
+    from requestScheduler import (getRequestScheduler,PRIORITIES,PUBLIC_METHODS)
+    from simulatedExchange import simulatedExchange
+    from metrics import (recordRequest,methodName)
+    from tracing import traceSpan
+    from backtest import (runBacktest,tradeSetDefinition,candleColumns,variants)
+else:
+    from eazebot.marketData import (getMarketDataHub,getMarketsCache)
+    from eazebot.locks import (fifoLock,lockStats)
+    from eazebot.retryPolicy import (retryPolicy,getCircuitBreaker)
+    from eazebot.precision import precisionFormatter
+    from eazebot.aggregates import levelAggregates
+    from eazebot.levels import tradeLevel
+    from eazebot.priceFeed import (getPriceFeed,stopLossEvaluator)
+    from eazebot.stopLossBook import stopLossBook
+    from eazebot.tradeCursor import tradeCursor
+    from eazebot.balanceLedger import balanceLedger
+    from eazebot.pollScheduler import pollScheduler
+    from eazebot.candleEngine import candleEngine
+    from eazebot.requestScheduler import (getRequestScheduler,PRIORITIES,PUBLIC_METHODS)
+    from eazebot.simulatedExchange import simulatedExchange
+    from eazebot.metrics import (recordRequest,methodName)
+    from eazebot.tracing import traceSpan
+    from eazebot.backtest import (runBacktest,tradeSetDefinition,candleColumns,variants)
+
+def lockTradeSet(func):
+    # decorator for methods whose first argument is a trade set id: holds the lock of this trade set during the call.
+    # As trade sets are only changed by these methods, the version number tells the stop-loss book to rebuild itself,
+    # and the version of the trade set tells if its cached status text is still valid
+    @functools.wraps(func)
+    def wrapper(self,iTs,*args,**kwargs):
+        with self.tradeSetLock(iTs):
+            try:
+                return func(self,iTs,*args,**kwargs)
+            finally:
+                # the versions have their own lock, as the methods of different trade sets run at the same time
+                with self.versionLock:
+                    self.tsVersion += 1
+                    if iTs in self.tradeSets:  # not if the trade set was removed
+                        self.tsVersions[iTs] = self.tsVersions.get(iTs,0) + 1
+    return wrapper
+
+def withPriority(priority):
+    # decorator for methods whose exchange requests are served with at least this priority by the request scheduler
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self,*args,**kwargs):
+            with self.requestPriority(priority):
+                return func(self,*args,**kwargs)
+        return wrapper
+    return decorator
 
 class tradeHandler:
+    # waiting for an order to be filled/canceled: first poll after orderPollDelay seconds, then with growing intervals
+    # (at most orderPollMaxDelay) until orderWaitDeadline seconds have passed
+    orderPollDelay = 0.2
+    orderPollFactor = 2
+    orderPollMaxDelay = 2
+    orderWaitDeadline = 10
+    maxParallelCancels = 4  # concurrent cancel requests if the exchange has no bulk cancel
+    # paper trading: orders are placed at a simulated exchange with the prices of the real one
+    paperTrading = False
+    paperTradingFolder = 'paperTrading'
+    paperTradingBalance = {'BTC': 1., 'ETH': 10., 'USDT': 10000.}  # initial balance of a new paper trading account
     
-    def __init__(self,exchName,key=None,secret=None,password=None,uid=None,messagerFct=None):
+    def __init__(self,exchName,key=None,secret=None,password=None,uid=None,messagerFct=None,paperTrading=None):
         # use either the given messager function or define a simple print messager function which takes a level argument as second optional input
         if messagerFct:
             self.message = messagerFct
@@ -41,7 +122,25 @@ class tradeHandler:
             
         checkThese = ['cancelOrder','createLimitOrder','fetchBalance','fetchTicker']
         self.tradeSets = {}
-        self.exchange = getattr (ccxt, exchName) ({'enableRateLimit': True,'options': { 'adjustForTimeDifference': True }}) # 'nonce': ccxt.Exchange.milliseconds,
+        # requests are throttled by the request scheduler of the account, ccxt's own throttling would delay them twice
+        config = {'enableRateLimit': False,'options': { 'adjustForTimeDifference': True }} # 'nonce': ccxt.Exchange.milliseconds,
+        # paper trading handlers are saved as <exchange>-paper, so that their trade sets are never loaded onto the real
+        # exchange (and those of real handlers not onto the simulated one) when the paperTrading setting is changed
+        if exchName.endswith('-paper'):
+            exchName = exchName[:-len('-paper')]
+            paperTrading = True
+        self.paperTrading = self.paperTrading if paperTrading is None else bool(paperTrading)
+        if exchName.startswith('simulated'):
+            # several simulated exchanges can be told apart by their name, e.g. simulated2
+            self.paperTrading = False
+            self.exchange = simulatedExchange(dict(config,id=exchName))
+        elif self.paperTrading:
+            # orders are only simulated, prices come from the real exchange, whose requests are throttled by ccxt as
+            # they do not go through a request scheduler of their own. The account is kept in a file per API key (see
+            # updateKeys), until then it is only kept in memory
+            self.exchange = simulatedExchange(dict(config,priceSource=getattr(ccxt,exchName)(dict(config,enableRateLimit=True)),simulation={'balance':self.paperTradingBalance}))
+        else:
+            self.exchange = getattr (ccxt, exchName) (config)
         if key:
             self.exchange.apiKey = key
         if secret:
@@ -50,10 +149,43 @@ class tradeHandler:
             self.exchange.password = password
         if uid:
             self.exchange.uid = uid
+        # tickers are shared with all other handlers of the same exchange
+        self.marketData = getMarketDataHub(self.exchange)
+        # markets metadata is shared via a cache on disk
+        self.marketsCache = getMarketsCache()
+        self.marketsStamp = None
+        self.formatters = {}
+        self.retryPolicy = retryPolicy()
+        self.circuitBreaker = getCircuitBreaker(self.exchange.id)
+        # priority of the requests made by the current thread (see requestPriority)
+        self.priorityContext = threading.local()
+        # checks the stop-losses at each price of an attached price feed, in between the update cycles
+        self.slEvaluator = stopLossEvaluator(self)
+        self.slBook = stopLossBook()
+        self.slBookLock = threading.Lock()
+        self.tsVersion = 0
+        self.tsVersions = {}
+        self.versionLock = threading.Lock()
+        # status texts of the trade sets with the state they were rendered for (see getTradeSetInfos)
+        self.infoCache = {}
 
-        self.updating = False
-        self.waiting = []
+        # each trade set has its own lock so that editing one trade set does not have to wait for the update of another
+        self.lockStats = lockStats()
+        self.tsLocks = {}
+        self.registryLock = threading.Lock()
+        self.balanceLock = fifoLock(self.lockStats)
+        # the balance is kept up to date by the orders of the bot and only fetched from time to time
+        self.ledger = balanceLedger()
+        # running sums/counts of the levels of each trade set, so that e.g. sumBuyAmounts does not scan all levels
+        self.levelStats = {}
         self.authenticated = False
+        self.bulkOrderFetch = True  # resolve order states with one request per symbol instead of one per order
+        # own trades are fetched incrementally and indexed by order id to get the fills of market orders
+        self.fills = tradeCursor(self.exchange)
+        # trade sets close to a trigger are checked between the update cycles
+        self.scheduler = pollScheduler()
+        # closed candles for the candleAbove buy levels
+        self.candles = candleEngine(self.exchange)
         if key:
             self.updateKeys(key,secret,password,uid)
                         
@@ -61,17 +193,12 @@ class tradeHandler:
             text = 'Exchange %s does not support all required features (%s)'%(exchName,', '.join(checkThese))
             self.message(text,'error')
             raise Exception(text)
-        self.amount2Prec = lambda a,b: self.stripZeros(self.exchange.amountToPrecision(a,b)) if isinstance(self.exchange.amountToPrecision(a,b),str) else self.stripZeros(format(self.exchange.amountToPrecision(a,b),'.10f'))
-        self.price2Prec = lambda a,b: self.stripZeros(self.exchange.priceToPrecision(a,b)) if isinstance(self.exchange.priceToPrecision(a,b),str) else self.stripZeros(format(self.exchange.priceToPrecision(a,b),'.10f'))
-        self.cost2Prec = lambda a,b: self.stripZeros(self.exchange.costToPrecision(a,b)) if isinstance(self.exchange.costToPrecision(a,b),str) else self.stripZeros(format(self.exchange.costToPrecision(a,b),'.10f'))
-        self.fee2Prec = lambda a,b: self.stripZeros(str(b))
-        
-        
           
     def __reduce__(self):
         # function needes for serializing the object
 #        return (self.__class__, (self.exchange.__class__.__name__,self.exchange.apiKey,self.exchange.secret,self.exchange.password,self.exchange.uid,self.message),self.__getstate__(),None,None)
-        return (self.__class__, (self.exchange.__class__.__name__,None,None,None,None,self.message),self.__getstate__(),None,None)
+        exchName = getattr(self.exchange,'exchangeName',self.exchange.__class__.__name__)
+        return (self.__class__, (exchName + '-paper' if self.paperTrading else exchName,None,None,None,None,self.message,self.paperTrading),self.__getstate__(),None,None)
     
     def __setstate__(self,state):
         for iTs in state: # temp fix for old trade sets that do not have the actualAmount var
@@ -85,7 +212,11 @@ class tradeHandler:
                         trade['actualAmount'] = trade['amount'] - (fee['cost'] if self.exchange.name.lower() != 'binance' or self.getFreeBalance('BNB') < 0.5 else 0) # this is a hack, as fees on binance are deduced from BNB if this is activated and there is enough BNB, however so far no API chance to see if this is the case. Here I assume that 0.5 BNB are enough to pay the fee for the trade and thus the fee is not subtracted from the traded coin
                     else:
                         trade['actualAmount'] = trade['amount']
+            # levels of old pickles are dicts
+            ts['InTrades'] = [tradeLevel.fromDict(trade) for trade in ts['InTrades']]
+            ts['OutTrades'] = [tradeLevel.fromDict(trade) for trade in ts['OutTrades']]
         self.tradeSets = state
+        self.levelStats = {}
         
     def __getstate__(self):
         return self.tradeSets
@@ -96,6 +227,36 @@ class tradeHandler:
             return string.rstrip('0').rstrip('.')
         else:
             return string
+    
+    def formatter(self,symbol):
+        # returns the precision formatter of the symbol, which is built once after each (re)load of the markets
+        try:
+            return self.formatters[symbol]
+        except KeyError:
+            self.formatters[symbol] = precisionFormatter(self.exchange,symbol)
+            return self.formatters[symbol]
+    
+    # the *2Prec functions return strings for messages, the *2Float functions the rounded numbers
+    def amount2Prec(self,symbol,value):
+        return self.formatter(symbol).amountToString(value)
+    
+    def price2Prec(self,symbol,value):
+        return self.formatter(symbol).priceToString(value)
+    
+    def cost2Prec(self,symbol,value):
+        return self.formatter(symbol).costToString(value)
+    
+    def fee2Prec(self,symbol,value):
+        return self.stripZeros(str(value))
+    
+    def amount2Float(self,symbol,value):
+        return self.formatter(symbol).amountToFloat(value)
+    
+    def price2Float(self,symbol,value):
+        return self.formatter(symbol).priceToFloat(value)
+    
+    def cost2Float(self,symbol,value):
+        return self.formatter(symbol).costToFloat(value)
         
     def checkNum(self,*value):
         return all([(isinstance(val,float) | isinstance(val,int)) if not isinstance(val,list) else self.checkNum(*val) for val in value])
@@ -105,91 +266,228 @@ class tradeHandler:
             raise ValueError('Type is not amount, price or cost')
         return (self.exchange.markets[symbol]['limits'][typ]['min'] is None or qty >= self.exchange.markets[symbol]['limits'][typ]['min']) and (self.exchange.markets[symbol]['limits'][typ]['max'] is None or qty <= self.exchange.markets[symbol]['limits'][typ]['max'])
         
-    def safeRun(self,func,printError=True):
+    @contextlib.contextmanager
+    def requestPriority(self,priority):
+        # requests made by this thread within the block are served with this priority, requests with an explicit
+        # priority with at least this priority
+        previous = getattr(self.priorityContext,'priority',None)
+        self.priorityContext.priority = priority
+        try:
+            yield
+        finally:
+            self.priorityContext.priority = previous
+    
+    def safeRun(self,func,printError=True,priority=None):
+        # runs the exchange request with retries according to the retry policy and stops calling the exchange while
+        # its circuit breaker is open. The request waits for its turn in the request scheduler of the account. Each call is
+        # counted and timed (including waiting and retries) in the metrics with its outcome and number of retries, and
+        # traced with one span per request and attempt if it is part of a sampled cycle
+        context = getattr(self.priorityContext,'priority',None)
+        if priority is None:
+            priority = context or 'status'
+        elif context is not None:
+            priority = min(priority,context,key=PRIORITIES.get)
+        scheduler = getRequestScheduler(self.exchange)
         count = 0
-        while True:
-            try:
-                return func()
-            except NetworkError as e:
-                count += 1
-                if hasattr(self.exchange, 'load_time_difference'):
-                    self.exchange.load_time_difference()
-                if count >= 5:
-                    self.updating = False
-                    self.message('Network exception occurred 5 times in a row on %s'%self.exchange.name)                
-                    raise(e)
-                else:
-                    time.sleep(0.5)
-                    continue
-            except OrderNotFound as e:
-                count += 1
-                if count >= 5:
-                    self.updating = False
-                    self.message('Order not found error 5 times in a row on %s'%self.exchange.name)             
-                    raise(e)
-                else:
-                    time.sleep(0.5)
-                    continue
-            except AuthenticationError as e:
-                count += 1
-                if count >= 5:
-                    self.updating = False
-                    raise(e)
-                else:
-                    time.sleep(0.5)
-                    continue
-            except InvalidNonce as e:
-                count += 1
-                # this tries to resync the system timestamp with the exchange's timestamp
-                if hasattr(self.exchange, 'load_time_difference'):
-                    self.exchange.load_time_difference()
-                time.sleep(0.5)
-                continue
-            except JSONDecodeError as e:
-                if 'Expecting value' in str(e):
-                    self.message('%s seems to be down.'%self.exchange.name)   
-                raise(e)
-            except Exception as e:
-                if count < 4 and ('unknown error' in str(e).lower() or 'connection' in str(e).lower()):
-                    count += 1
-                    time.sleep(0.5)
-                    continue
-                else:
-                    self.updating = False
-                    string = ''
-                    if count >= 5:
-                        string += 'Network exception occurred 5 times in a row! Last error was:\n'
-                    exc_type, exc_obj, exc_tb = sys.exc_info()
-                    fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-                    string += '%s in %s at line %s: %s'%(exc_type, fname, exc_tb.tb_lineno,str(e))
-                    if printError:
-                        self.message(string,'Error')
-                    raise(e)
+        started = time.time()
+        resynced = False
+        method = methodName(func)
+        outcome = 'ok'
+        probe = False
+        try:
+            with traceSpan('request',method=method,priority=priority) as requestSpan:
+                while True:
+                    if not probe:  # retries of the probe must not be rejected by the breaker they are probing
+                        probe = self.circuitBreaker.check()
+                    try:
+                        with traceSpan('attempt',method=method,attempt=count+1):
+                            result = scheduler.run(func,priority,method not in PUBLIC_METHODS)
+                    except InvalidNonce as e:  # has to be caught before NetworkError as it is a subclass of it
+                        count += 1
+                        self.circuitBreaker.recordSuccess()  # the exchange answered
+                        # this tries to resync the system timestamp with the exchange's timestamp
+                        if not resynced and hasattr(self.exchange, 'load_time_difference'):
+                            self.exchange.load_time_difference()
+                            resynced = True
+                        if self.waitForRetry('InvalidNonce',count,started):
+                            continue
+                        self.message('Invalid nonce error occurred %d times in a row on %s'%(count,self.exchange.name))
+                        raise(e)
+                    except NetworkError as e:
+                        count += 1
+                        if self.circuitBreaker.recordFailure():
+                            self.message('%s seems to be down. Requests to it are paused for %d s'%(self.exchange.name,self.circuitBreaker.currentCooldown),'error')
+                        if self.waitForRetry('NetworkError',count,started):
+                            continue
+                        self.message('Network exception occurred %d times in a row on %s'%(count,self.exchange.name))                
+                        raise(e)
+                    except OrderNotFound as e:
+                        count += 1
+                        self.circuitBreaker.recordSuccess()
+                        if self.waitForRetry('OrderNotFound',count,started):
+                            continue
+                        self.message('Order not found error %d times in a row on %s'%(count,self.exchange.name))             
+                        raise(e)
+                    except AuthenticationError as e:
+                        count += 1
+                        self.circuitBreaker.recordSuccess()
+                        if self.waitForRetry('AuthenticationError',count,started):
+                            continue
+                        raise(e)
+                    except JSONDecodeError as e:
+                        if 'Expecting value' in str(e):
+                            self.circuitBreaker.recordFailure()
+                            self.message('%s seems to be down.'%self.exchange.name)   
+                        raise(e)
+                    except Exception as e:
+                        if 'unknown error' in str(e).lower() or 'connection' in str(e).lower():
+                            count += 1
+                            if self.circuitBreaker.recordFailure():
+                                self.message('%s seems to be down. Requests to it are paused for %d s'%(self.exchange.name,self.circuitBreaker.currentCooldown),'error')
+                            if self.waitForRetry('unknown',count,started):
+                                continue
+                        else:
+                            self.circuitBreaker.recordSuccess()
+                            self.retryPolicy.record('other',False)
+                        if isinstance(e,InvalidOrder):
+                            # order was rejected, maybe because precision or limits of the market changed
+                            self.invalidateMarkets()
+                        string = ''
+                        if count > 1:
+                            string += 'Network exception occurred %d times in a row! Last error was:\n'%count
+                        exc_type, exc_obj, exc_tb = sys.exc_info()
+                        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+                        string += '%s in %s at line %s: %s'%(exc_type, fname, exc_tb.tb_lineno,str(e))
+                        if printError:
+                            self.message(string,'Error')
+                        raise(e)
+                    else:
+                        self.circuitBreaker.recordSuccess()
+                        if requestSpan is not None and isinstance(result,dict) and result.get('id') is not None:
+                            requestSpan['attributes']['order'] = result['id']  # correlates the spans of an order
+                        return result
+        except Exception as e:
+            outcome = e.__class__.__name__
+            raise
+        finally:
+            if probe:
+                self.circuitBreaker.endProbe()
+            recordRequest(getattr(self.exchange,'exchangeName',self.exchange.__class__.__name__),method,outcome,count if outcome == 'ok' else max(count-1,0),time.time()-started)
+    
+    def waitForRetry(self,errorType,count,started):
+        # sleeps before the next retry and returns True, or returns False if retry budget or deadline are exhausted
+        delay = self.retryPolicy.nextDelay(errorType,count,started)
+        self.retryPolicy.record(errorType,delay is not None)
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+    
+    def getRetryStats(self):
+        # retry counts of this handler, the circuit breaker state of its exchange and the queue depth and waiting
+        # times of the request scheduler of the account
+        stats = self.retryPolicy.stats()
+        stats['circuitBreaker'] = self.circuitBreaker.status()
+        stats['requests'] = getRequestScheduler(self.exchange).status()
+        return stats
         
-
-    def waitForUpdate(self):
-        # avoids two processes changing a tradeset at the same time
-        count = 0
-        mystamp = time.time()
-        self.waiting.append(mystamp)
-        time.sleep(0.2)
-        while self.updating or self.waiting[0] < mystamp:
-            count += 1
-            time.sleep(1)		
-            if count > 60: # 60 sec max wait
-                try:  # cautionary so that no timestamp can stay in the queue due to some messaging error
-                    self.message('Waiting for tradeSet update to finish timed out after 1 min, resetting updating variable','error')
-                except:
-                    pass
-                break
-        self.updating = True
-        self.waiting.remove(mystamp)
+    def tradeSetLock(self,iTs):
+        # returns the lock of the trade set, which avoids two threads changing the trade set at the same time
+        with self.registryLock:
+            if iTs not in self.tradeSets:  # unknown or already deleted trade set, do not register a lock for it
+                return self.tsLocks.get(iTs,fifoLock(self.lockStats))
+            if iTs not in self.tsLocks:
+                self.tsLocks[iTs] = fifoLock(self.lockStats)
+            return self.tsLocks[iTs]
+    
+    def removeTradeSet(self,iTs):
+        # removes the trade set and its lock (should be called while holding the lock of the trade set)
+        with self.registryLock:
+            self.tradeSets.pop(iTs,None)
+            self.tsLocks.pop(iTs,None)
+            self.levelStats.pop(iTs,None)
+            with self.versionLock:
+                self.tsVersions.pop(iTs,None)
+            self.infoCache.pop(iTs,None)
+        self.scheduler.unschedule(iTs)
+    
+    def getLockStats(self):
+        # number of lock acquisitions, number of acquisitions that had to wait and the total/maximum waiting time in seconds
+        return self.lockStats.asDict()
+    
+    def getLevelStats(self,iTs,direction):
+        # returns the running aggregates of the buy or sell levels of the trade set, built from the levels on first use
+        if iTs not in self.levelStats:
+            ts = self.tradeSets[iTs]
+            self.levelStats[iTs] = {'buy': levelAggregates(ts['InTrades']), 'sell': levelAggregates(ts['OutTrades'],False)}
+        return self.levelStats[iTs][direction]
+    
+    # all changes of buy/sell levels have to go through the following functions to keep the aggregates up to date
+    def addLevel(self,iTs,direction,level):
+        level = tradeLevel.fromDict(level)
+        self.getLevelStats(iTs,direction).add(level)
+        self.tradeSets[iTs]['OutTrades' if direction == 'sell' else 'InTrades'].append(level)
+    
+    def removeLevel(self,iTs,direction,iTrade):
+        level = self.tradeSets[iTs]['OutTrades' if direction == 'sell' else 'InTrades'].pop(iTrade)
+        self.getLevelStats(iTs,direction).remove(level)
+        return level
+    
+    def updateLevel(self,iTs,direction,iTrade,**changes):
+        level = self.tradeSets[iTs]['OutTrades' if direction == 'sell' else 'InTrades'][iTrade]
+        stats = self.getLevelStats(iTs,direction)
+        stats.remove(level)
+        level.update(changes)
+        stats.add(level)
+    
+    def clearLevels(self,iTs):
+        ts = self.tradeSets[iTs]
+        ts['InTrades'] = []
+        ts['OutTrades'] = []
+        self.levelStats.pop(iTs,None)
+        
+    def fetchTicker(self,symbol,maxAge=None):
+        # returns the (cached) ticker of the symbol from the market data hub of this exchange
+        return self.marketData.getTicker(symbol,self.safeRun,maxAge)
+    
+    def fetchTickers(self,symbols=None,maxAge=None):
+        return self.marketData.getTickers(symbols,self.safeRun,maxAge)
+    
+    def attachPriceFeed(self,feed=None):
+        # lets the stop-loss evaluator receive the prices of the feed (default: the polling feed of the exchange)
+        if feed is None:
+            feed = getPriceFeed(self.marketData,self.circuitBreaker)
+        feed.addListener(self.slEvaluator)
+        return feed
+        
+    def loadMarkets(self):
+        # sets the markets of the exchange from the markets cache, which only downloads them if they are outdated
+        stamp = self.marketsCache.load(self.exchange,self.safeRun,self.marketsStamp)
+        if stamp != self.marketsStamp:
+            self.formatters = {}  # precision may have changed
+            self.marketsStamp = stamp
+    
+    def invalidateMarkets(self):
+        self.marketsCache.invalidate(self.exchange.id)
+        self.marketsStamp = None
         
+    @property
+    def balance(self):
+        return self.ledger.balance
+    
     def updateBalance(self):
         # reloads the exchange market and private balance and, if successul, sets the exchange as authenticated
-        self.safeRun(self.exchange.loadMarkets) 
-        self.balance = self.safeRun(self.exchange.fetch_balance)
-        self.authenticated = True
+        with self.balanceLock:
+            self.loadMarkets()
+            self.ledger.reconcile(self.safeRun(self.exchange.fetch_balance))
+            self.authenticated = True
+    
+    def refreshBalance(self):
+        # fetches the balance only if the ledger drifted or was not reconciled for a while
+        if self.ledger.needsReconcile():
+            self.updateBalance()
+        else:
+            self.loadMarkets()
         
     def getFreeBalance(self,coin):
         if coin in self.balance:
@@ -206,6 +504,8 @@ class tradeHandler:
             self.exchange.password = password
         if uid:
             self.exchange.uid = uid
+        if self.paperTrading and self.exchange.apiKey:
+            self.exchange.openAccount(self.paperStateFile())
         try: # check if keys work
             self.updateBalance()
         except AuthenticationError as e:#
@@ -228,6 +528,12 @@ class tradeHandler:
                     print('An error occured at exchange %s. The following error occurred:\n%s'%(self.exchange.name,str(e)))
           
     
+    def paperStateFile(self):
+        # file of the paper trading account of the API key, so that the handlers of different users (each with its own
+        # simulated exchange) never share one account. The key itself is not written to disk
+        keyHash = hashlib.sha256(self.exchange.apiKey.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.paperTradingFolder,'%s-%s.json'%(self.exchange.exchangeName,keyHash))
+    
     def initTradeSet(self,symbol):
         self.updateBalance()
         ts = {}
@@ -235,7 +541,7 @@ class tradeHandler:
         ts['InTrades'] = []
         iTs = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
         # redo if uid already reserved
-        while iTs in self.tradeSets:
+        while iTs in self.tradeSets or iTs in self.tsLocks:
             iTs = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
         ts['OutTrades'] = []
         ts['baseCurrency'] = re.search("(?<=/).*", symbol).group(0)
@@ -248,11 +554,12 @@ class tradeHandler:
         ts['SL'] = None
         ts['active'] = False
         ts['virgin'] = True
-        self.waitForUpdate()
-        self.tradeSets[iTs] = ts
-        self.updating = False
+        ts['candleChecked'] = self.candles.lastClosed()  # only candles closing after the creation count
+        with self.registryLock:
+            self.tradeSets[iTs] = ts
         return ts, iTs
         
+    @lockTradeSet
     def activateTradeSet(self,iTs,verbose=True):
         ts = self.tradeSets[iTs]
         wasactive = ts['active']
@@ -274,6 +581,7 @@ class tradeHandler:
         self.initBuyOrders(iTs)
         return wasactive
     
+    @lockTradeSet
     def deactivateTradeSet(self,iTs,cancelOrders=False):
         wasactive = self.tradeSets[iTs]['active']
         if cancelOrders:
@@ -301,10 +609,10 @@ class tradeHandler:
         ts, iTs = self.initTradeSet(symbol)
 
         # truncate values to precision        
-        sellLevels = [float(self.exchange.priceToPrecision(ts['symbol'],val)) for val in sellLevels]
-        buyLevels = [float(self.exchange.priceToPrecision(ts['symbol'],val)) for val in buyLevels]
-        sellAmounts = [float(self.exchange.amountToPrecision(ts['symbol'],val)) for val in sellAmounts]
-        buyAmounts = [float(self.exchange.amountToPrecision(ts['symbol'],val)) for val in buyAmounts]
+        sellLevels = [self.price2Float(ts['symbol'],val) for val in sellLevels]
+        buyLevels = [self.price2Float(ts['symbol'],val) for val in buyLevels]
+        sellAmounts = [self.amount2Float(ts['symbol'],val) for val in sellAmounts]
+        buyAmounts = [self.amount2Float(ts['symbol'],val) for val in buyAmounts]
 
         # sort sell levels and amounts to have lowest level first
         idx = np.argsort(sellLevels)
@@ -339,9 +647,47 @@ class tradeHandler:
         self.update()
         return iTs
         
-    def getTradeSetInfo(self,iTs,showProfitIn=None):
+    def conversionSymbols(self,currency,showProfitIn):
+        # the pairs (of existing markets) to convert a gain in currency to the currencies of showProfitIn
+        if showProfitIn is None:
+            return []
+        if isinstance(showProfitIn,str):
+            showProfitIn = [showProfitIn]
+        return [symbol for cur in showProfitIn for symbol in ['%s/%s'%(currency,cur),'%s/%s'%(cur,currency)] if symbol in self.exchange.symbols]
+    
+    def getTradeSetInfos(self,showProfitIn=None,tradeSetIds=None):
+        # status texts of all trade sets (or those of tradeSetIds) in their order, rendered with one ticker snapshot for
+        # all symbols and conversion pairs. A text is only rendered again if the trade set, its number, its ticker or the
+        # conversion rates changed. Returns a list of (trade set id, text)
+        selected = [(index,iTs,self.tradeSets.get(iTs)) for index,iTs in enumerate(list(self.tradeSets)) if tradeSetIds is None or iTs in tradeSetIds]
+        selected = [item for item in selected if item[2] is not None]
+        symbols = set()
+        for index,iTs,ts in selected:
+            symbols.add(ts['symbol'])
+            symbols.update(self.conversionSymbols(ts['baseCurrency'],showProfitIn))
+        tickers = (self.fetchTickers(sorted(symbols)) if len(symbols) > 0 else None) or {}
+        profitIn = tuple([showProfitIn] if isinstance(showProfitIn,str) else showProfitIn or [])
+        infos = []
+        for index,iTs,ts in selected:
+            prices = tuple(tickers.get(symbol,{}).get(key) for symbol in [ts['symbol']]+self.conversionSymbols(ts['baseCurrency'],showProfitIn) for key in ['last','high','low'])
+            # the stop-loss is part of the key, as trailing stop-losses are moved without changing the version
+            key = (self.tsVersions.get(iTs,0),index,ts['SL'],prices,profitIn)
+            cached = self.infoCache.get(iTs)
+            if cached is None or cached[0] != key:
+                cached = (key,self.getTradeSetInfo(iTs,showProfitIn,tickers,index))
+                self.infoCache[iTs] = cached
+            infos.append((iTs,cached[1]))
+        return infos
+    
+    def getTradeSetInfo(self,iTs,showProfitIn=None,tickers=None,index=None):
+        # tickers is a snapshot of the tickers (e.g. of getTradeSetInfos), index the number of the trade set if known
         ts = self.tradeSets[iTs]
-        string = '*%srade set #%d on %s [%s]:*\n'%('T' if ts['active'] else 'INACTIVE t',list(self.tradeSets.keys()).index(iTs),self.exchange.name,ts['symbol'])
+        if tickers is None:
+            tickers = {}
+        if index is None:
+            index = list(self.tradeSets.keys()).index(iTs)
+        fetchTicker = lambda symbol: tickers[symbol] if symbol in tickers else self.fetchTicker(symbol)
+        string = '*%srade set #%d on %s [%s]:*\n'%('T' if ts['active'] else 'INACTIVE t',index,self.exchange.name,ts['symbol'])
         filledBuys = []
         filledSells = []
         for iTrade,trade in enumerate(ts['InTrades']):
@@ -380,7 +726,7 @@ class tradeHandler:
             string += '*Filled buy orders (fee subtracted):* %s %s for an average price of %s\n'%(self.amount2Prec(ts['symbol'],sumBuys),ts['coinCurrency'],self.cost2Prec(ts['symbol'],sum([val[0]*val[1]/sumBuys if sumBuys > 0 else None for val in filledBuys])))
         if sumSells>0:
             string += '*Filled sell orders:* %s %s for an average price of %s\n'%(self.amount2Prec(ts['symbol'],sumSells),ts['coinCurrency'],self.cost2Prec(ts['symbol'],sum([val[0]*val[1]/sumSells if sumSells > 0 else None for val in filledSells])))
-        ticker = self.safeRun(lambda: self.exchange.fetchTicker(ts['symbol']))
+        ticker = fetchTicker(ts['symbol'])
         string += '\n*Current market price *: %s, \t24h-high: %s, \t24h-low: %s\n'%tuple([self.price2Prec(ts['symbol'],val) for val in [ticker['last'],ticker['high'],ticker['low']]])
         if (ts['initCoins'] == 0 or ts['initPrice'] is not None) and ts['costIn'] > 0 and (sumBuys>0 or ts['initCoins'] > 0):
             totalAmountToSell = ts['coinsAvail'] + self.sumSellAmounts(iTs,'open')
@@ -397,23 +743,38 @@ class tradeHandler:
                 if ind is not None:
                     thisCur = showProfitIn[ind]
                     if conversionPairs[ind] == 1:
-                        gain *= self.safeRun(lambda: self.exchange.fetchTicker('%s/%s'%(ts['baseCurrency'],thisCur)))['last']
+                        gain *= fetchTicker('%s/%s'%(ts['baseCurrency'],thisCur))['last']
                     else:
-                        gain /= self.safeRun(lambda: self.exchange.fetchTicker('%s/%s'%(thisCur,ts['baseCurrency'])))['last']
+                        gain /= fetchTicker('%s/%s'%(thisCur,ts['baseCurrency']))['last']
             string += '\n*Estimated gain/loss when selling all now: * %s %s (%+.2f %%)\n'%(self.cost2Prec(ts['symbol'],gain),thisCur,gainOrig/(ts['costIn'])*100)
         return string
     
+    def backtestTradeSet(self,iTs,candles,grid=None):
+        # replays the levels and stop-losses of the trade set on historical candles (as returned by fetchOHLCV or a dict
+        # of columns) with the fees of the exchange. grid (dict key -> list of values) backtests variants of it at once
+        if not isinstance(candles,dict):
+            candles = candleColumns(candles)
+        ts = self.tradeSets[iTs]
+        # the fees of the market as used by calculateFee, or else the general ones of the exchange
+        market = self.exchange.markets[ts['symbol']]
+        fees = {typ: market.get(typ) or self.exchange.fees['trading'].get(typ) or 0. for typ in ['maker','taker']}
+        definition = tradeSetDefinition(ts,fees)
+        # like the actualAmount of the buy levels, the bought coins are only reduced by the fee if it is paid in the coin
+        definition['buyFeeInCoin'] = self.exchange.calculateFee(ts['symbol'],'limit','buy',1,1,'maker')['currency'] == ts['coinCurrency']
+        definitions = variants(definition,grid) if grid else [definition]
+        return definitions, runBacktest(candles,definitions)
+    
+    @lockTradeSet
     def deleteTradeSet(self,iTs,sellAll=False):
-        self.waitForUpdate()
         if sellAll:
             sold = self.sellAllNow(iTs)
         else:
             sold = True
             self.deactivateTradeSet(iTs,1)
         if sold:
-            self.tradeSets.pop(iTs)
-        self.updating = False
+            self.removeTradeSet(iTs)
     
+    @lockTradeSet
     def addInitCoins(self,iTs,initCoins=0,initPrice=None):
         if self.checkNum(initCoins,initPrice) or (initPrice is None and self.checkNum(initCoins)):
             if initPrice is not None and initPrice < 0:
@@ -423,8 +784,6 @@ class tradeHandler:
             if self.getFreeBalance(ts['coinCurrency']) < initCoins:
                 self.message('Adding initial balance failed: %s %s requested but only %s %s are free!'%(self.amount2Prec(ts['symbol'],initCoins),ts['coinCurrency'],self.amount2Prec(ts['symbol'],self.getFreeBalance(ts['coinCurrency'])),ts['coinCurrency']),'error')
                 return 0
-            self.waitForUpdate()
-            
             if ts['coinsAvail'] > 0 and ts['initPrice'] is not None:
                 # remove old cost again
                 ts['costIn'] -= (ts['coinsAvail']*ts['initPrice'])
@@ -434,7 +793,6 @@ class tradeHandler:
             ts['initPrice'] = initPrice
             if initPrice is not None:
                 ts['costIn'] += (initCoins*initPrice)
-            self.updating = False
             return 1
         else:
             raise ValueError('Some input was no number')
@@ -461,60 +819,33 @@ class tradeHandler:
         return self.getTradeParam(iTs,'price','min','buy',order)
     
     def getTradeParam(self,iTs,what,method,direction, order='all',subtractFee = True):
-        if method == 'sum':
-            func = lambda x: sum(x)
-        elif method == 'min':
-            func = lambda x: None if len(x)==0 else np.min(x)
-        elif method == 'max':
-            func = lambda x: None if len(x)==0 else np.max(x)
-        elif method == 'mean':
-            func = lambda x: None if len(x)==0 else np.mean(x)
-        elif method == 'num':
-            func = lambda x: len(x)
-            
-        if direction == 'sell':
-            trade = 'OutTrades'
-        else:
-            trade = 'InTrades'
-            
         if order not in ['all','filled','open','notfilled','notinitiated']:
             raise ValueError('order has to be all, filled, notfilled, notinitiated or open')
-            
+        if what == 'price' or method in ['sum','mean','num']:
+            return self.getLevelStats(iTs,'sell' if direction == 'sell' else 'buy').get(what,method,order,subtractFee)
+        # min/max of amounts or costs are not kept as aggregates, so scan the levels
+        if direction == 'sell':
+            trades = self.tradeSets[iTs]['OutTrades']
+        else:
+            trades = self.tradeSets[iTs]['InTrades']
+        if order == 'filled':
+            trades = [val for val in trades if val['oid'] == 'filled']
+        elif order == 'open':
+            trades = [val for val in trades if val['oid'] != 'filled' and val['oid'] is not None]
+        elif order == 'notinitiated':
+            trades = [val for val in trades if val['oid'] is None]
+        elif order == 'notfilled':
+            trades = [val for val in trades if val['oid'] != 'filled']
         if what == 'amount':
-            if order == 'all':
-                return func([(val['amount'] if direction == 'sell' or subtractFee == False else val['actualAmount']) for val in self.tradeSets[iTs][trade]])
-            elif order == 'filled':
-                return func([(val['amount'] if direction == 'sell' or subtractFee == False else val['actualAmount'])  for val in self.tradeSets[iTs][trade] if val['oid'] == 'filled'])
-            elif order == 'open':
-                return func([(val['amount'] if direction == 'sell' or subtractFee == False else val['actualAmount'])  for val in self.tradeSets[iTs][trade] if val['oid'] != 'filled' and val['oid'] is not None])
-            elif order == 'notinitiated':
-                return func([(val['amount'] if direction == 'sell' or subtractFee == False else val['actualAmount'])  for val in self.tradeSets[iTs][trade] if val['oid'] != 'filled' and val['oid'] is None])
-            elif order == 'notfilled':
-                return func([(val['amount'] if direction == 'sell' or subtractFee == False else val['actualAmount'])  for val in self.tradeSets[iTs][trade] if val['oid'] != 'filled'])
-        elif what == 'price':
-            if order == 'all':
-                return func([val['price'] for val in self.tradeSets[iTs][trade]])
-            elif order == 'filled':
-                return func([val['price'] for val in self.tradeSets[iTs][trade] if val['oid'] == 'filled'])
-            elif order == 'open':
-                return func([val['price'] for val in self.tradeSets[iTs][trade] if val['oid'] != 'filled' and val['oid'] is not None])
-            elif order == 'notinitiated':
-                return func([val['price'] for val in self.tradeSets[iTs][trade] if val['oid'] != 'filled' and val['oid'] is None])
-            elif order == 'notfilled':
-                return func([val['price'] for val in self.tradeSets[iTs][trade] if val['oid'] != 'filled'])   
-        elif what == 'cost':
-            if order == 'all':
-                return func([val['amount']*val['price'] for val in self.tradeSets[iTs][trade]])
-            elif order == 'filled':
-                return func([val['amount']*val['price'] for val in self.tradeSets[iTs][trade] if val['oid'] == 'filled'])
-            elif order == 'open':
-                return func([val['amount']*val['price'] for val in self.tradeSets[iTs][trade] if val['oid'] != 'filled' and val['oid'] is not None])
-            elif order == 'notinitiated':
-                return func([val['amount']*val['price'] for val in self.tradeSets[iTs][trade] if val['oid'] != 'filled' and val['oid'] is None])
-            elif order == 'notfilled':
-                return func([val['amount']*val['price'] for val in self.tradeSets[iTs][trade] if val['oid'] != 'filled'])   
+            values = [(val['amount'] if direction == 'sell' or subtractFee == False else val['actualAmount']) for val in trades]
+        else:
+            values = [val['amount']*val['price'] for val in trades]
+        if len(values) == 0:
+            return None
+        return min(values) if method == 'min' else max(values)
             
     
+    @lockTradeSet
     def addBuyLevel(self,iTs,buyPrice,buyAmount,candleAbove=None):
         ts = self.tradeSets[iTs]
         if self.checkNum(buyPrice,buyAmount,candleAbove) or (candleAbove is None and self.checkNum(buyPrice,buyAmount)):
@@ -533,31 +864,30 @@ class tradeHandler:
                 boughtAmount = buyAmount - (fee['cost'] if (self.exchange.name.lower() != 'binance' or self.getFreeBalance('BNB') < 0.5) else 0) # this is a hack, as fees on binance are deduced from BNB if this is activated and there is enough BNB, however so far no API chance to see if this is the case. Here I assume that 0.5 BNB are enough to pay the fee for the trade and thus the fee is not subtracted from the traded coin
             else:
                 boughtAmount = buyAmount
-            self.waitForUpdate()
             wasactive = self.deactivateTradeSet(iTs)  
-            ts['InTrades'].append({'oid': None, 'price': buyPrice, 'amount': buyAmount, 'actualAmount': boughtAmount, 'candleAbove': candleAbove})
+            self.addLevel(iTs,'buy',tradeLevel(None,buyPrice,buyAmount,boughtAmount,candleAbove))
             if wasactive:
                 self.activateTradeSet(iTs,0)   
-            self.updating = False
             return  self.numBuyLevels(iTs)-1
         else:
             raise ValueError('Some input was no number')
     
+    @lockTradeSet
     def deleteBuyLevel(self,iTs,iTrade): 
         
         if self.checkNum(iTrade):
-            self.waitForUpdate()
             ts = self.tradeSets[iTs]
             wasactive = self.deactivateTradeSet(iTs)
             if ts['InTrades'][iTrade]['oid'] is not None and ts['InTrades'][iTrade]['oid'] != 'filled' :
                 self.cancelOrder(ts['InTrades'][iTrade]['oid'],ts['symbol'],'BUY')
-            ts['InTrades'].pop(iTrade)
+                self.ledger.orderCanceled(ts['InTrades'][iTrade]['oid'])
+            self.removeLevel(iTs,'buy',iTrade)
             if wasactive:
                 self.activateTradeSet(iTs,0) 
-            self.updating = False
         else:
             raise ValueError('Some input was no number')
             
+    @lockTradeSet
     def setBuyLevel(self,iTs,iTrade,price,amount):   
         if self.checkNum(iTrade,price,amount):
             ts = self.tradeSets[iTs]
@@ -583,7 +913,8 @@ class tradeHandler:
                 
                 if ts['InTrades'][iTrade]['oid'] is not None and ts['InTrades'][iTrade]['oid'] != 'filled' :
                     self.cancelOrder(ts['InTrades'][iTrade]['oid'],ts['symbol'],'BUY')
-                ts['InTrades'][iTrade].update({'amount': amount, 'actualAmount': boughtAmount, 'price': price})
+                    self.ledger.orderCanceled(ts['InTrades'][iTrade]['oid'])
+                self.updateLevel(iTs,'buy',iTrade,amount=amount,actualAmount=boughtAmount,price=price)
                 
                 if wasactive:
                     self.activateTradeSet(iTs,0)                
@@ -591,6 +922,7 @@ class tradeHandler:
         else:
             raise ValueError('Some input was no number')
     
+    @lockTradeSet
     def addSellLevel(self,iTs,sellPrice,sellAmount):
         ts = self.tradeSets[iTs]
         if self.checkNum(sellPrice,sellAmount):
@@ -600,32 +932,31 @@ class tradeHandler:
             elif not self.checkQuantity(ts['symbol'],'price',sellPrice):
                 self.message('Adding sell level failed, price is not within the range, the exchange accepts')
                 return 0 
-            self.waitForUpdate()
             wasactive = self.deactivateTradeSet(iTs)  
-            ts['OutTrades'].append({'oid': None, 'price': sellPrice, 'amount': sellAmount})
+            self.addLevel(iTs,'sell',tradeLevel(None,sellPrice,sellAmount))
             if wasactive:
                 self.activateTradeSet(iTs,0)  
-            self.updating = False
             return  self.numSellLevels(iTs)-1
         else:
             raise ValueError('Some input was no number')
 
+    @lockTradeSet
     def deleteSellLevel(self,iTs,iTrade):   
         
         if self.checkNum(iTrade):
-            self.waitForUpdate()
             ts = self.tradeSets[iTs]
             wasactive = self.deactivateTradeSet(iTs)
             if ts['OutTrades'][iTrade]['oid'] is not None and ts['OutTrades'][iTrade]['oid'] != 'filled' :
                 self.cancelOrder(ts['OutTrades'][iTrade]['oid'],ts['symbol'],'SELL')
+                self.ledger.orderCanceled(ts['OutTrades'][iTrade]['oid'])
                 ts['coinsAvail'] += ts['OutTrades'][iTrade]['amount']
-            ts['OutTrades'].pop(iTrade)
-            self.updating = False
+            self.removeLevel(iTs,'sell',iTrade)
             if wasactive:
                 self.activateTradeSet(iTs,0) 
         else:
             raise ValueError('Some input was no number')
     
+    @lockTradeSet
     def setSellLevel(self,iTs,iTrade,price,amount):   
         if self.checkNum(iTrade,price,amount):
             ts = self.tradeSets[iTs]
@@ -643,8 +974,8 @@ class tradeHandler:
                 
                 if ts['OutTrades'][iTrade]['oid'] is not None and ts['OutTrades'][iTrade]['oid'] != 'filled' :
                     self.cancelOrder(ts['OutTrades'][iTrade]['oid'],ts['symbol'],'SELL')
-                ts['OutTrades'][iTrade]['amount'] = amount
-                ts['OutTrades'][iTrade]['price'] = price
+                    self.ledger.orderCanceled(ts['OutTrades'][iTrade]['oid'])
+                self.updateLevel(iTs,'sell',iTrade,amount=amount,price=price)
                 
                 if wasactive:
                     self.activateTradeSet(iTs,0)                
@@ -652,12 +983,13 @@ class tradeHandler:
         else:
             raise ValueError('Some input was no number')
             
+    @lockTradeSet
     def setTrailingSL(self,iTs,value,typ='abs'):   
         ts = self.tradeSets[iTs]
         if self.checkNum(value):
             if self.numBuyLevels(iTs,'notfilled') > 0:
                 raise Exception('Trailing SL cannot be set as there are non-filled buy orders still')
-            ticker = self.safeRun(lambda: self.exchange.fetch_ticker(ts['symbol']))
+            ticker = self.fetchTicker(ts['symbol'])
             if typ == 'abs':
                 if value >= ticker['last'] or value <= 0:
                     raise ValueError('absolute trailing stop-loss offset is not between 0 and current price')
@@ -673,10 +1005,11 @@ class tradeHandler:
         else:
             raise ValueError('Input was no number')
             
+    @lockTradeSet
     def setSL(self,iTs,value):   
         if self.checkNum(value) or value is None:
             ts = self.tradeSets[iTs]
-            ticker = self.safeRun(lambda: self.exchange.fetch_ticker(ts['symbol']))
+            ticker = self.fetchTicker(ts['symbol'])
             if value is not None and ticker['last'] <= value:
                 self.message('Cannot set new SL as it is higher than the current market price')
                 return 0
@@ -686,6 +1019,7 @@ class tradeHandler:
         else:
             raise ValueError('Input was no number')
         
+    @lockTradeSet
     def setSLBreakEven(self,iTs):   
         ts = self.tradeSets[iTs]         
         if ts['initCoins'] > 0 and ts['initPrice'] is None:
@@ -699,8 +1033,8 @@ class tradeHandler:
             return 0
         else:
             self.setTrailingSL(iTs,None) # deactivate trailing SL
-            breakEvenPrice = (ts['costIn']-ts['costOut'])/((1-self.exchange.fees['trading']['taker'])*(ts['coinsAvail']+sum([trade['amount'] for trade in ts['OutTrades'] if trade['oid'] != 'filled' and trade['oid'] is not None])))
-            ticker = self.safeRun(lambda :self.exchange.fetch_ticker(ts['symbol']))
+            breakEvenPrice = (ts['costIn']-ts['costOut'])/((1-self.exchange.fees['trading']['taker'])*(ts['coinsAvail']+self.sumSellAmounts(iTs,'open')))
+            ticker = self.fetchTicker(ts['symbol'])
             if ticker['last'] < breakEvenPrice:
                 self.message('Break even SL of %s cannot be set as the current market price is lower (%s)!'%tuple([self.price2Prec(ts['symbol'],val) for val in [breakEvenPrice,ticker['last']]]))
                 return 0
@@ -708,108 +1042,225 @@ class tradeHandler:
                 ts['SL'] = breakEvenPrice
                 return 1
 
+    @lockTradeSet
+    @withPriority('emergency')
     def sellAllNow(self,iTs,price=None):
         self.deactivateTradeSet(iTs,1)
         ts = self.tradeSets[iTs]
-        ts['InTrades'] = []
-        ts['OutTrades'] = []
+        self.clearLevels(iTs)
         ts['SL'] = None # necessary to not retrigger SL
         sold = True
                 
         if ts['coinsAvail'] > 0 and self.checkQuantity(ts['symbol'],'amount',ts['coinsAvail']):
             if self.exchange.has['createMarketOrder']:
                 try:
-                    response = self.safeRun(lambda: self.exchange.createMarketSellOrder (ts['symbol'], ts['coinsAvail']),0)
+                    response = self.safeRun(lambda: self.exchange.createMarketSellOrder (ts['symbol'], ts['coinsAvail']),0,priority='order')
                 except:
                     params = { 'trading_agreement': 'agree' }  # for kraken api...
-                    response = self.safeRun(lambda: self.exchange.createMarketSellOrder (ts['symbol'], ts['coinsAvail'],params))
+                    response = self.safeRun(lambda: self.exchange.createMarketSellOrder (ts['symbol'], ts['coinsAvail'],params),priority='order')
             else:
                 if price is None:
-                    price = self.safeRun(lambda :self.exchange.fetch_ticker(ts['symbol'])['last'])
-                response = self.safeRun(lambda: self.exchange.createLimitSellOrder (ts['symbol'], ts['coinsAvail'],price))
-            time.sleep(5) # give exchange 5 sec for trading the order
-            try:
-                orderInfo = self.safeRun(lambda: self.exchange.fetchOrder (response['id'],ts['symbol']),0)
-            except ccxt.ExchangeError as e:
-                orderInfo = self.safeRun(lambda: self.exchange.fetchOrder (response['id'],ts['symbol'],{'type':'SELL'}))
+                    price = self.fetchTicker(ts['symbol'],maxAge=0)['last']
+                response = self.safeRun(lambda: self.exchange.createLimitSellOrder (ts['symbol'], ts['coinsAvail'],price),priority='order')
+            self.ledger.orderPlaced(response['id'],ts['symbol'],'sell',ts['coinsAvail'],price)
+            orderInfo = self.waitForOrder(response['id'],ts['symbol'],'SELL')
                     
-            if orderInfo['status']=='FILLED':
+            if orderInfo['status'].lower() in ['closed','filled']:
                 if orderInfo['type'] == 'market':
-                    trades = self.exchange.fetchMyTrades(ts['symbol'])
-                    orderInfo['cost'] = sum([tr['cost'] for tr in trades if tr['order'] == orderInfo['id']])
-                    orderInfo['price'] = np.mean([tr['price'] for tr in trades if tr['order'] == orderInfo['id']])
+                    self.addFills(ts['symbol'],orderInfo)
+                self.ledger.orderDone(orderInfo)
                 ts['costOut'] += orderInfo['cost']
                 self.message('Sold immediately at a price of %s %s: Sold %s %s for %s %s.'%(self.price2Prec(ts['symbol'],orderInfo['price']),ts['symbol'],self.amount2Prec(ts['symbol'],orderInfo['amount']),ts['coinCurrency'],self.cost2Prec(ts['symbol'],orderInfo['cost']),ts['baseCurrency']))
             else:
                 self.message('Sell order was not traded immediately, updating status soon.')
                 sold = False
-                ts['OutTrades'].append({'oid':response['id'],'price': orderInfo['price'],'amount': orderInfo['amount']})
+                self.addLevel(iTs,'sell',tradeLevel(response['id'],orderInfo['price'],orderInfo['amount']))
                 self.activateTradeSet(iTs,0)
         else:
             self.message('No coins (or too low amount) to sell from this trade set. Thus stop-loss is omitted.','warning')
         return sold
                 
+    @lockTradeSet
     def cancelSellOrders(self,iTs):
         if iTs in self.tradeSets and self.numSellLevels(iTs) > 0:
-            count = 0
-            for iTrade,trade in reversed(list(enumerate(self.tradeSets[iTs]['OutTrades']))):
-                if trade['oid'] is not None and trade['oid'] != 'filled':
-                    self.cancelOrder(trade['oid'],self.tradeSets[iTs]['symbol'],'SELL') 
-                    time.sleep(1)
-                    count += 1
-                    orderInfo = self.fetchOrder(trade['oid'],self.tradeSets[iTs]['symbol'],'SELL')
+            orderInfos = self.cancelLevelOrders(iTs,'sell')
+            for trade in self.tradeSets[iTs]['OutTrades']:
+                if trade['oid'] in orderInfos:
+                    orderInfo = orderInfos[trade['oid']]
                     if orderInfo['filled'] > 0:
                         self.message('Partly filled sell order found during canceling. Updating balance')
                         self.tradeSets[iTs]['costOut'] += orderInfo['price']*orderInfo['filled']
                         self.tradeSets[iTs]['coinsAvail'] -= orderInfo['filled']                                
                     self.tradeSets[iTs]['coinsAvail'] += trade['amount']
-            if count > 0:
-                self.message('%d sell orders canceled in total for tradeSet %d (%s)'%(count,list(self.tradeSets.keys()).index(iTs),self.tradeSets[iTs]['symbol']))
+            if len(orderInfos) > 0:
+                self.message('%d sell orders canceled in total for tradeSet %d (%s)'%(len(orderInfos),list(self.tradeSets.keys()).index(iTs),self.tradeSets[iTs]['symbol']))
         return True
         
+    @lockTradeSet
     def cancelBuyOrders(self,iTs):
         if iTs in self.tradeSets and self.numBuyLevels(iTs) > 0:
-            count = 0
-            for iTrade,trade in reversed(list(enumerate(self.tradeSets[iTs]['InTrades']))):
-                if trade['oid'] is not None and trade['oid'] != 'filled':
-                    self.cancelOrder(trade['oid'],self.tradeSets[iTs]['symbol'],'BUY') 
-                    time.sleep(1)
-                    count += 1
-                    orderInfo = self.fetchOrder(trade['oid'],self.tradeSets[iTs]['symbol'],'BUY')
+            orderInfos = self.cancelLevelOrders(iTs,'buy')
+            for trade in self.tradeSets[iTs]['InTrades']:
+                if trade['oid'] in orderInfos:
+                    orderInfo = orderInfos[trade['oid']]
                     if orderInfo['filled'] > 0:
                         self.message('Partly filled buy order found during canceling. Updating balance')
                         self.tradeSets[iTs]['costIn'] += orderInfo['price']*orderInfo['filled']
                         self.tradeSets[iTs]['coinsAvail'] += orderInfo['filled']   
-            if count > 0:
-                self.message('%d buy orders canceled in total for tradeSet %d (%s)'%(count,list(self.tradeSets.keys()).index(iTs),self.tradeSets[iTs]['symbol']))
+            if len(orderInfos) > 0:
+                self.message('%d buy orders canceled in total for tradeSet %d (%s)'%(len(orderInfos),list(self.tradeSets.keys()).index(iTs),self.tradeSets[iTs]['symbol']))
         return True
     
+    def cancelLevelOrders(self,iTs,direction):
+        # cancels the open orders of the buy or sell levels of the trade set with as few requests as possible and
+        # returns a dict oid -> order info after canceling, which tells if an order was (partly) filled before
+        ts = self.tradeSets[iTs]
+        symbol = ts['symbol']
+        typ = 'SELL' if direction == 'sell' else 'BUY'
+        oids = [trade['oid'] for trade in ts['OutTrades' if direction == 'sell' else 'InTrades'] if trade['oid'] is not None and trade['oid'] != 'filled']
+        if len(oids) == 0:
+            return {}
+        if not self.bulkCancel(symbol,oids):
+            # the priority of the calling thread (e.g. of a stop-loss exit) also applies to the cancel threads
+            context = getattr(self.priorityContext,'priority',None)
+            def cancel(oid):
+                with self.requestPriority(context or 'order'):
+                    return self.cancelOrder(oid,symbol,typ)
+            with ThreadPoolExecutor(max_workers=min(self.maxParallelCancels,len(oids))) as pool:
+                list(pool.map(cancel,oids))
+        # get the final states of all orders with one request per order list, only orders not found there or not
+        # canceled yet are polled one by one
+        orders = self.fetchOrdersBySymbol({symbol: oids})
+        orderInfos = {oid: orders[oid] if oid in orders and self.isOrderDone(orders[oid]) else self.waitForOrder(oid,symbol,typ) for oid in oids}
+        for oid in oids:
+            if self.isOrderDone(orderInfos[oid]):
+                self.ledger.orderDone(orderInfos[oid])
+            else:  # the order is still open, so the ledger cannot book it yet
+                self.ledger.markDrifted('order %s still open after canceling'%oid)
+        return orderInfos
+    
+    def bulkCancel(self,symbol,oids):
+        # cancels the orders with one request if the exchange supports it. Returns False if the orders have to be
+        # canceled one by one. cancelAllOrders is not used, as orders of other trade sets (or manual ones) of the
+        # symbol could be placed between checking the open orders and canceling them
+        has = self.exchange.has
+        try:
+            if has.get('cancelOrders'):
+                self.safeRun(lambda: self.exchange.cancelOrders(oids,symbol),0,priority='order')
+                return True
+        except ccxt.ExchangeError:
+            pass  # e.g. one of the orders was filled meanwhile, so cancel them one by one
+        return False
+    
+    @lockTradeSet
     def initBuyOrders(self,iTs):
         if self.tradeSets[iTs]['active']:
             # initialize buy orders
             for iTrade,trade in enumerate(self.tradeSets[iTs]['InTrades']):
                 if trade['oid'] is None and trade['candleAbove'] is None:
-                    response = self.safeRun(lambda: self.exchange.createLimitBuyOrder(self.tradeSets[iTs]['symbol'], trade['amount'],trade['price']))
-                    self.tradeSets[iTs]['InTrades'][iTrade]['oid'] = response['id']
+                    response = self.safeRun(lambda: self.exchange.createLimitBuyOrder(self.tradeSets[iTs]['symbol'], trade['amount'],trade['price']),priority='order')
+                    self.ledger.orderPlaced(response['id'],self.tradeSets[iTs]['symbol'],'buy',trade['amount'],trade['price'])
+                    self.updateLevel(iTs,'buy',iTrade,oid=response['id'])
+    
+    def addFills(self,symbol,orderInfo):
+        # sets cost and average price of a (market) order from its own trades
+        trades = self.fills.orderTrades(symbol,orderInfo,self.safeRun)
+        amount = sum([tr['amount'] for tr in trades])
+        if amount > 0:
+            orderInfo['cost'] = sum([tr['cost'] for tr in trades])
+            orderInfo['price'] = orderInfo['cost']/amount
+        return orderInfo
     
     def cancelOrder(self,oid,symbol,typ):
         try:
-            return self.safeRun(lambda: self.exchange.cancelOrder (oid,symbol),0)
+            return self.safeRun(lambda: self.exchange.cancelOrder (oid,symbol),0,priority='order')
         except ccxt.ExchangeError as e:
-            return self.safeRun(lambda: self.exchange.cancelOrder (oid,symbol,{'type':typ}) )
+            return self.safeRun(lambda: self.exchange.cancelOrder (oid,symbol,{'type':typ}),priority='order')
         
     def fetchOrder(self,oid,symbol,typ):
         try:
             return self.safeRun(lambda: self.exchange.fetchOrder (oid,symbol),0)
         except ccxt.ExchangeError as e:
             return self.safeRun(lambda: self.exchange.fetchOrder (oid,symbol,{'type':typ}))  
+    
+    @staticmethod
+    def isOrderDone(orderInfo):
+        return orderInfo['status'] is not None and orderInfo['status'].lower() in ['closed','filled','canceled','cancelled','expired','rejected']
+    
+    def waitForOrder(self,oid,symbol,typ,deadline=None):
+        # polls the order with growing intervals until it is filled/canceled or the deadline (seconds) has passed and
+        # returns the last order info
+        if deadline is None:
+            deadline = self.orderWaitDeadline
+        started = time.time()
+        delay = self.orderPollDelay
+        while True:
+            time.sleep(min(delay,max(0,started+deadline-time.time())))
+            orderInfo = self.fetchOrder(oid,symbol,typ)
+            if self.isOrderDone(orderInfo) or time.time()-started >= deadline:
+                return orderInfo
+            delay = min(self.orderPollMaxDelay,delay*self.orderPollFactor)
+    
+    def fetchOrdersBySymbol(self,oidsBySymbol):
+        # resolves the states of many orders at once with one open/closed orders request per symbol (if the exchange supports it)
+        # returns a dict oid -> orderInfo. Ids which are not part of the result have to be fetched one by one via fetchOrder
+        orders = {}
+        if not self.bulkOrderFetch:
+            return orders
+        has = self.exchange.has
+        for symbol in oidsBySymbol:
+            missing = set(oidsBySymbol[symbol])
+            if len(missing) == 0:
+                continue
+            try:
+                if has.get('fetchOpenOrders'):
+                    for order in self.safeRun(lambda: self.exchange.fetchOpenOrders(symbol),0):
+                        if order['id'] in missing:
+                            orders[order['id']] = order
+                            missing.discard(order['id'])
+                if len(missing) > 0 and (has.get('fetchClosedOrders') or has.get('fetchOrders')):
+                    if has.get('fetchClosedOrders'):
+                        response = self.safeRun(lambda: self.exchange.fetchClosedOrders(symbol),0)
+                    else:
+                        response = self.safeRun(lambda: self.exchange.fetchOrders(symbol),0)
+                    for order in response:
+                        if order['id'] in missing:
+                            orders[order['id']] = order
+                            missing.discard(order['id'])
+            except AuthenticationError:
+                raise
+            except ExchangeError as e:  # includes NotSupported; network errors and a paused exchange are raised
+                # bulk request was rejected, the remaining orders are fetched one by one
+                logging.warning('Bulk order request for %s on %s failed, fetching %d orders one by one: %s'%(symbol,self.exchange.name,len(missing),str(e)))
+                continue
+        return orders
+    
+    def lookupOrder(self,oid,symbol,typ,orders):
+        # returns the order info from a fetchOrdersBySymbol result and falls back to fetchOrder for ids it did not contain
+        if oid in orders:
+            return orders[oid]
+        else:
+            return self.fetchOrder(oid,symbol,typ)
+    
+    def getOpenOrderIds(self,onlyActive=True,tradeSetIds=None):
+        # collects the ids of all open orders of the trade sets (or only of the given ones) grouped by symbol
+        oidsBySymbol = {}
+        for iTs,ts in list(self.tradeSets.items()):
+            if (onlyActive and not ts['active']) or (tradeSetIds is not None and iTs not in tradeSetIds):
+                continue
+            oids = [trade['oid'] for trade in ts['InTrades'] + ts['OutTrades'] if trade['oid'] is not None and trade['oid'] != 'filled']
+            if len(oids) > 0:
+                oidsBySymbol.setdefault(ts['symbol'],[]).extend(oids)
+        return oidsBySymbol
                                     
     def update(self,dailyCheck=0):
         # goes through all trade sets and checks/updates the buy/sell/stop loss orders
         # daily check is for checking if a candle closed above a certain value
-        self.waitForUpdate()
+        if dailyCheck:
+            return self.checkCandles()
         try:
-            self.updateBalance()
+            with traceSpan('balance'):
+                self.refreshBalance()
         except AuthenticationError as e:#
             self.message('Failed to authenticate at exchange %s. Please check your keys'%self.exchange.name,'error')
             return
@@ -820,87 +1271,222 @@ class tradeHandler:
                 self.message('Some error occured at exchange %s. Maybe it is down.'%self.exchange.name,'error')
             return
                     
-        tradeSetsToDelete = []
-        for iTs in self.tradeSets:
-            ts = self.tradeSets[iTs]
+        # get the states of all open orders with as few requests as possible
+        with traceSpan('orders'):
+            orders = self.fetchOrdersBySymbol(self.getOpenOrderIds())
+        # get the tickers of all active trade sets at once
+        with traceSpan('tickers'):
+            tickers = self.fetchTickers(list(set(ts['symbol'] for ts in list(self.tradeSets.values()) if ts['active'])))
+        # check all stop-losses in one pass before going through the orders
+        self.observePrices({symbol: tickers[symbol]['last'] for symbol in tickers})
+        self.evaluateStopLosses({symbol: tickers[symbol]['last'] for symbol in tickers})
+        for iTs in list(self.tradeSets):
+            with traceSpan('tradeSet',tradeSet=iTs,symbol=self.tradeSets.get(iTs,{}).get('symbol')):
+                self.updateTradeSet(iTs,orders)
+        self.scheduleChecks(tickers)
+    
+    def updateDue(self):
+        # fast tier between the update cycles: checks the stop-losses with the current prices and the orders of those
+        # trade sets which are due according to the poll scheduler (or were not scheduled yet). Returns their ids
+        symbols = list(set(ts['symbol'] for ts in list(self.tradeSets.values()) if ts['active']))
+        if len(symbols) == 0:
+            return []
+        tickers = self.fetchTickers(symbols,maxAge=self.scheduler.minInterval)
+        prices = {symbol: tickers[symbol]['last'] for symbol in tickers}
+        self.observePrices(prices)
+        self.evaluateStopLosses(prices)
+        due = [iTs for iTs in self.scheduler.due() if iTs in self.tradeSets]
+        due += [iTs for iTs,ts in list(self.tradeSets.items()) if ts['active'] and not self.scheduler.isScheduled(iTs) and iTs not in due]
+        if len(due) > 0:
+            orders = self.fetchOrdersBySymbol(self.getOpenOrderIds(tradeSetIds=due))
+            for iTs in due:
+                self.updateTradeSet(iTs,orders)
+            self.scheduleChecks(tickers,due)
+        return due
+    
+    def checkCandles(self,now=None):
+        # checks the candles closed since the last check for all pending candleAbove buy levels at once and places the
+        # buy orders of the triggered ones. As the time of the last check is stored in the trade sets, closes missed
+        # while the bot was down are caught up. Returns the (trade set id, level) of the triggered levels
+        lastClosed = self.candles.lastClosed(now)
+        pending = []
+        checked = {}  # trade set id -> (symbol, time of the newest checked candle) of the trade sets with pending levels
+        for iTs,ts in list(self.tradeSets.items()):
             if not ts['active']:
                 continue
-            ticker = self.safeRun(lambda: self.exchange.fetch_ticker(ts['symbol']))
-            # check if stop loss is reached
-            if not dailyCheck and ts['SL'] is not None:
-                if ticker['last'] <= ts['SL']:
-                    self.message('Stop loss for pair %s has been triggered!'%ts['symbol'],'warning')
-                    # cancel all sell orders, create market sell order and save resulting amount of base currency
-                    self.updating = False
-                    sold = self.sellAllNow(iTs,price=ticker['last'])
-                    self.waitForUpdate()
-                    if sold:
-                        tradeSetsToDelete.append(iTs)
-                        continue
-                elif 'trailingSL' in ts and ts['trailingSL'][0] is not None:
-                    if ts['trailingSL'][1] == 'abs':
-                        newSL = ticker['last'] - ts['trailingSL'][0]
-                    else:
-                        newSL = ticker['last'] * (1- ts['trailingSL'][0])
-                    if newSL > ts['SL']:
-                        ts['SL'] = newSL
-            orderExecuted = 0
-            # go through buy trades 
+            # trade sets of old versions were not checked yet, so the last close is checked for them
+            since = ts.get('candleChecked',lastClosed-self.candles.duration())
+            if since >= lastClosed:
+                continue
             for iTrade,trade in enumerate(ts['InTrades']):
-                if trade['oid'] == 'filled':
-                    continue
-                elif dailyCheck and trade['oid'] is None and trade['candleAbove'] is not None:
-                    if ticker['last'] > trade['candleAbove']:
-                        response = self.safeRun(lambda: self.exchange.createLimitBuyOrder(ts['symbol'], trade['amount'],trade['price']))
-                        ts['InTrades'][iTrade]['oid'] = response['id']
-                        self.message('Daily candle of %s above %s triggering buy level #%d on %s!'%(ts['symbol'],self.price2Prec(ts['symbol'],trade['candleAbove']),iTrade,self.exchange.name))
-                elif trade['oid'] is not None:
-                    orderInfo = self.fetchOrder(trade['oid'],ts['symbol'],'BUY')
-                    if any([orderInfo['status'].lower() == val for val in ['closed','filled']]):
-                        orderExecuted = 1
-                        ts['InTrades'][iTrade]['oid'] = 'filled'
-                        ts['costIn'] += orderInfo['cost']
-                        self.message('Buy level of %s %s reached on %s! Bought %s %s for %s %s.'%(self.price2Prec(ts['symbol'],orderInfo['price']),ts['symbol'],self.exchange.name,self.amount2Prec(ts['symbol'],orderInfo['amount']),ts['coinCurrency'],self.cost2Prec(ts['symbol'],orderInfo['cost']),ts['baseCurrency']))
-                        ts['coinsAvail'] += trade['actualAmount']
-                    elif orderInfo['status'] == 'canceled':
-                        ts['InTrades'][iTrade]['oid'] = None
-                        self.message('Buy order (level %d of trade set %d on %s) was canceled manually by someone! Will be reinitialized during next update.'%(iTrade,list(self.tradeSets.keys()).index(iTs),self.exchange.name))
-                else:
-                    self.initBuyOrders(iTs)                                
-                    time.sleep(1)
-                        
-            if not dailyCheck:
-                # go through all selling positions and create those for which the bought coins suffice
-                for iTrade,_ in enumerate(ts['OutTrades']):
-                    if ts['OutTrades'][iTrade]['oid'] is None and ts['coinsAvail'] >= ts['OutTrades'][iTrade]['amount']:
-                        response = self.safeRun(lambda: self.exchange.createLimitSellOrder(ts['symbol'], ts['OutTrades'][iTrade]['amount'], ts['OutTrades'][iTrade]['price']))
-                        ts['OutTrades'][iTrade]['oid'] = response['id']
-                        ts['coinsAvail'] -= ts['OutTrades'][iTrade]['amount']
-    
-                # go through sell trades 
-                for iTrade,trade in enumerate(ts['OutTrades']):
-                    if trade['oid'] == 'filled':
-                        continue
-                    elif trade['oid'] is not None:
-                        orderInfo = self.fetchOrder(trade['oid'],ts['symbol'],'SELL')
-                        if any([orderInfo['status'].lower() == val for val in ['closed','filled']]):
-                            orderExecuted = 2
-                            ts['OutTrades'][iTrade]['oid'] = 'filled'
-                            if orderInfo['type'] == 'market':
-                                trades = self.exchange.fetchMyTrades(ts['symbol'])
-                                orderInfo['cost'] = sum([tr['cost'] for tr in trades if tr['order'] == orderInfo['id']])
-                                orderInfo['price'] = np.mean([tr['price'] for tr in trades if tr['order'] == orderInfo['id']])
-                            ts['costOut'] += orderInfo['cost']
-                            self.message('Sell level of %s %s reached on %s! Sold %s %s for %s %s.'%(self.price2Prec(ts['symbol'],orderInfo['price']),ts['symbol'],self.exchange.name,self.amount2Prec(ts['symbol'],orderInfo['amount']),ts['coinCurrency'],self.cost2Prec(ts['symbol'],orderInfo['cost']),ts['baseCurrency']))
-                        elif orderInfo['status'] == 'canceled':
-                            ts['coinsAvail'] += ts['OutTrades'][iTrade]['amount']
-                            ts['OutTrades'][iTrade]['oid'] = None
-                            self.message('Sell order (level %d of trade set %d on %s) was canceled manually by someone! Will be reinitialized during next update.'%(iTrade,iTs,self.exchange.name))
-                # delete Tradeset when all orders have been filled (but only if there were any to execute)
-                if ((orderExecuted == 1 and ts['SL'] is None) or orderExecuted == 2) and self.numSellLevels(iTs,'notfilled') == 0 and self.numBuyLevels(iTs,'notfilled') == 0:
-                    self.message('Trading set %s on %s completed! Total gain: %s %s'%(ts['symbol'],self.exchange.name,self.cost2Prec(ts['symbol'],ts['costOut']-ts['costIn']),ts['baseCurrency']))
-                    tradeSetsToDelete.append(iTs)
-        for iTs in tradeSetsToDelete:
-            self.tradeSets.pop(iTs) 
-        self.updating = False
-            
\ No newline at end of file
+                if trade['oid'] is None and trade['candleAbove'] is not None:
+                    pending.append((iTs,iTrade,ts['symbol'],trade['candleAbove'],since))
+                    checked[iTs] = (ts['symbol'],since)
+        closes,newest = self.candles.evaluate([level[2:] for level in pending],self.safeRun,now)
+        triggered = []
+        for level,close in zip(pending,closes):
+            if not np.isnan(close) and self.triggerCandleLevel(level[0],level[1],close):
+                triggered.append(level[:2])
+        # trade sets with pending levels are only checked up to the newest candle the exchange returned (it may publish
+        # the close of a candle late), all others up to the last closed candle
+        for iTs in list(self.tradeSets):
+            with self.tradeSetLock(iTs):
+                if iTs in self.tradeSets:
+                    if iTs in checked:
+                        symbol,since = checked[iTs]
+                        self.tradeSets[iTs]['candleChecked'] = max(since,newest.get(symbol,since))
+                    else:
+                        self.tradeSets[iTs]['candleChecked'] = lastClosed
+        return triggered
+    
+    @lockTradeSet
+    def triggerCandleLevel(self,iTs,iTrade,close):
+        # places the buy order of a candleAbove level whose candle closed above the threshold
+        if iTs not in self.tradeSets or not self.tradeSets[iTs]['active'] or iTrade >= len(self.tradeSets[iTs]['InTrades']):
+            return False
+        ts = self.tradeSets[iTs]
+        trade = ts['InTrades'][iTrade]
+        if trade['oid'] is not None or trade['candleAbove'] is None:
+            return False
+        response = self.safeRun(lambda: self.exchange.createLimitBuyOrder(ts['symbol'], trade['amount'],trade['price']),priority='order')
+        self.ledger.orderPlaced(response['id'],ts['symbol'],'buy',trade['amount'],trade['price'])
+        self.updateLevel(iTs,'buy',iTrade,oid=response['id'])
+        self.message('%s candle of %s closed at %s above %s triggering buy level #%d on %s!'%(self.candles.timeframe,ts['symbol'],self.price2Prec(ts['symbol'],close),self.price2Prec(ts['symbol'],trade['candleAbove']),iTrade,self.exchange.name))
+        return True
+    
+    def observePrices(self,prices,timestamp=None):
+        # lets the poll scheduler estimate the volatility of the symbols
+        for symbol in prices:
+            self.scheduler.observe(symbol,prices[symbol],timestamp)
+    
+    def scheduleChecks(self,tickers,tradeSetIds=None):
+        # sets the next check time of the trade sets (default: all) after they were checked with these tickers
+        for iTs in list(self.tradeSets) if tradeSetIds is None else tradeSetIds:
+            ts = self.tradeSets.get(iTs)
+            if ts is None:
+                self.scheduler.unschedule(iTs)
+            else:
+                self.scheduler.schedule(iTs,ts,tickers[ts['symbol']]['last'] if ts['symbol'] in tickers else None)
+    
+    @staticmethod
+    def trailingSL(ts,price):
+        # returns the stop-loss the trailing stop-loss of the trade set moves to at this price or None if it does not move
+        if 'trailingSL' not in ts or ts['trailingSL'][0] is None or ts['SL'] is None:
+            return None
+        if ts['trailingSL'][1] == 'abs':
+            newSL = price - ts['trailingSL'][0]
+        else:
+            newSL = price * (1- ts['trailingSL'][0])
+        return newSL if newSL > ts['SL'] else None
+    
+    def stopLossSymbols(self):
+        # symbols of all active trade sets with stop-loss
+        with self.slBookLock:
+            if self.slBook.version != self.tsVersion:
+                self.slBook.build(self.tradeSets,self.tsVersion)
+            return list(self.slBook.symbols)
+    
+    def evaluateStopLosses(self,prices):
+        # checks the stop-losses of all trade sets at once for the prices (dict symbol -> price), moves the trailing
+        # stop-losses and sells the trade sets whose stop-loss was reached. Returns the ids of the removed trade sets
+        with self.slBookLock:
+            version = self.tsVersion
+            if self.slBook.version != version:
+                self.slBook.build(self.tradeSets,version)
+            triggered,ratcheted = self.slBook.evaluate(prices)
+        for iTs,newSL in ratcheted:
+            # not via a @lockTradeSet method, as the book already knows the new stop-loss and need not be rebuilt
+            with self.tradeSetLock(iTs):
+                ts = self.tradeSets.get(iTs)
+                if ts is not None and ts['SL'] is not None and newSL > ts['SL']:
+                    ts['SL'] = newSL
+        removed = set()
+        for iTs in triggered:
+            ts = self.tradeSets.get(iTs)
+            if ts is not None and self.checkStopLoss(iTs,prices[ts['symbol']]):
+                removed.add(iTs)
+        return removed
+    
+    @lockTradeSet
+    def checkStopLoss(self,iTs,price):
+        # sells everything if the price reached the stop-loss or moves the trailing stop-loss of one trade set.
+        # Returns True if the trade set was sold and removed
+        if iTs not in self.tradeSets or not self.tradeSets[iTs]['active']:
+            return False
+        ts = self.tradeSets[iTs]
+        if ts['SL'] is None:
+            return False
+        if price <= ts['SL']:
+            self.message('Stop loss for pair %s has been triggered!'%ts['symbol'],'warning')
+            # cancel all sell orders, create market sell order and save resulting amount of base currency
+            sold = self.sellAllNow(iTs,price=price)
+            if sold:
+                self.removeTradeSet(iTs)
+            return sold
+        newSL = self.trailingSL(ts,price)
+        if newSL is not None:
+            ts['SL'] = newSL
+        return False
+    
+    @lockTradeSet
+    def updateTradeSet(self,iTs,orders):
+        # checks/updates the buy/sell/stop loss orders of one trade set while holding its lock
+        if iTs not in self.tradeSets or not self.tradeSets[iTs]['active']:  # deleted or deactivated while waiting for the lock
+            return
+        ts = self.tradeSets[iTs]
+        orderExecuted = 0
+        # orders placed during this update are checked in the next one instead of fetching each of them right away
+        placedBefore = set(trade['oid'] for trade in ts['InTrades'] + ts['OutTrades'])
+        # go through buy trades 
+        for iTrade,trade in enumerate(ts['InTrades']):
+            if trade['oid'] == 'filled' or (trade['oid'] is not None and trade['oid'] not in placedBefore):
+                continue
+            elif trade['oid'] is not None:
+                orderInfo = self.lookupOrder(trade['oid'],ts['symbol'],'BUY',orders)
+                if any([orderInfo['status'].lower() == val for val in ['closed','filled']]):
+                    orderExecuted = 1
+                    self.updateLevel(iTs,'buy',iTrade,oid='filled')
+                    self.ledger.orderDone(orderInfo,'buy')
+                    ts['costIn'] += orderInfo['cost']
+                    self.message('Buy level of %s %s reached on %s! Bought %s %s for %s %s.'%(self.price2Prec(ts['symbol'],orderInfo['price']),ts['symbol'],self.exchange.name,self.amount2Prec(ts['symbol'],orderInfo['amount']),ts['coinCurrency'],self.cost2Prec(ts['symbol'],orderInfo['cost']),ts['baseCurrency']))
+                    ts['coinsAvail'] += trade['actualAmount']
+                elif orderInfo['status'] == 'canceled':
+                    self.updateLevel(iTs,'buy',iTrade,oid=None)
+                    self.ledger.orderDone(orderInfo,'buy')
+                    self.message('Buy order (level %d of trade set %d on %s) was canceled manually by someone! Will be reinitialized during next update.'%(iTrade,list(self.tradeSets.keys()).index(iTs),self.exchange.name))
+            else:
+                self.initBuyOrders(iTs)                                
+                time.sleep(1)
+
+        # go through all selling positions and create those for which the bought coins suffice
+        for iTrade,_ in enumerate(ts['OutTrades']):
+            if ts['OutTrades'][iTrade]['oid'] is None and ts['coinsAvail'] >= ts['OutTrades'][iTrade]['amount']:
+                response = self.safeRun(lambda: self.exchange.createLimitSellOrder(ts['symbol'], ts['OutTrades'][iTrade]['amount'], ts['OutTrades'][iTrade]['price']),priority='order')
+                self.ledger.orderPlaced(response['id'],ts['symbol'],'sell',ts['OutTrades'][iTrade]['amount'],ts['OutTrades'][iTrade]['price'])
+                self.updateLevel(iTs,'sell',iTrade,oid=response['id'])
+                ts['coinsAvail'] -= ts['OutTrades'][iTrade]['amount']
+
+        # go through sell trades 
+        for iTrade,trade in enumerate(ts['OutTrades']):
+            if trade['oid'] == 'filled' or (trade['oid'] is not None and trade['oid'] not in placedBefore):
+                continue
+            elif trade['oid'] is not None:
+                orderInfo = self.lookupOrder(trade['oid'],ts['symbol'],'SELL',orders)
+                if any([orderInfo['status'].lower() == val for val in ['closed','filled']]):
+                    orderExecuted = 2
+                    self.updateLevel(iTs,'sell',iTrade,oid='filled')
+                    if orderInfo['type'] == 'market':
+                        self.addFills(ts['symbol'],orderInfo)
+                    self.ledger.orderDone(orderInfo,'sell')
+                    ts['costOut'] += orderInfo['cost']
+                    self.message('Sell level of %s %s reached on %s! Sold %s %s for %s %s.'%(self.price2Prec(ts['symbol'],orderInfo['price']),ts['symbol'],self.exchange.name,self.amount2Prec(ts['symbol'],orderInfo['amount']),ts['coinCurrency'],self.cost2Prec(ts['symbol'],orderInfo['cost']),ts['baseCurrency']))
+                elif orderInfo['status'] == 'canceled':
+                    ts['coinsAvail'] += ts['OutTrades'][iTrade]['amount']
+                    self.updateLevel(iTs,'sell',iTrade,oid=None)
+                    self.ledger.orderDone(orderInfo,'sell')
+                    self.message('Sell order (level %d of trade set %d on %s) was canceled manually by someone! Will be reinitialized during next update.'%(iTrade,iTs,self.exchange.name))
+        # delete Tradeset when all orders have been filled (but only if there were any to execute)
+        if ((orderExecuted == 1 and ts['SL'] is None) or orderExecuted == 2) and self.numSellLevels(iTs,'notfilled') == 0 and self.numBuyLevels(iTs,'notfilled') == 0:
+            self.message('Trading set %s on %s completed! Total gain: %s %s'%(ts['symbol'],self.exchange.name,self.cost2Prec(ts['symbol'],ts['costOut']-ts['costIn']),ts['baseCurrency']))
+            self.removeTradeSet(iTs)
+        
\ No newline at end of file
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eazebot.simulatedExchange import simulatedExchange
+from eazebot.tradeHandler import tradeHandler
+
+names = iter('simulated%d' % i for i in range(100, 100000))
+
+
+@pytest.fixture
+def makeHandler(tmp_path, monkeypatch):
+    # trade handlers on fresh simulated exchanges (each with its own circuit breaker and request scheduler) without
+    # random price moves; caches and state files go to a temporary folder
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(simulatedExchange, 'simulation', dict(simulatedExchange.simulation, volatility=0., seed=0,
+                                                              rateLimit=1))
+
+    def make(**kwargs):
+        messages = []
+        kwargs = dict({'key': 'key', 'secret': 'secret'}, **kwargs)  # with keys the markets and the balance are loaded
+        ct = tradeHandler(next(names), messagerFct=lambda text, level='info': messages.append(text), **kwargs)
+        ct.messages = messages
+        return ct
+    return make
@@ -0,0 +1,26 @@
+import pytest
+
+from eazebot.aggregates import levelAggregates
+from eazebot.levels import tradeLevel
+
+
+def test_level_without_price_only_counts_for_amounts():
+    aggregates = levelAggregates([tradeLevel('1', 0.05, 2.), tradeLevel('2', None, 1.)], feeSubtracted=False)
+    assert aggregates.get('amount', 'sum') == pytest.approx(3.)
+    assert aggregates.get('cost', 'sum') == pytest.approx(0.1)
+    assert aggregates.get('price', 'max') == 0.05
+    aggregates.remove(tradeLevel('2', None, 1.))
+    assert aggregates.get('amount', 'sum') == pytest.approx(2.)
+
+
+def test_unfilled_market_sell_of_stop_loss_is_kept_as_sell_level(makeHandler, monkeypatch):
+    ct = makeHandler()
+    iTs = ct.newTradeSet('ETH/BTC', [], [], [0.06], [1.], sl=0.045, initCoins=1., initPrice=0.05, force=True)
+
+    def unfilled(oid, symbol, typ, deadline=None):
+        # exchanges often do not report a price for a market order which is not filled yet
+        return dict(ct.exchange.fetchOrder(oid), status='open', price=None, filled=0.)
+    monkeypatch.setattr(ct, 'waitForOrder', unfilled)
+    assert not ct.sellAllNow(iTs)
+    assert ct.numSellLevels(iTs) == 1
+    assert ct.sumSellAmounts(iTs) == pytest.approx(1.)
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+
+def replay(ct, candles, created=None):
+    # moves the price of the simulated exchange to the low and then to the close of each candle and runs an update
+    # after each move, like the backtest assumes (sell levels are reached by the closes, the stop-loss by the lows).
+    # If created (the time the trade set was created) is given, the candleAbove levels are checked after each close
+    for iBar, (timestamp, openPrice, high, low, close) in enumerate(candles):
+        for price in [low, close]:
+            ct.exchange.setPrice('ETH/BTC', price)
+            ct.update()
+        if created is not None:
+            ct.checkCandles(created + (iBar + 1) * ct.candles.duration() / 1000.)
+
+
+def gainOfInfo(ct, iTs):
+    text = ct.getTradeSetInfo(iTs)
+    return float(text.split('Estimated gain/loss when selling all now: * ')[1].split(' ')[0])
+
+
+@pytest.fixture
+def handler(makeHandler, monkeypatch):
+    ct = makeHandler()
+    monkeypatch.setattr(ct.marketData, 'maxAge', 0)  # each update sees the price just set
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)  # update waits after placing candleAbove levels
+    return ct
+
+
+def test_candle_above_level_matches_gain_of_trade_set_info(handler):
+    ct = handler
+    created = time.time()
+    iTs = ct.newTradeSet('ETH/BTC', [0.04], [1.], [0.06], [0.9], candleAbove=[0.055], force=True)
+    candles = [[0, 0.05, 0.054, 0.048, 0.052],
+               [1, 0.052, 0.057, 0.05, 0.056],  # closes above 0.055, the buy order is placed after it
+               [2, 0.056, 0.056, 0.039, 0.045],  # buy level filled, sell level placed
+               [3, 0.045, 0.059, 0.045, 0.0587]]
+    definitions, results = ct.backtestTradeSet(iTs, candles)
+    replay(ct, candles, created)
+    assert results['status'][0] == 'open' and results['buysFilled'][0] == 1
+    assert ct.numBuyLevels(iTs, 'filled') == 1 and ct.numSellLevels(iTs, 'open') == 1
+    assert results['gain'][0] == pytest.approx(gainOfInfo(ct, iTs), abs=1e-6)
+
+
+def test_trailing_stop_loss_matches_gain_of_trade_set_info(handler):
+    ct = handler
+    iTs = ct.newTradeSet('ETH/BTC', [], [], [0.08], [0.5], sl=0.04, initCoins=1., initPrice=0.05, force=True)
+    ct.setTrailingSL(iTs, 0.1, 'rel')
+    candles = [[0, 0.05, 0.055, 0.05, 0.055],
+               [1, 0.055, 0.06, 0.054, 0.06],
+               [2, 0.06, 0.062, 0.056, 0.057]]  # above the trailing stop-loss of 0.054
+    definitions, results = ct.backtestTradeSet(iTs, candles)
+    replay(ct, candles)
+    assert ct.tradeSets[iTs]['SL'] == pytest.approx(0.06 * 0.9)
+    assert results['status'][0] == 'open'
+    assert results['gain'][0] == pytest.approx(gainOfInfo(ct, iTs), abs=1e-6)
+
+
+@pytest.mark.parametrize('trailing', [False, True])
+def test_stop_loss_matches_booked_costs_of_sold_trade_set(handler, trailing):
+    ct = handler
+    iTs = ct.newTradeSet('ETH/BTC', [], [], [0.06, 0.08], [0.5, 0.3], sl=0.045, initCoins=1., initPrice=0.05,
+                         force=True)
+    if trailing:
+        ct.setTrailingSL(iTs, 0.1, 'rel')
+    ts = ct.tradeSets[iTs]
+    candles = [[0, 0.05, 0.052, 0.049, 0.051],
+               [1, 0.051, 0.061, 0.05, 0.061],  # first sell level filled
+               [2, 0.061, 0.061, 0.061 * 0.9 if trailing else 0.045, 0.056]]  # low at the stop-loss
+    definitions, results = ct.backtestTradeSet(iTs, candles)
+    replay(ct, candles)
+    assert iTs not in ct.tradeSets  # sold by the stop-loss
+    assert results['status'][0] == 'stopLoss' and results['sellsFilled'][0] == 1
+    assert results['stopLoss'][0] == pytest.approx(0.061 * 0.9 if trailing else 0.045)
+    # the sold trade set is gone, so its booked costs are compared
+    assert results['costOut'][0] - results['costIn'][0] == pytest.approx(ts['costOut'] - ts['costIn'], abs=1e-9)
@@ -0,0 +1,55 @@
+import pytest
+
+from eazebot.balanceLedger import balanceLedger
+from eazebot.simulatedExchange import simulatedExchange
+
+
+@pytest.fixture
+def exchange():
+    return simulatedExchange({'simulation': {'volatility': 0., 'prices': {'ETH/BTC': 0.05}}})
+
+
+def assertSameBalance(ledger, exchange):
+    balance = exchange.fetchBalance()
+    for currency in ['ETH', 'BTC']:
+        for key in ['free', 'used', 'total']:
+            assert ledger.balance[currency][key] == pytest.approx(balance[currency][key])
+
+
+def test_ledger_follows_orders_it_placed(exchange):
+    ledger = balanceLedger()
+    ledger.reconcile(exchange.fetchBalance())
+    order = exchange.createOrder('ETH/BTC', 'limit', 'sell', 2, 0.06)
+    ledger.orderPlaced(order['id'], 'ETH/BTC', 'sell', 2, 0.06)
+    assertSameBalance(ledger, exchange)
+    exchange.setPrice('ETH/BTC', 0.07)
+    ledger.orderDone(exchange.fetchOrder(order['id']), 'sell')
+    assertSameBalance(ledger, exchange)
+    assert not ledger.drifted
+
+
+@pytest.mark.parametrize('side,price,filledAt', [('sell', 0.06, 0.07), ('buy', 0.04, 0.03)])
+def test_fill_of_order_open_across_restart_releases_used_funds(exchange, side, price, filledAt):
+    order = exchange.createOrder('ETH/BTC', 'limit', side, 2, price)
+    ledger = balanceLedger()  # the restarted bot did not see the order being placed
+    ledger.reconcile(exchange.fetchBalance())
+    exchange.setPrice('ETH/BTC', filledAt)
+    ledger.orderDone(exchange.fetchOrder(order['id']), side)
+    assertSameBalance(ledger, exchange)
+    assert not ledger.drifted
+
+
+def test_cancel_of_order_open_across_restart_releases_used_funds(exchange):
+    order = exchange.createOrder('ETH/BTC', 'limit', 'buy', 2, 0.04)
+    ledger = balanceLedger()
+    ledger.reconcile(exchange.fetchBalance())
+    ledger.orderDone(exchange.cancelOrder(order['id']), 'buy')
+    assertSameBalance(ledger, exchange)
+
+
+def test_order_of_unknown_side_makes_ledger_drift(exchange):
+    order = exchange.createOrder('ETH/BTC', 'limit', 'buy', 2, 0.04)
+    ledger = balanceLedger()
+    ledger.reconcile(exchange.fetchBalance())
+    ledger.orderDone(exchange.cancelOrder(order['id']))
+    assert ledger.drifted and ledger.needsReconcile()
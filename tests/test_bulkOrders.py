@@ -0,0 +1,44 @@
+import logging
+
+import ccxt
+import pytest
+
+from eazebot.retryPolicy import exchangeDownError
+
+
+@pytest.fixture
+def handlerWithOrders(makeHandler):
+    # trade set with an open buy order and an open sell order
+    ct = makeHandler()
+    iTs = ct.newTradeSet('ETH/BTC', [0.04], [1.], [0.06], [1.], initCoins=1., initPrice=0.05, force=True)
+    ct.update()
+    return ct, iTs
+
+
+def test_rejected_bulk_request_falls_back_to_single_orders_and_is_logged(handlerWithOrders, caplog):
+    ct, iTs = handlerWithOrders
+    ct.exchange.injectFault('fetchOpenOrders', ccxt.NotSupported('no open orders by symbol'))
+    with caplog.at_level(logging.WARNING):
+        orders = ct.fetchOrdersBySymbol(ct.getOpenOrderIds())
+    assert len(orders) == 0
+    assert 'one by one' in caplog.text
+
+
+@pytest.mark.parametrize('error', [exchangeDownError('paused'), ccxt.AuthenticationError('invalid key')])
+def test_paused_exchange_and_invalid_keys_are_not_hidden_by_the_fallback(handlerWithOrders, error):
+    ct, iTs = handlerWithOrders
+    ct.retryPolicy.baseDelay = 0.001
+    ct.exchange.injectFault('fetchOpenOrders', error, count=10)
+    with pytest.raises(error.__class__):
+        ct.fetchOrdersBySymbol(ct.getOpenOrderIds())
+    ct.exchange.injected.clear()
+
+
+def test_orders_placed_during_update_are_not_fetched_one_by_one(makeHandler):
+    ct = makeHandler()
+    iTs = ct.newTradeSet('ETH/BTC', [0.04], [1.], [0.06], [0.9], force=True)
+    ct.exchange.setPrice('ETH/BTC', 0.039)
+    counts = dict(ct.exchange.requestCounts)
+    ct.update()  # notices the filled buy order and places the sell order
+    assert ct.numSellLevels(iTs, 'open') == 1
+    assert ct.exchange.requestCounts.get('fetchOrder', 0) == counts.get('fetchOrder', 0)
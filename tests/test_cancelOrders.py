@@ -0,0 +1,34 @@
+def buyOrderIds(ct, iTs):
+    return [trade['oid'] for trade in ct.tradeSets[iTs]['InTrades'] if trade['oid'] not in [None, 'filled']]
+
+
+def test_canceling_trade_set_keeps_order_placed_meanwhile(makeHandler, monkeypatch):
+    ct = makeHandler()
+    iTs = ct.newTradeSet('ETH/BTC', [0.04], [1.], [0.06], [1.], force=True)
+    oids = buyOrderIds(ct, iTs)
+    other = ct.exchange.createOrder('ETH/BTC', 'limit', 'buy', 1, 0.03)['id']
+    fetchOpenOrders = ct.exchange.fetch_open_orders
+
+    def fetchBeforeOther(*args, **kwargs):
+        # the open orders as fetched right before another trade set (or the user) placed its order
+        return [order for order in fetchOpenOrders(*args, **kwargs) if order['id'] != other]
+    for method in ['fetch_open_orders', 'fetchOpenOrders']:
+        monkeypatch.setattr(ct.exchange, method, fetchBeforeOther)
+    ct.cancelBuyOrders(iTs)
+    assert ct.exchange.fetchOrder(oids[0])['status'] == 'canceled'
+    assert ct.exchange.fetchOrder(other)['status'] == 'open'
+
+
+def test_order_still_open_after_canceling_is_not_booked(makeHandler, monkeypatch):
+    ct = makeHandler()
+    ct.orderWaitDeadline = 0.05
+    iTs = ct.newTradeSet('ETH/BTC', [0.04], [1.], [0.06], [1.], force=True)
+    oid = buyOrderIds(ct, iTs)[0]
+    ct.balance  # reconciles the ledger
+    for method in ['cancel_order', 'cancelOrder', 'cancel_all_orders', 'cancelAllOrders']:  # cancels get lost
+        monkeypatch.setattr(ct.exchange, method, lambda *args, **kwargs: {})
+    free = ct.ledger.balance['BTC']['free']
+    orderInfos = ct.cancelLevelOrders(iTs, 'buy')
+    assert orderInfos[oid]['status'] == 'open'
+    assert ct.ledger.balance['BTC']['free'] == free
+    assert ct.ledger.drifted
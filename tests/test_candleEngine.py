@@ -0,0 +1,34 @@
+import time
+
+
+def test_candle_published_late_is_still_checked(makeHandler, monkeypatch):
+    ct = makeHandler()
+    candles = []
+    ct.exchange.has['fetchOHLCV'] = True
+    monkeypatch.setattr(ct.exchange, 'fetchOHLCV', lambda symbol, timeframe='1d', since=None, limit=None, params={}:
+                        [candle for candle in candles if since is None or candle[0] >= since])
+    iTs = ct.newTradeSet('ETH/BTC', [0.04], [1.], [0.06], [1.], candleAbove=[0.055], force=True)
+    assert ct.tradeSets[iTs]['InTrades'][0]['oid'] is None
+    created = ct.tradeSets[iTs]['candleChecked']
+    duration = ct.candles.duration()
+    now = time.time() + duration / 1000.  # one more candle closed since the trade set was created
+    assert ct.candles.lastClosed(now) == created + duration
+
+    assert ct.checkCandles(now) == []  # the exchange did not publish the closed candle yet
+    assert ct.tradeSets[iTs]['candleChecked'] == created
+    candles.append([created + duration, 0.05, 0.06, 0.05, 0.056, 100.])
+    assert ct.checkCandles(now) == [(iTs, 0)]
+    assert ct.tradeSets[iTs]['InTrades'][0]['oid'] is not None
+    assert ct.tradeSets[iTs]['candleChecked'] == created + duration
+
+
+def test_close_below_level_does_not_trigger(makeHandler, monkeypatch):
+    ct = makeHandler()
+    ct.exchange.has['fetchOHLCV'] = True
+    iTs = ct.newTradeSet('ETH/BTC', [0.04], [1.], [0.06], [1.], candleAbove=[0.055], force=True)
+    created = ct.tradeSets[iTs]['candleChecked']
+    duration = ct.candles.duration()
+    monkeypatch.setattr(ct.exchange, 'fetchOHLCV', lambda *args, **kwargs: [[created + duration, 0.05, 0.06, 0.05, 0.054, 1.]])
+    assert ct.checkCandles(time.time() + duration / 1000.) == []
+    assert ct.tradeSets[iTs]['InTrades'][0]['oid'] is None
+    assert ct.tradeSets[iTs]['candleChecked'] == created + duration
@@ -0,0 +1,40 @@
+import threading
+import time
+
+import pytest
+
+
+class updater:
+    class dispatcher:
+        user_data = {}
+
+
+def test_lane_waiting_for_busy_worker_times_out(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the bot module writes its log file to the working directory
+    EazeBot = pytest.importorskip('eazebot.EazeBot', exc_type=ImportError)
+    updater.dispatcher.user_data = {1: {'trade': {'hanging': 'hanging', 'queued': 'queued'}}}
+    monkeypatch.setitem(EazeBot.__config__, 'telegramUserId', [1])
+    monkeypatch.setitem(EazeBot.__config__, 'maxWorkers', 1)
+    monkeypatch.setitem(EazeBot.__config__, 'laneTimeout', 0.5)
+    monkeypatch.setattr(EazeBot, 'jobExecutor', None)
+    release = threading.Event()
+    ran = []
+
+    def fct(ct):
+        ran.append(ct)
+        if ct == 'hanging':
+            release.wait(10)
+
+    started = time.time()
+    durations = EazeBot.runOnAllExchanges(updater, fct, 'test', logDurations=False)
+    try:
+        assert time.time() - started < 5
+        assert durations == {(1, 'hanging'): None, (1, 'queued'): None}
+        assert ran == ['hanging']
+        # the hanging lane is skipped until it finished, the queued one is submitted again next cycle
+        assert ('test', 1, 'hanging') in EazeBot.runningLanes
+        assert ('test', 1, 'queued') not in EazeBot.runningLanes
+    finally:
+        release.set()
+        EazeBot.jobExecutor.shutdown(wait=True)
+    assert ('test', 1, 'hanging') not in EazeBot.runningLanes
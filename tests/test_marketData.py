@@ -0,0 +1,58 @@
+import threading
+import time
+
+from eazebot.marketData import marketDataHub, marketsCache
+from eazebot.simulatedExchange import simulatedExchange
+
+
+class slowExchange:
+    # exchange whose fetchTickers requests block until they are released
+    id = 'slow'
+    has = {'fetchTickers': True}
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.requests = 0
+
+    def fetchTickers(self):
+        self.requests += 1
+        self.started.set()
+        self.release.wait(5)
+        return {'ETH/BTC': {'symbol': 'ETH/BTC', 'last': 0.05}, 'LTC/BTC': {'symbol': 'LTC/BTC', 'last': 0.01}}
+
+
+def test_running_request_does_not_block_cached_tickers_and_is_shared():
+    exchange = slowExchange()
+    hub = marketDataHub(exchange)
+    hub.store({'ETH/BTC': {'symbol': 'ETH/BTC', 'last': 0.04}})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(hub.getTickers(['LTC/BTC']))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert exchange.started.wait(5)
+    assert hub.getTicker('ETH/BTC')['last'] == 0.04  # served from the cache while the request is running
+    exchange.release.set()
+    for thread in threads:
+        thread.join()
+    assert exchange.requests == 1
+    assert [result['LTC/BTC']['last'] for result in results] == [0.01] * 3
+
+
+def test_markets_of_other_exchanges_load_while_one_exchange_hangs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = marketsCache()
+    hanging = simulatedExchange({'id': 'simulatedHanging'})
+    release = threading.Event()
+    thread = threading.Thread(target=cache.load, args=(hanging, lambda func: release.wait(5) and func()))
+    thread.start()
+    try:
+        other = simulatedExchange({'id': 'simulatedOther'})
+        started = time.time()
+        cache.load(other)
+        assert time.time() - started < 1
+        assert 'ETH/BTC' in other.markets
+    finally:
+        release.set()
+        thread.join()
+    assert 'ETH/BTC' in hanging.markets
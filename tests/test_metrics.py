@@ -0,0 +1,15 @@
+import urllib.request
+
+from eazebot import metrics
+
+
+def test_metrics_server_serves_recorded_requests():
+    metrics.recordRequest('simulated', 'fetchBalance', 'ok', 0, 0.01)
+    server = metrics.startMetricsServer(0)
+    try:
+        with urllib.request.urlopen('http://127.0.0.1:%d/metrics' % server.server_address[1]) as response:
+            body = response.read().decode('utf-8')
+    finally:
+        metrics.stopMetricsServer()
+    assert 'eazebot_exchange_requests_total{' in body
+    assert 'method="fetchBalance"' in body
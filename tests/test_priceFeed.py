@@ -0,0 +1,97 @@
+import ccxt
+import pytest
+
+from eazebot.priceFeed import pollingFeed, replayFeed
+from eazebot.retryPolicy import circuitBreaker
+
+
+@pytest.fixture
+def handlerWithCoins(makeHandler):
+    # trade set holding 1 ETH bought at 0.05 with a sell level at 0.06 and a stop-loss at 0.045
+    ct = makeHandler()
+    iTs = ct.newTradeSet('ETH/BTC', [], [], [0.06], [1.], sl=0.045, initCoins=1., initPrice=0.05, force=True)
+    return ct, iTs
+
+
+def test_replayed_drop_below_stop_loss_sells_trade_set(handlerWithCoins):
+    ct, iTs = handlerWithCoins
+    ethBefore = ct.exchange.fetchBalance()['ETH']['total']
+    feed = replayFeed([('ETH/BTC', 0.05), ('ETH/BTC', 0.047), ('ETH/BTC', 0.044), ('ETH/BTC', 0.043)])
+    ct.attachPriceFeed(feed)
+    assert feed.symbols() == {'ETH/BTC'}
+    assert feed.run() == 4
+    assert iTs not in ct.tradeSets
+    assert ct.exchange.fetchBalance()['ETH']['total'] == pytest.approx(ethBefore - 1.)
+    assert len(ct.exchange.fetchOpenOrders('ETH/BTC')) == 0
+
+
+def test_replayed_prices_above_stop_loss_keep_trade_set(handlerWithCoins):
+    ct, iTs = handlerWithCoins
+    feed = replayFeed([('ETH/BTC', 0.05), ('ETH/BTC', 0.046), ('ETH/BTC', 0.0451)])
+    ct.attachPriceFeed(feed)
+    feed.run()
+    assert iTs in ct.tradeSets
+    assert ct.tradeSets[iTs]['SL'] == 0.045
+
+
+def test_trailing_stop_loss_follows_replayed_rise_and_triggers_on_drop(handlerWithCoins):
+    ct, iTs = handlerWithCoins
+    ct.setTrailingSL(iTs, 0.1, 'rel')
+    assert ct.tradeSets[iTs]['SL'] == pytest.approx(0.045)
+    feed = replayFeed([('ETH/BTC', 0.052), ('ETH/BTC', 0.055), ('ETH/BTC', 0.053)])
+    ct.attachPriceFeed(feed)
+    feed.run()
+    assert ct.tradeSets[iTs]['SL'] == pytest.approx(0.0495)  # moved up with 0.055, not down with 0.053
+    feed.prices.append(('ETH/BTC', 0.049))
+    feed.run()
+    assert iTs not in ct.tradeSets
+
+
+def test_inactive_trade_set_is_not_sold(handlerWithCoins):
+    ct, iTs = handlerWithCoins
+    ct.deactivateTradeSet(iTs)
+    feed = replayFeed([('ETH/BTC', 0.04)])
+    ct.attachPriceFeed(feed)
+    feed.run()
+    assert iTs in ct.tradeSets
+
+
+def test_replayed_prices_update_volatility_of_poll_scheduler(makeHandler):
+    ct = makeHandler()
+    ct.newTradeSet('ETH/BTC', [], [], [0.06], [1.], sl=0.01, initCoins=1., initPrice=0.05, force=True)
+    feed = replayFeed([])
+    ct.attachPriceFeed(feed)
+    for second, price in enumerate([0.05, 0.051, 0.049, 0.052, 0.048]):
+        feed.publish('ETH/BTC', price, timestamp=1000. + second)
+    assert ct.scheduler.volatility('ETH/BTC') > 10 * ct.scheduler.defaultVolatility
+
+
+class brokenHub:
+    # market data hub whose tickers request fails with the given error
+    def __init__(self, exchange, error):
+        self.exchange = exchange
+        self.error = error
+
+    def getTickers(self, symbols, safeRun=None, maxAge=None):
+        raise self.error
+
+
+@pytest.mark.parametrize('error,failures', [(ccxt.RequestTimeout('timeout'), 1), (KeyError('last'), 0),
+                                           (ccxt.BadSymbol('unknown symbol'), 0)])
+def test_only_network_errors_of_the_feed_count_as_exchange_failures(makeHandler, error, failures):
+    ct = makeHandler()
+    breaker = circuitBreaker('feedTest')
+    feed = pollingFeed(brokenHub(ct.exchange, error), breaker)
+    feed.symbols = lambda: {'ETH/BTC'}
+    feed.poll()
+    assert breaker.failures == failures
+
+
+def test_feed_request_as_probe_ends_the_probe(makeHandler):
+    ct = makeHandler()
+    breaker = circuitBreaker('feedProbe')
+    breaker.state, breaker.openUntil = 'open', 0  # cooldown has passed
+    feed = pollingFeed(brokenHub(ct.exchange, KeyError('last')), breaker)
+    feed.symbols = lambda: {'ETH/BTC'}
+    feed.poll()
+    assert breaker.check()  # the next request is the probe again
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from eazebot.requestScheduler import getRequestScheduler, requestScheduler
+
+
+def recordPriorities(ct, monkeypatch):
+    scheduler = getRequestScheduler(ct.exchange)
+    priorities = []
+    run = scheduler.run
+
+    def recordingRun(func, priority='status', private=True):
+        priorities.append(priority)
+        return run(func, priority, private)
+    monkeypatch.setattr(scheduler, 'run', recordingRun)
+    return priorities
+
+
+def test_context_sets_priority_of_requests_without_explicit_one(makeHandler, monkeypatch):
+    ct = makeHandler()
+    priorities = recordPriorities(ct, monkeypatch)
+    ct.safeRun(ct.exchange.fetchBalance)
+    with ct.requestPriority('info'):
+        ct.safeRun(ct.exchange.fetchBalance)
+        ct.safeRun(ct.exchange.fetchBalance, priority='order')
+    with ct.requestPriority('emergency'):
+        ct.safeRun(ct.exchange.fetchBalance, priority='order')
+    assert priorities == ['status', 'info', 'order', 'emergency']
+
+
+def maxRunning(scheduler, requests):
+    # runs the requests (private or not) in parallel threads and returns the maximum number of private and of all
+    # requests that ran at the same time
+    lock = threading.Lock()
+    running = {True: 0, False: 0}
+    maximum = {'private': 0, 'all': 0}
+
+    def request(private):
+        with lock:
+            running[private] += 1
+            maximum['private'] = max(maximum['private'], running[True])
+            maximum['all'] = max(maximum['all'], running[True] + running[False])
+        time.sleep(0.2)
+        with lock:
+            running[private] -= 1
+
+    threads = [threading.Thread(target=scheduler.run, args=(lambda private=private: request(private), 'status', private))
+               for private in requests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return maximum
+
+
+def test_public_requests_of_an_account_run_concurrently_up_to_the_limit():
+    scheduler = requestScheduler('test', 1000.)
+    scheduler.maxConcurrent = 3
+    assert maxRunning(scheduler, [False] * 5)['all'] == 3
+
+
+def test_private_requests_of_an_account_run_one_at_a_time():
+    scheduler = requestScheduler('test', 1000.)
+    maximum = maxRunning(scheduler, [True, True, False, True, False])
+    assert maximum['private'] == 1
+    assert maximum['all'] == 3  # the public requests do not wait for the private ones
+
+
+def test_private_requests_of_exchanges_without_nonce_order_can_run_concurrently():
+    scheduler = requestScheduler('test', 1000.)
+    scheduler.maxConcurrentPrivate = 2
+    assert maxRunning(scheduler, [True] * 4)['private'] == 2
+
+
+def test_handler_requests_are_private_unless_public_method(makeHandler, monkeypatch):
+    ct = makeHandler()
+    scheduler = getRequestScheduler(ct.exchange)
+    private = []
+    run = scheduler.run
+
+    def recordingRun(func, priority='status', isPrivate=True):
+        private.append(isPrivate)
+        return run(func, priority, isPrivate)
+    monkeypatch.setattr(scheduler, 'run', recordingRun)
+    ct.safeRun(ct.exchange.fetchBalance)
+    ct.safeRun(lambda: ct.exchange.fetchTicker('ETH/BTC'))
+    assert private == [True, False]
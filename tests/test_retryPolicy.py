@@ -0,0 +1,90 @@
+import json
+import time
+
+import ccxt
+import pytest
+
+from eazebot.retryPolicy import circuitBreaker, exchangeDownError, retryPolicy
+
+
+def openBreaker(breaker):
+    for _ in range(breaker.failureThreshold):
+        breaker.recordFailure()
+    assert breaker.state == 'open'
+
+
+def endCooldown(breaker):
+    breaker.openUntil = time.time() - 1
+
+
+def test_breaker_lets_one_probe_through_after_cooldown():
+    breaker = circuitBreaker('test')
+    openBreaker(breaker)
+    with pytest.raises(exchangeDownError):
+        breaker.check()
+    endCooldown(breaker)
+    assert breaker.check() is True
+    with pytest.raises(exchangeDownError):  # only one probe at a time
+        breaker.check()
+    breaker.recordSuccess()
+    assert breaker.state == 'closed'
+    assert breaker.check() is False
+
+
+def test_failed_probe_reopens_with_doubled_cooldown():
+    breaker = circuitBreaker('test')
+    openBreaker(breaker)
+    endCooldown(breaker)
+    breaker.check()
+    assert breaker.recordFailure() is True
+    assert breaker.state == 'open'
+    assert breaker.currentCooldown == 2 * circuitBreaker.cooldown
+
+
+def test_ended_probe_without_outcome_lets_next_call_probe():
+    breaker = circuitBreaker('test')
+    openBreaker(breaker)
+    endCooldown(breaker)
+    assert breaker.check() is True
+    breaker.endProbe()
+    assert breaker.check() is True
+
+
+@pytest.fixture
+def probingHandler(makeHandler):
+    # handler whose circuit breaker is open with the cooldown just over, so that the next request is the probe
+    ct = makeHandler()
+    ct.retryPolicy = retryPolicy(baseDelay=0.001, maxDelay=0.001, jitter=0)
+    openBreaker(ct.circuitBreaker)
+    endCooldown(ct.circuitBreaker)
+    return ct
+
+
+def test_probe_failing_with_connection_error_reopens_breaker(probingHandler):
+    ct = probingHandler
+    ct.exchange.injectFault('fetchBalance', ccxt.ExchangeError('Connection reset by peer'), 10)
+    with pytest.raises(ccxt.BaseError):
+        ct.safeRun(ct.exchange.fetchBalance)
+    breaker = ct.circuitBreaker
+    assert breaker.state == 'open' and not breaker.probing
+    ct.exchange.injected.clear()  # the exchange is back
+    endCooldown(breaker)
+    assert ct.safeRun(ct.exchange.fetchBalance)['BTC']['free'] > 0
+    assert breaker.state == 'closed'
+
+
+def test_probe_failing_without_outcome_does_not_block_exchange(probingHandler):
+    ct = probingHandler
+    ct.exchange.injectFault('fetchBalance', json.JSONDecodeError('Unterminated string', '{"a', 2))
+    with pytest.raises(json.JSONDecodeError):
+        ct.safeRun(ct.exchange.fetchBalance, printError=False)
+    assert not ct.circuitBreaker.probing
+    assert ct.safeRun(ct.exchange.fetchBalance)['BTC']['free'] > 0
+    assert ct.circuitBreaker.state == 'closed'
+
+
+def test_retry_of_probe_is_not_rejected_by_its_breaker(probingHandler):
+    ct = probingHandler
+    ct.exchange.injectFault('fetchBalance', ccxt.RequestTimeout('timeout'))
+    assert ct.safeRun(ct.exchange.fetchBalance)['BTC']['free'] > 0
+    assert ct.circuitBreaker.state == 'closed'
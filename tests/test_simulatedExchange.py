@@ -0,0 +1,136 @@
+import pickle
+import threading
+import time
+
+import pytest
+
+from eazebot.simulatedExchange import simulatedExchange
+from eazebot.tradeHandler import tradeHandler
+
+
+def message(text, level='info'):
+    pass
+
+
+def stateLines(fileName):
+    with open(fileName) as fh:
+        return fh.readlines()
+
+
+def test_paper_handler_is_loaded_as_paper_handler_in_real_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tradeHandler, 'paperTrading', True)
+    ct = tradeHandler('binance', messagerFct=message)
+    assert ct.paperTrading and isinstance(ct.exchange, simulatedExchange)
+    monkeypatch.setattr(tradeHandler, 'paperTrading', False)
+    loaded = pickle.loads(pickle.dumps(ct))
+    assert loaded.paperTrading and isinstance(loaded.exchange, simulatedExchange)
+    assert loaded.exchange.name == ct.exchange.name
+
+
+def test_real_handler_is_loaded_as_real_handler_in_paper_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ct = tradeHandler('binance', messagerFct=message)
+    assert not ct.paperTrading
+    monkeypatch.setattr(tradeHandler, 'paperTrading', True)
+    loaded = pickle.loads(pickle.dumps(ct))
+    assert not loaded.paperTrading and not isinstance(loaded.exchange, simulatedExchange)
+
+
+def test_state_file_is_appended_and_replayed(tmp_path):
+    fileName = str(tmp_path / 'paper' / 'sim.json')
+    settings = {'stateFile': fileName, 'volatility': 0., 'prices': {'ETH/BTC': 0.05}}
+    ex = simulatedExchange({'simulation': settings})
+    buy = ex.createOrder('ETH/BTC', 'limit', 'buy', 1, 0.04)
+    sell = ex.createOrder('ETH/BTC', 'limit', 'sell', 1, 0.06)
+    ex.setPrice('ETH/BTC', 0.039)
+    ex.cancelOrder(sell['id'])
+    lines = stateLines(fileName)
+    assert len(lines) == 4  # the whole state once, then one line per change
+
+    loaded = simulatedExchange({'simulation': settings})
+    assert loaded.fetchOrder(buy['id'])['status'] == 'closed'
+    assert loaded.fetchOrder(sell['id'])['status'] == 'canceled'
+    assert len(loaded.fetchMyTrades()) == 1
+    assert loaded.fetchBalance()['ETH'] == ex.fetchBalance()['ETH']
+    assert len(stateLines(fileName)) == 1  # rewritten with the whole state
+    assert int(loaded.createOrder('ETH/BTC', 'limit', 'buy', 1, 0.03)['id']) > int(sell['id'])
+
+
+def test_state_file_is_rewritten_after_many_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(simulatedExchange, 'compactAfter', 3)
+    fileName = str(tmp_path / 'sim.json')
+    ex = simulatedExchange({'simulation': {'stateFile': fileName, 'volatility': 0., 'prices': {'ETH/BTC': 0.05}}})
+    for _ in range(5):
+        ex.createOrder('ETH/BTC', 'limit', 'buy', 0.1, 0.01)
+    assert len(stateLines(fileName)) < 4
+    loaded = simulatedExchange({'simulation': {'stateFile': fileName, 'prices': {'ETH/BTC': 0.05}}})
+    assert len(loaded.fetchOpenOrders('ETH/BTC')) == 5
+
+
+def paperHandler(key):
+    ct = tradeHandler('binance', key=key, secret='secret', messagerFct=message, paperTrading=True)
+    ct.exchange.prices['ETH/BTC'] = 0.05
+    ct.exchange.priceTimes['ETH/BTC'] = time.time() + 3600  # no price requests to the real exchange
+    return ct
+
+
+def test_paper_accounts_of_different_keys_are_kept_apart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tradeHandler, 'updateBalance', lambda self: None)
+    first = paperHandler('key1')
+    second = paperHandler('key2')
+    assert first.exchange.settings['stateFile'] != second.exchange.settings['stateFile']
+    order = first.exchange.createOrder('ETH/BTC', 'limit', 'buy', 1, 0.04)
+    second.exchange.createOrder('ETH/BTC', 'limit', 'buy', 2, 0.03)
+    second.exchange.createOrder('ETH/BTC', 'limit', 'buy', 2, 0.03)
+
+    loaded = paperHandler('key1')
+    assert [o['id'] for o in loaded.exchange.fetchOpenOrders('ETH/BTC')] == [order['id']]
+    assert loaded.exchange.fetchBalance()['BTC']['used'] == pytest.approx(0.04)
+
+
+class countingPriceSource:
+    # real exchange of a paper trading account, which checks that the simulated exchange is not locked meanwhile
+    id = 'counting'
+    name = 'Counting'
+    has = {}
+
+    def __init__(self, exchange=None):
+        self.exchange = exchange
+        self.calls = []
+
+    def unlocked(self):
+        result = []
+
+        def tryLock():
+            result.append(self.exchange.simLock.acquire(blocking=False))
+            if result[0]:
+                self.exchange.simLock.release()
+        thread = threading.Thread(target=tryLock)
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def fetchTicker(self, symbol):
+        self.calls.append(('fetchTicker', self.unlocked()))
+        return {'symbol': symbol, 'last': 1.}
+
+    def fetchTickers(self, symbols):
+        self.calls.append(('fetchTickers', self.unlocked()))
+        return {symbol: {'symbol': symbol, 'last': 1.} for symbol in symbols}
+
+
+def test_paper_tickers_are_fetched_with_one_request_without_holding_the_lock():
+    source = countingPriceSource()
+    ex = simulatedExchange({'priceSource': source})
+    source.exchange = ex
+    symbols = ['C%d/BTC' % i for i in range(300)]
+    assert len(ex.fetchTickers(symbols)) == 300
+    ex.fetchTicker('C1/BTC')  # still fresh
+    assert source.calls == [('fetchTickers', True)]
+    ex.priceTimes['C1/BTC'] = 0
+    order = ex.createOrder('C1/BTC', 'limit', 'buy', 0.1, 0.5)
+    ex.priceTimes['C1/BTC'] = 0
+    ex.fetchOrder(order['id'])
+    assert source.calls[1:] == [('fetchTicker', True), ('fetchTicker', True)]
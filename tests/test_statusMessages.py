@@ -0,0 +1,48 @@
+import pytest
+
+
+class message:
+    def __init__(self, bot, text):
+        self.bot = bot
+        self.text = text
+        self.message_id = next(bot.ids)
+
+    def delete(self):
+        self.bot.deleted.append(self.message_id)
+
+
+class chatBot:
+    # records the messages sent and edited by the bot
+    def __init__(self):
+        self.ids = iter(range(1, 1000))
+        self.sent = []
+        self.edited = []
+        self.deleted = []
+
+    def send_message(self, chatId, text, **kwargs):
+        msg = message(self, text)
+        self.sent.append(msg)
+        return msg
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.edited.append((message_id, text))
+
+
+def test_status_messages_are_edited_after_other_messages_of_the_bot(makeHandler, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the bot module writes its log file to the working directory
+    EazeBot = pytest.importorskip('eazebot.EazeBot', exc_type=ImportError)
+    ct = makeHandler()
+    iTs = ct.newTradeSet('ETH/BTC', [], [], [0.06], [1.], sl=0.045, initCoins=1., initPrice=0.05, force=True)
+    ct.tradeSets[iTs]['virgin'] = False
+    bot = chatBot()
+    user_data = {'chatId': 7, 'trade': {ct.exchange.name: ct}, 'settings': {'showProfitIn': None},
+                 'messages': {'status': [], 'dialog': [], 'botInfo': [], 'settings': []}}
+    EazeBot.printTradeStatus(bot, None, user_data)
+    assert len(bot.sent) == 1
+    statusId = bot.sent[0].message_id
+    bot.send_message(7, 'Stop-loss warning')  # e.g. a broadcast of a trade handler
+    ct.setSL(iTs, 0.04)
+    EazeBot.printTradeStatus(bot, None, user_data)
+    assert len(bot.sent) == 2  # nothing sent again
+    assert [messageId for messageId, text in bot.edited] == [statusId]
+    assert bot.deleted == []
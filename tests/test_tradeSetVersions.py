@@ -0,0 +1,30 @@
+import threading
+
+
+def test_deleted_trade_set_leaves_no_version(makeHandler):
+    ct = makeHandler()
+    iTs = ct.newTradeSet('ETH/BTC', [], [], [0.06], [1.], sl=0.045, initCoins=1., initPrice=0.05, force=True)
+    assert iTs in ct.tsVersions
+    ct.deleteTradeSet(iTs)
+    assert iTs not in ct.tsVersions
+
+
+def test_changes_of_different_trade_sets_at_once_all_bump_the_version(makeHandler):
+    ct = makeHandler()
+    ids = [ct.newTradeSet('ETH/BTC', [], [], [0.06], [1.], sl=0.045, initCoins=1., initPrice=0.05, force=True)
+           for _ in range(4)]
+    version = ct.tsVersion
+    ct.setSL(ids[0], 0.04)
+    bumps = ct.tsVersion - version  # setSL may call other methods which bump the version as well
+    version = ct.tsVersion
+    changes = 200
+
+    def change(iTs):
+        for i in range(changes):
+            ct.setSL(iTs, 0.04 + i * 1e-5)
+    threads = [threading.Thread(target=change, args=(iTs,)) for iTs in ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert ct.tsVersion == version + len(ids) * changes * bumps